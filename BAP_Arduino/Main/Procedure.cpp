@@ -50,6 +50,9 @@ void Procedure::MainProcedure(){
     message = Communicator.Read();
     if (message == "Authorised"){
       ProcStep = 3;
+    } else if (message == "Unauthorised" || message == "Timeout" || message == "Error"){ //refused or no decision: back outside
+      LED_OY.LEDProcedure(LED::turnOff);
+      ProcStep = 1;
     }
     break;
     case 3: //opening door
@@ -0,0 +1,638 @@
+"""
+File: ArduinoSimulator.py
+
+Description:
+Software stand-in for the door controller board running BAP_Arduino/Main/Procedure.cpp.
+The simulator runs the same MainProcedure step machine (ProcStep 0-7), the same CheckStates
+state codes and the same AlarmCheck timing, and speaks the same newline-terminated protocol,
+so Main.py, the SerialLink backend and the GUI can be driven without hardware. Sensor inputs (override
+button, PIR, door reed switch) are set from code, from a timed script or by a built-in visitor
+that walks through the whole door cycle; time can be accelerated or left to run flat out.
+
+Faithful details worth knowing when reading soak results:
+- Incoming bytes land in a 64-byte receive ring as on the ATmega328P; bytes that do not fit are
+  dropped. Lines are only consumed in steps 0 and 2 and while the alarm is active, one per loop.
+- delay() calls (10 ms per Read, 800 ms per alarm blink cycle) advance the simulated clock.
+- elapsed/LastMillis are 16-bit unsigned as on the board.
+- Line rate is not modelled: bytes move as fast as the endpoint allows.
+
+Endpoints:
+- "pty" (Linux/macOS): a pseudo-terminal; pass its path to Main.py --port.
+- "socket": a loopback TCP port; pass socket://127.0.0.1:PORT to Main.py --port (works on Windows).
+- None: in-process; use host_send() and the sent list.
+
+Usage:
+    python ArduinoSimulator.py --endpoint pty --scenario cycle --speed 10
+    python ArduinoSimulator.py --endpoint socket --tcp-port 7000 --script visit.txt
+    python ArduinoSimulator.py --soak 10
+
+Script format (one event per line, simulated seconds since start):
+    1.0 button 1
+    1.1 button 0
+    4.0 door_open 1
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+LOW = False
+HIGH = True
+
+
+@dataclass
+class SensorInputs:
+    """Raw sensor levels; door_open is the inverse of the reed switch (MagneticSensor HIGH = closed)."""
+    button: bool = False
+    motion: bool = False
+    door_open: bool = False
+
+
+class VirtualClock:
+    """
+    Simulated millis() that only advances when the simulator says so.
+
+    With speed > 0 the simulator paces itself so simulated time runs speed times faster than
+    real time; with speed 0 it runs as fast as the host lets it.
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.ms = 0
+        self._real_start = time.monotonic()
+
+    def millis(self) -> int:
+        return self.ms
+
+    def advance(self, ms: int):
+        self.ms += ms
+
+    def pace(self):
+        """Sleep until real time catches up with simulated time (yield only when unthrottled)."""
+        if self.speed <= 0:
+            time.sleep(0)
+            return
+        delay = self._real_start + self.ms / 1000.0 / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DoorCycle:
+    """
+    Visitor that walks through the full door sequence, reacting to ProcStep.
+
+    Each action waits dwell_ms of simulated time after the step is entered. Step 2 waits for the
+    host's answer; a refusal sends the sketch back to step 1, where the button is pressed again.
+    """
+
+    def __init__(self, dwell_ms: int = 50):
+        self.dwell_ms = dwell_ms
+        self._step = None
+        self._entered_at = 0
+
+    def __call__(self, sim: "ArduinoSimulator"):
+        now = sim.clock.millis()
+        if sim.proc_step != self._step:
+            self._step = sim.proc_step
+            self._entered_at = now
+        if now - self._entered_at < self.dwell_ms:
+            return
+
+        inputs = sim.inputs
+        step = sim.proc_step
+        if step in (1, 5):
+            # SingleState fires on release, so press for one dwell and then let go
+            inputs.button = not inputs.button
+            self._entered_at = now
+        elif step in (3, 6):
+            inputs.door_open = True
+        elif step == 4:
+            inputs.motion = True
+            inputs.door_open = False
+        elif step == 7:
+            inputs.door_open = False
+            inputs.motion = False
+
+
+class DoorScript:
+    """Timed sensor events: (simulated ms, sensor name, level), applied in order."""
+
+    def __init__(self, events: List[Tuple[int, str, bool]]):
+        for _, name, _ in events:
+            if not hasattr(SensorInputs, name):
+                raise ValueError(f"Unknown sensor {name!r}")
+        self.events = deque(sorted(events, key=lambda event: event[0]))
+
+    @classmethod
+    def from_file(cls, path: str) -> "DoorScript":
+        """Load a script file: "<seconds> <sensor> <0|1>" per line; # starts a comment."""
+        events = []
+        with open(path) as f:
+            for line in f:
+                parts = line.split("#", 1)[0].split()
+                if not parts:
+                    continue
+                if len(parts) != 3:
+                    raise ValueError(f"Bad script line: {line.strip()!r}")
+                events.append((int(float(parts[0]) * 1000), parts[1], parts[2] not in ("0", "false", "off")))
+        return cls(events)
+
+    def __call__(self, sim: "ArduinoSimulator"):
+        while self.events and self.events[0][0] <= sim.clock.millis():
+            _, name, level = self.events.popleft()
+            setattr(sim.inputs, name, level)
+
+    @property
+    def finished(self) -> bool:
+        return not self.events
+
+
+class PtyEndpoint:
+    """Pseudo-terminal endpoint; clients open the slave path like any serial port."""
+
+    def __init__(self):
+        import tty
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        os.set_blocking(self._master, False)
+        self.url = os.ttyname(self._slave)
+
+    def read(self, size: int) -> bytes:
+        try:
+            return os.read(self._master, size)
+        except (BlockingIOError, OSError):
+            return b""
+
+    def write(self, data: bytes) -> int:
+        """Write what the pty accepts; returns the number of bytes dropped."""
+        try:
+            return len(data) - os.write(self._master, data)
+        except (BlockingIOError, OSError):
+            return len(data)
+
+    def close(self):
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class SocketEndpoint:
+    """Loopback TCP endpoint for pyserial's socket:// URLs; serves one client at a time."""
+
+    def __init__(self, port: int = 0, host: str = "127.0.0.1"):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(1)
+        self._server.setblocking(False)
+        self._client: Optional[socket.socket] = None
+        self.url = f"socket://{host}:{self._server.getsockname()[1]}"
+
+    def read(self, size: int) -> bytes:
+        if not self._accept():
+            return b""
+        try:
+            data = self._client.recv(size)
+        except BlockingIOError:
+            return b""
+        except OSError:
+            data = b""
+        if not data:
+            self._drop_client()
+        return data
+
+    def write(self, data: bytes) -> int:
+        """Send what the socket accepts; nothing is queued for absent or slow clients."""
+        if not self._accept():
+            return len(data)
+        try:
+            return len(data) - self._client.send(data)
+        except BlockingIOError:
+            return len(data)
+        except OSError:
+            self._drop_client()
+            return len(data)
+
+    def close(self):
+        self._drop_client()
+        self._server.close()
+
+    def _accept(self) -> bool:
+        if self._client is None:
+            try:
+                self._client, _ = self._server.accept()
+                self._client.setblocking(False)
+                self._client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except BlockingIOError:
+                return False
+        return True
+
+    def _drop_client(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+class ArduinoSimulator:
+    """
+    Port of Procedure (Procedure.cpp) running against simulated sensors and a serial endpoint.
+
+    Public Interface:
+    - tick(): Runs one MainProcedure pass (one Arduino loop())
+    - start() / stop(): Runs the loop on a thread; run(duration) runs it on the caller's thread
+    - close(): Stops the loop and closes the endpoint
+    - inputs: SensorInputs the scenario or test sets
+    - host_send(message): Delivers a line from the host (in-process endpoint only)
+    - sent: Lines written to the host (in-process endpoint only)
+    - stats(): Transition, message and backlog counters
+    """
+
+    RX_BUFFER_SIZE = 64
+    LOOP_TIME_MS = 1
+    READ_DELAY_MS = 10
+    BLINK_DELAY_MS = 100
+    MOTION_ALARM_MS = 20000
+    LEDS = ("OR", "OY", "OG", "IR", "IY", "IG")
+
+    def __init__(self, endpoint=None, speed: float = 1.0,
+                 scenario: Callable[["ArduinoSimulator"], None] = None, start_step: int = 1):
+        """
+        Initialise the board as after Procedure::init().
+
+        Args:
+            endpoint: PtyEndpoint, SocketEndpoint or None for in-process use
+            speed: Simulated seconds per real second (0: as fast as possible)
+            scenario: Called before every loop to drive sensor inputs
+            start_step: ProcStep after init (the firmware starts at 1, skipping SystemStart)
+        """
+        self.endpoint = endpoint
+        self.clock = VirtualClock(speed)
+        self.scenario = scenario
+        self.inputs = SensorInputs()
+
+        # Procedure attributes
+        self.proc_step = start_step
+        self.state_code = list("0000000000")
+        self.old_state_code = list("0000000000")
+        self.intended_door_state = LOW
+        self.intended_motion = LOW
+        self.emergency_state = LOW
+        self.elapsed = 0
+        self.last_millis = 0
+        # Outputs and edge-detector memory of the component classes
+        self.leds: Dict[str, bool] = {name: LOW for name in self.LEDS}
+        self.solenoid = LOW
+        self.buzzer_freq = 0
+        self._button_old = LOW
+        self._pir_old = LOW
+
+        self.sent: Deque[str] = deque(maxlen=10000)
+        self._rx = bytearray()
+        self._host_rx = bytearray()
+        self._auth_requested_at: Optional[float] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.ticks = 0
+        self.state_codes = 0
+        self.cycles = 0
+        self.alarms = 0
+        self.lines_read = 0
+        self.lines_written = 0
+        self.rx_dropped = 0
+        self.tx_dropped = 0
+        self.auth_waits: List[float] = []
+
+    # ========== PUBLIC METHODS ==========
+
+    def tick(self):
+        """One loop(): Session.MainProcedure()."""
+        if self.scenario is not None:
+            self.scenario(self)
+        self._main_procedure()
+        self.clock.advance(self.LOOP_TIME_MS)
+        self.ticks += 1
+
+    def run(self, duration: float = None, max_cycles: int = None):
+        """
+        Run the loop on this thread until stop(), or for duration simulated seconds / max_cycles cycles.
+        """
+        end_ms = None if duration is None else self.clock.millis() + int(duration * 1000)
+        while not self._stop_event.is_set():
+            if end_ms is not None and self.clock.millis() >= end_ms:
+                break
+            if max_cycles is not None and self.cycles >= max_cycles:
+                break
+            self.tick()
+            self.clock.pace()
+
+    def start(self):
+        """Run the loop on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, name="ArduinoSimulator", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the loop (also breaks out of an active alarm); the endpoint stays open."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """Stop the loop and close the endpoint."""
+        self.stop()
+        if self.endpoint is not None:
+            self.endpoint.close()
+
+    def host_send(self, message: str):
+        """Deliver a line from the host to the board (in-process endpoint only)."""
+        self._host_rx.extend((message + "\n").encode())
+
+    def stats(self) -> dict:
+        waits = sorted(self.auth_waits)
+        return {
+            "simulated_seconds": self.clock.millis() / 1000.0,
+            "ticks": self.ticks, "proc_step": self.proc_step, "state_codes": self.state_codes,
+            "cycles": self.cycles, "alarms": self.alarms,
+            "lines_read": self.lines_read, "lines_written": self.lines_written,
+            "rx_dropped_bytes": self.rx_dropped, "tx_dropped_bytes": self.tx_dropped,
+            "rx_backlog_bytes": len(self._rx),
+            "auth_wait_ms": {"count": len(waits),
+                             "p50": waits[len(waits) // 2] * 1000 if waits else None,
+                             "max": waits[-1] * 1000 if waits else None},
+        }
+
+    # ========== PRIVATE METHODS ==========
+
+    def _main_procedure(self):
+        """Procedure::MainProcedure()."""
+        step = self.proc_step
+        if step == 0:
+            if self._read() == "SystemStart":
+                self.proc_step = 1
+        elif step == 1:  # pressing button outside door
+            self.state_code[0] = "0"
+            self.intended_door_state = HIGH
+            self.intended_motion = LOW
+            self.leds["OR"] = HIGH
+            self.leds["IR"] = HIGH
+            self.solenoid = HIGH
+            if self._button_single_state():
+                self.leds["OR"] = LOW
+                self.leds["OY"] = HIGH
+                self._check_states()
+                self._write("FacialRecognition")
+                self._auth_requested_at = time.monotonic()
+                self.proc_step = 2
+        elif step == 2:  # waiting at door
+            message = self._read()
+            if message in ("Authorised", "Unauthorised", "Timeout", "Error"):
+                if self._auth_requested_at is not None:
+                    self.auth_waits.append(time.monotonic() - self._auth_requested_at)
+                    self._auth_requested_at = None
+                if message == "Authorised":
+                    self.proc_step = 3
+                else:  # refused or no decision: back to the button outside
+                    self.leds["OY"] = LOW
+                    self.proc_step = 1
+        elif step == 3:  # opening door
+            self.intended_door_state = LOW
+            self.intended_motion = HIGH
+            self.solenoid = LOW
+            self.leds["OY"] = LOW
+            self.leds["OG"] = HIGH
+            if self._door_sensor() == LOW:
+                self.leds["IR"] = LOW
+                self.leds["IY"] = HIGH
+                self.proc_step = 4
+        elif step == 4:  # entering room and closing door
+            if self.inputs.motion and self._door_sensor() == HIGH:
+                self.solenoid = HIGH
+                self.intended_door_state = HIGH
+                self.leds["OG"] = LOW
+                self.leds["OR"] = HIGH
+                self.proc_step = 5
+        elif step == 5:  # phase 2 switch to the inner door
+            if self._button_single_state():
+                self.state_code[0] = "1"
+                self.buzzer_freq = 200  # PhaseSwitch tone
+                self.solenoid = LOW
+                self.proc_step = 6
+        elif step == 6:  # opening inner door
+            self.intended_door_state = LOW
+            self.leds["IY"] = LOW
+            self.leds["IG"] = HIGH
+            if self._door_sensor() == LOW:
+                self.proc_step = 7
+        elif step == 7:  # leaving room & closing inner door
+            if self._door_sensor() == HIGH and not self.inputs.motion:
+                self.leds["IG"] = LOW
+                self.leds["IR"] = HIGH
+                self.solenoid = HIGH
+                self.proc_step = 1
+                self.cycles += 1
+        self._check_states()
+        self._alarm_check()
+
+    def _check_states(self):
+        """Procedure::CheckStates(): print the 10-character state code when it changed."""
+        code = self.state_code
+        for index, name in enumerate(self.LEDS, start=1):
+            code[index] = "1" if self.leds[name] else "0"
+        code[7] = "1" if self.inputs.motion else "0"
+        code[8] = "1" if self.solenoid else "0"
+        code[9] = "1" if self._door_sensor() else "0"
+        if code != self.old_state_code:
+            self.old_state_code = list(code)
+            self._write("".join(code))
+            self.state_codes += 1
+
+    def _alarm_check(self):
+        """Procedure::AlarmCheck(); blocks in the alarm loop until "Abort" arrives, as the board does."""
+        if self.intended_door_state == HIGH and self._door_sensor() == LOW and self.emergency_state == LOW:
+            self._raise_alarm()
+        if self._pir_rising():
+            self.last_millis = self.clock.millis() & 0xFFFF
+        if self.intended_motion == LOW and self.inputs.motion and self.emergency_state == LOW:
+            self.elapsed = (self.clock.millis() - self.last_millis) & 0xFFFF
+            if self.elapsed >= self.MOTION_ALARM_MS:
+                self._raise_alarm()
+        while self.emergency_state == HIGH and not self._stop_event.is_set():
+            self._alarm_activate()
+            if self._read() == "Abort":
+                for name in ("OR", "IR", "OY", "IY"):
+                    self.leds[name] = LOW
+                self.buzzer_freq = 0
+                self.last_millis = self.clock.millis() & 0xFFFF
+                self.emergency_state = LOW
+            self.clock.pace()
+
+    def _raise_alarm(self):
+        self.emergency_state = HIGH
+        self.alarms += 1
+        self._write("AlarmActive")
+
+    def _alarm_activate(self):
+        """Procedure::AlarmActivate(): blink four LEDs in turn (on 100 ms, off 100 ms) and sound the buzzer."""
+        for name in ("OR", "IR", "OY", "IY"):
+            self.leds[name] = HIGH
+            self.clock.advance(self.BLINK_DELAY_MS)
+            self.leds[name] = LOW
+            self.clock.advance(self.BLINK_DELAY_MS)
+        self.buzzer_freq = 700
+
+    def _button_single_state(self) -> bool:
+        """Button::SingleState(): HIGH once when the button is released."""
+        new_state = self.inputs.button
+        released = new_state == LOW and self._button_old == HIGH
+        self._button_old = new_state
+        return released
+
+    def _pir_rising(self) -> bool:
+        """PIR::checkRising()."""
+        state = self.inputs.motion
+        rising = state == HIGH and self._pir_old == LOW
+        self._pir_old = state
+        return rising
+
+    def _door_sensor(self) -> bool:
+        """MagneticSensor::checkState(): HIGH while the door is closed."""
+        return not self.inputs.door_open
+
+    def _read(self) -> str:
+        """SerialComm::Read(): one trimmed line if any byte is waiting, else an empty string."""
+        self._receive()
+        if not self._rx:
+            return ""
+        self.clock.advance(self.READ_DELAY_MS)
+        self._receive()
+        end = self._rx.find(b"\n")
+        end = len(self._rx) if end < 0 else end
+        line = bytes(self._rx[:end]).decode("utf-8", errors="replace").strip()
+        del self._rx[:end + 1]
+        self.lines_read += 1
+        return line
+
+    def _receive(self):
+        """Move waiting bytes into the 64-byte receive ring, dropping what does not fit."""
+        space = self.RX_BUFFER_SIZE - len(self._rx)
+        if self.endpoint is None:
+            data = bytes(self._host_rx)
+            self._host_rx.clear()
+        else:
+            data = self.endpoint.read(4096)
+        self._rx.extend(data[:max(0, space)])
+        self.rx_dropped += max(0, len(data) - max(0, space))
+
+    def _write(self, message: str):
+        """Serial.println()."""
+        self.lines_written += 1
+        if self.endpoint is None:
+            self.sent.append(message)
+        else:
+            self.tx_dropped += self.endpoint.write((message + "\r\n").encode())
+
+
+def soak(duration: float, dwell_ms: int = 1) -> dict:
+    """
+    Drive the simulator flat out through door cycles against an AsyncSerial.SerialLink host.
+
+    The host answers "Authorised" to every request and "Abort" to every alarm and counts the
+    state codes it receives, so the report shows how many transitions per second the link
+    sustains and how far the host falls behind the board.
+    """
+    from AsyncSerial import SerialLink
+    from Main import is_StateCode
+
+    sim = ArduinoSimulator(SocketEndpoint(), speed=0, scenario=DoorCycle(dwell_ms))
+    link = SerialLink(sim.endpoint.url, reconnect_delay=0.05)
+    received = {"state_codes": 0, "requests": 0, "alarms": 0}
+
+    def on_state(line):
+        received["state_codes"] += 1
+
+    async def on_request(line):
+        received["requests"] += 1
+        await link.send("Authorised")
+
+    async def on_alarm(line):
+        received["alarms"] += 1
+        await link.send("Abort")
+
+    async def drive():
+        link.on("FacialRecognition", on_request)
+        link.on("AlarmActive", on_alarm)
+        link.on_match(is_StateCode, on_state)
+        runner = asyncio.ensure_future(link.run())
+        await link.wait_connected(5)
+        sim.start()
+        started = time.monotonic()
+        await asyncio.sleep(duration)
+        sim.stop()
+        elapsed = time.monotonic() - started
+        await asyncio.sleep(0.2)  # let the host drain what is already in flight
+        link.close()
+        await asyncio.wait_for(runner, 5)
+        sim.close()
+        return elapsed
+
+    elapsed = asyncio.run(drive())
+    board = sim.stats()
+    return {
+        "real_seconds": elapsed,
+        "board": board,
+        "host": received,
+        "state_codes_per_second": received["state_codes"] / elapsed,
+        "cycles_per_second": board["cycles"] / elapsed,
+        "host_backlog_state_codes": board["state_codes"] - received["state_codes"],
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Simulate the door controller board over a serial endpoint.")
+    parser.add_argument("--endpoint", choices=("pty", "socket"), default="pty" if os.name == "posix" else "socket")
+    parser.add_argument("--tcp-port", type=int, default=0, help="port for --endpoint socket (default: any free port)")
+    parser.add_argument("--speed", type=float, default=1.0, help="simulated seconds per real second (0: flat out)")
+    parser.add_argument("--scenario", choices=("idle", "cycle"), default="idle",
+                        help="idle: sensors only change via --script; cycle: a visitor walks through the doors")
+    parser.add_argument("--script", help="timed sensor events file")
+    parser.add_argument("--dwell", type=int, default=500, help="simulated ms between visitor actions")
+    parser.add_argument("--wait-start", action="store_true", help="start in step 0 and wait for SystemStart")
+    parser.add_argument("--duration", type=float, help="stop after this many simulated seconds")
+    parser.add_argument("--soak", type=float, metavar="SECONDS", help="run an in-process soak test and print JSON")
+    args = parser.parse_args(argv)
+
+    if args.soak:
+        print(json.dumps(soak(args.soak), indent=2))
+        return 0
+
+    endpoint = PtyEndpoint() if args.endpoint == "pty" else SocketEndpoint(args.tcp_port)
+    scenario = DoorScript.from_file(args.script) if args.script else None
+    if args.scenario == "cycle":
+        scenario = DoorCycle(args.dwell)
+    sim = ArduinoSimulator(endpoint, speed=args.speed, scenario=scenario, start_step=0 if args.wait_start else 1)
+    print(f"Simulated board on {endpoint.url} (run: python Main.py --port {endpoint.url})", file=sys.stderr)
+    try:
+        sim.run(args.duration)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sim.close()
+    print(json.dumps(sim.stats(), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,363 @@
+"""
+File: AsyncSerial.py
+
+Description:
+asyncio serial link to the door controller.
+The Arduino speaks a newline-terminated text protocol ("SystemStart", "FacialRecognition",
+"Authorised", "AlarmActive", "Abort" and 10-character state codes). This module frames that
+byte stream into lines and dispatches each line to handlers registered by message type, so the
+backend never sits in a blocking readline() and can watch timeouts and do other work.
+
+Key Features:
+- Line framing that tolerates partial reads, CRLF and undecodable bytes.
+- Handler registration by exact message or predicate (e.g. state codes), plus a fallback.
+- Bounded write queue: send() waits when it is full (backpressure).
+- Configurable port and baud rate; any pyserial URL works (e.g. "loop://" or a pty path).
+- Automatic reconnect with exponential backoff when the board is unplugged.
+- Read/write/dispatch latency and write queue depth are recorded in Metrics.metrics.
+"""
+import asyncio
+import inspect
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+import serial
+
+from Metrics import metrics
+
+DEFAULT_PORT = "COM4"
+DEFAULT_BAUDRATE = 9600
+
+Handler = Callable[[str], Union[None, Awaitable[None]]]
+
+
+class LineProtocol:
+    """
+    Incremental newline framing for a serial byte stream.
+
+    Usage:
+        protocol = LineProtocol()
+        for line in protocol.feed(data):
+            ...
+    """
+
+    MAX_LINE_LENGTH = 1024
+
+    def __init__(self, encoding: str = "utf-8"):
+        self.encoding = encoding
+        self._buffer = bytearray()
+        self.overflows = 0
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        Add received bytes and return every complete, stripped, non-empty line.
+
+        Args:
+            data: Bytes read from the port
+
+        Returns:
+            List of decoded lines
+        """
+        self._buffer.extend(data)
+        lines = []
+        while True:
+            end = self._buffer.find(b"\n")
+            if end < 0:
+                break
+            raw = bytes(self._buffer[:end])
+            del self._buffer[:end + 1]
+            line = raw.decode(self.encoding, errors="replace").strip()
+            if line:
+                lines.append(line)
+
+        if len(self._buffer) > self.MAX_LINE_LENGTH:
+            # Line noise without a terminator: drop it rather than grow forever
+            self._buffer.clear()
+            self.overflows += 1
+        return lines
+
+    @staticmethod
+    def encode(message: str, encoding: str = "utf-8") -> bytes:
+        """Frame an outgoing message."""
+        return (message + "\n").encode(encoding)
+
+    def reset(self):
+        """Discard any partial line (e.g. after a reconnect)."""
+        self._buffer.clear()
+
+
+class SerialLink:
+    """
+    Reconnecting asyncio serial link with a dispatch table and bounded write queue.
+
+    Public Interface:
+    - on(message, handler): Registers a handler for an exact message
+    - on_match(predicate, handler): Registers a handler for messages matching a predicate
+    - on_default(handler): Registers a handler for unmatched messages
+    - run(): Connects and serves until close(); reconnects when the port drops
+    - send(message) / send_nowait(message) / send_threadsafe(message): Queues a message
+    - wait_connected(timeout): Waits until the port is open
+    - close(): Stops the link
+
+    Usage:
+        link = SerialLink("COM4", 9600)
+        link.on("AlarmActive", handle_alarm)
+        link.on_match(is_StateCode, handle_state)
+        await link.run()
+    """
+
+    READ_TIMEOUT = 0.1
+    READ_SIZE = 256
+    WRITE_QUEUE_SIZE = 64
+    RECONNECT_DELAY = 0.5
+    MAX_RECONNECT_DELAY = 10.0
+
+    def __init__(self, port: str = DEFAULT_PORT, baudrate: int = DEFAULT_BAUDRATE,
+                 write_queue_size: int = None, reconnect_delay: float = None, name: str = None):
+        """
+        Initialise the link without opening the port.
+
+        Args:
+            port: Port name or pyserial URL (e.g. "COM4", "/dev/ttyACM0", "loop://")
+            baudrate: Baud rate
+            write_queue_size: Messages that may wait to be written before send() blocks
+            reconnect_delay: Initial delay before reconnecting, doubled up to MAX_RECONNECT_DELAY
+            name: Label for this link's gauges when several links share a process (e.g. a door name)
+        """
+        self.port = port
+        self.baudrate = baudrate
+        self.write_queue_size = write_queue_size or self.WRITE_QUEUE_SIZE
+        self.reconnect_delay = self.RECONNECT_DELAY if reconnect_delay is None else reconnect_delay
+
+        self.protocol = LineProtocol()
+        self.serial: Optional[serial.SerialBase] = None
+        self.connected = False
+        self.reconnects = 0
+        self.messages_read = 0
+        self.messages_written = 0
+
+        self._handlers = {}
+        self._matchers: List[Tuple[Callable[[str], bool], Handler]] = []
+        self._default_handler: Optional[Handler] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._connected_event: Optional[asyncio.Event] = None
+        self._closing = False
+        self._serving = False
+        self._unsent: Optional[str] = None
+        self._tasks = set()
+        self.name = name
+        metrics.gauge_callback("serial.write_queue_depth" if name is None else f"serial.{name}.write_queue_depth",
+                               self.pending_writes)
+
+    # ========== PUBLIC METHODS ==========
+
+    def on(self, message: str, handler: Handler):
+        """Register a handler (sync or async) for an exact message."""
+        self._handlers[message] = handler
+
+    def on_match(self, predicate: Callable[[str], bool], handler: Handler):
+        """Register a handler for any message the predicate accepts (checked in registration order)."""
+        self._matchers.append((predicate, handler))
+
+    def on_default(self, handler: Handler):
+        """Register a handler for messages no other handler accepts."""
+        self._default_handler = handler
+
+    async def run(self):
+        """Serve the link until close(), reconnecting whenever the port fails."""
+        self._bind_loop()
+        self._closing = False
+        self._serving = True
+        delay = self.reconnect_delay
+        try:
+            while not self._closing:
+                try:
+                    await self._open()
+                except (serial.SerialException, OSError) as e:
+                    print(f"Serial port {self.port} unavailable ({e}); retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+                    continue
+
+                delay = self.reconnect_delay
+                reader = asyncio.ensure_future(self._read_loop())
+                writer = asyncio.ensure_future(self._write_loop())
+                done, pending = await asyncio.wait({reader, writer}, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                for task in done:
+                    if not task.cancelled() and task.exception() is not None and not self._closing:
+                        print(f"Serial link error: {task.exception()}")
+                self._disconnect()
+                if not self._closing:
+                    self.reconnects += 1
+                    metrics.inc("serial.reconnects")
+                    print(f"Serial port {self.port} lost; reconnecting")
+        finally:
+            self._serving = False
+            self._disconnect()
+
+    async def send(self, message: str):
+        """Queue a message, waiting while the write queue is full."""
+        self._bind_loop()
+        await self._write_queue.put(message)
+
+    def send_nowait(self, message: str):
+        """
+        Queue a message without waiting.
+
+        Raises:
+            asyncio.QueueFull: If the write queue is full
+        """
+        self._bind_loop()
+        self._write_queue.put_nowait(message)
+
+    def send_threadsafe(self, message: str):
+        """Queue a message from another thread (e.g. a Tk callback)."""
+        if self._loop is None:
+            raise RuntimeError("Serial link is not running")
+        asyncio.run_coroutine_threadsafe(self.send(message), self._loop)
+
+    async def wait_connected(self, timeout: float = None) -> bool:
+        """
+        Wait until the port is open.
+
+        Returns:
+            bool: True if connected before the timeout
+        """
+        self._bind_loop()
+        try:
+            await asyncio.wait_for(self._connected_event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self):
+        """
+        Stop serving and close the port. Safe to call from any thread.
+
+        While run() is active the close is handed to the link's loop and the port is closed by run()
+        once the pending executor read returns, never underneath it.
+        """
+        loop = self._loop
+        if loop is not None and self._serving and not self._on_loop(loop):
+            try:
+                loop.call_soon_threadsafe(self.close)
+                return
+            except RuntimeError:
+                pass  # loop already closed
+        self._closing = True
+        if not self._serving:
+            self._disconnect()
+
+    def pending_writes(self) -> int:
+        """Number of messages waiting to be written."""
+        return self._write_queue.qsize() if self._write_queue is not None else 0
+
+    # ========== PRIVATE METHODS ==========
+
+    def _bind_loop(self):
+        """Create loop-bound primitives on first use inside the running event loop."""
+        if self._write_queue is None:
+            self._loop = asyncio.get_running_loop()
+            self._write_queue = asyncio.Queue(self.write_queue_size)
+            self._connected_event = asyncio.Event()
+
+    @staticmethod
+    def _on_loop(loop: asyncio.AbstractEventLoop) -> bool:
+        """True when called from the given event loop's thread."""
+        try:
+            return asyncio.get_running_loop() is loop
+        except RuntimeError:
+            return False
+
+    async def _open(self):
+        """Open the port in a worker thread (opening can block for a while on some drivers)."""
+        loop = asyncio.get_running_loop()
+        self.serial = await loop.run_in_executor(
+            None, lambda: serial.serial_for_url(self.port, self.baudrate, timeout=self.READ_TIMEOUT,
+                                                write_timeout=self.READ_TIMEOUT * 10))
+        self.protocol.reset()
+        self.connected = True
+        self._connected_event.set()
+        print(f"Serial port {self.port} open at {self.baudrate} baud")
+
+    def _disconnect(self):
+        """Close the port if open."""
+        self.connected = False
+        if self._connected_event is not None:
+            self._connected_event.clear()
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.serial = None
+
+    async def _read_loop(self):
+        """Read bytes in a worker thread and dispatch every complete line."""
+        loop = asyncio.get_running_loop()
+        port = self.serial
+        while not self._closing:
+            start = time.perf_counter()
+            data = await loop.run_in_executor(None, lambda: port.read(max(1, min(port.in_waiting, self.READ_SIZE))))
+            if not data:
+                continue
+            metrics.observe("serial.read", time.perf_counter() - start)
+            for line in self.protocol.feed(data):
+                self.messages_read += 1
+                metrics.inc("serial.messages_read")
+                with metrics.timer("serial.dispatch"):
+                    self._dispatch(line)
+
+    async def _write_loop(self):
+        """Drain the write queue to the port; a message is only dropped from the queue once written."""
+        loop = asyncio.get_running_loop()
+        port = self.serial
+        while not self._closing:
+            if self._unsent is not None:
+                message, self._unsent = self._unsent, None
+            else:
+                message = await self._write_queue.get()
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, lambda: (port.write(LineProtocol.encode(message)), port.flush()))
+            except (serial.SerialException, OSError):
+                # Keep it so it is the first thing sent after reconnecting
+                self._unsent = message
+                metrics.inc("serial.write_errors")
+                raise
+            metrics.observe("serial.write", time.perf_counter() - start)
+            self.messages_written += 1
+            metrics.inc("serial.messages_written")
+
+    def _dispatch(self, line: str):
+        """Route a line to its handler; async handlers run as tasks so reading never stalls."""
+        handler = self._handlers.get(line)
+        if handler is None:
+            for predicate, candidate in self._matchers:
+                if predicate(line):
+                    handler = candidate
+                    break
+        if handler is None:
+            handler = self._default_handler
+        if handler is None:
+            return
+
+        try:
+            result = handler(line)
+        except Exception as e:
+            print(f"Error handling serial message {line!r}: {e}")
+            return
+        if inspect.isawaitable(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        """Report failures of async handlers."""
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error in serial message handler: {task.exception()}")
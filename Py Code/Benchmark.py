@@ -0,0 +1,432 @@
+"""
+File: Benchmark.py
+
+Description:
+Reproducible benchmark harness for recognition throughput and door-decision latency.
+Instead of a live camera and the Arduino, FaceRecogniser is fed from a recorded video file or a
+directory of images, and the controller is replaced by a scripted serial trace. Results are
+written as JSON so runs from different versions can be compared.
+
+Measured:
+- Frames per second and per-stage latency percentiles (resize/detect/encode/match/total)
+  for every gallery size (real gallery padded with synthetic encodings).
+- Batched matching latency for N faces per frame against each gallery size.
+- Gallery store publish and open (memory-map) time and file size for each gallery size.
+- End-to-end time from a "FacialRecognition" message to the decision reply, replaying the
+  serial trace through Main's real backend handlers over a loopback SerialLink ("loop://"),
+  so line framing, dispatch and the executor hop are included.
+
+Usage:
+    python Benchmark.py --source door.mp4 --gallery-sizes 10 100 1000 10000 --output bench.json
+    python Benchmark.py --source frames/ --trace door_trace.txt --compare baseline.json
+
+Serial trace format (one message per line; a number followed by a message is a delay in
+seconds before it, a number on its own is a message, e.g. a state code):
+    0.5 0100000110
+    0100000110
+    FacialRecognition
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, List, Sequence
+
+import cv2
+import numpy as np
+
+from AsyncSerial import SerialLink
+from DecisionEngine import DecisionEngine
+from FaceGallery import FaceGallery
+from GalleryStore import GalleryStore
+from FacialRecognition import FaceRecogniser, FrameResult
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+STAGES = ("resize", "detect", "encode", "match", "escalate", "total")
+
+
+class ReplaySource:
+    """
+    cv2.VideoCapture-compatible frame source backed by a video file or an image directory.
+
+    Frames are decoded once up front, so decode cost does not pollute recognition timings.
+    """
+
+    def __init__(self, source: str, max_frames: int = None):
+        """
+        Args:
+            source: Video file, image file pattern understood by OpenCV, or directory of images
+            max_frames: Stop loading after this many frames
+        """
+        self.source = source
+        self.frames: List[np.ndarray] = []
+        if os.path.isdir(source):
+            for filename in sorted(os.listdir(source)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    frame = cv2.imread(os.path.join(source, filename))
+                    if frame is not None:
+                        self.frames.append(frame)
+                if max_frames and len(self.frames) >= max_frames:
+                    break
+        else:
+            capture = cv2.VideoCapture(source)
+            while not max_frames or len(self.frames) < max_frames:
+                ret, frame = capture.read()
+                if not ret or frame is None:
+                    break
+                self.frames.append(frame)
+            capture.release()
+        if not self.frames:
+            raise RuntimeError(f"No frames could be read from {source}")
+        self.position = 0
+
+    def isOpened(self) -> bool:
+        return True
+
+    def read(self):
+        """Return the next frame, or (False, None) at the end of the recording."""
+        if self.position >= len(self.frames):
+            return False, None
+        frame = self.frames[self.position]
+        self.position += 1
+        return True, frame
+
+    def grab(self) -> bool:
+        return self.position < len(self.frames)
+
+    def rewind(self):
+        self.position = 0
+
+    def release(self):
+        pass
+
+
+class ScriptedSerial:
+    """
+    Plays the controller's side of a recorded trace. bench_end_to_end sends each message from
+    Read() over a loopback SerialLink served by Main.backend, and hands the reply to Write().
+
+    Attributes:
+        writes: (perf_counter timestamp, message) for every Write()
+    """
+
+    def __init__(self, lines: Sequence[str], time_scale: float = 0.0):
+        """
+        Args:
+            lines: Trace lines ("[delay] message"); a lone number is a message, not a delay
+            time_scale: Multiplier applied to the recorded delays (0: replay as fast as possible)
+        """
+        self.messages = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            delay, _, message = line.partition(" ")
+            message = message.strip()
+            try:
+                if not message:
+                    raise ValueError(line)
+                self.messages.append((float(delay), message))
+            except ValueError:
+                self.messages.append((0.0, line))
+        self.time_scale = time_scale
+        self.position = 0
+        self.writes = []
+
+    @classmethod
+    def from_file(cls, path: str, time_scale: float = 0.0) -> "ScriptedSerial":
+        with open(path) as f:
+            return cls(f.readlines(), time_scale)
+
+    def Read(self) -> str:
+        """
+        Return the next scripted message.
+
+        Raises:
+            EOFError: When the trace is exhausted
+        """
+        if self.position >= len(self.messages):
+            raise EOFError("End of serial trace")
+        delay, message = self.messages[self.position]
+        self.position += 1
+        if delay and self.time_scale:
+            time.sleep(delay * self.time_scale)
+        return message
+
+    def Write(self, command: str):
+        self.writes.append((time.perf_counter(), command))
+
+
+class ReplayRecogniser(FaceRecogniser):
+    """FaceRecogniser reading from a ReplaySource instead of a camera, with no warmup."""
+
+    def __init__(self, source: ReplaySource, **kwargs):
+        self.replay_source = source
+        super().__init__(headless=True, **kwargs)
+
+    def _initialise_camera(self, width: int = 1280, height: int = 720):
+        self.replay_source.rewind()
+        self.video_capture = self.replay_source
+
+    def decide(self, frame_budget: int) -> str:
+        """
+        Display-free equivalent of run_realtime_recognition's decision loop.
+
+        Replay runs faster than a camera, so only the frame budget bounds the session here.
+
+        Returns:
+            The DecisionEngine outcome; the recording running out counts as the deadline
+        """
+        engine = DecisionEngine(deadline=float("inf"), frame_budget=frame_budget,
+                                window_frames=self.decision_engine.window_frames,
+                                authorise_votes=self.decision_engine.authorise_votes,
+                                strong_match_distance=self.decision_engine.strong_match_distance)
+        engine.start()
+        while True:
+            ret, frame = self.video_capture.read()
+            if not ret:
+                return engine.finish("end of recording").outcome
+            decision = engine.add(self.analyse_frame(frame))
+            if decision is not None:
+                return decision.outcome
+
+
+class ReplayService:
+    """RecognitionService stand-in for Main.backend: every request replays the recording once."""
+
+    def __init__(self, recogniser: ReplayRecogniser, frame_budget: int):
+        self.recogniser = recogniser
+        self.frame_budget = frame_budget
+
+    def wait_ready(self):
+        pass
+
+    def recognise(self) -> str:
+        self.recogniser.replay_source.rewind()
+        self.recogniser._reset_tracking()
+        return self.recogniser.decide(self.frame_budget)
+
+    def record_evidence(self, reason: str):
+        pass
+
+
+class HeadlessPanel:
+    """GUI stand-in for Main.backend that only counts state codes."""
+
+    def __init__(self):
+        self.states = 0
+
+    def post_state(self, StateFeedback):
+        self.states += 1
+
+    def schedule(self, callback, *args):
+        pass
+
+    def show_alarm_popup(self, write_callback):
+        pass
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    """Summarise latencies in milliseconds."""
+    if len(samples) == 0:
+        return {}
+    values = np.asarray(samples) * 1000.0
+    return {"mean": float(values.mean()), "p50": float(np.percentile(values, 50)),
+            "p90": float(np.percentile(values, 90)), "p99": float(np.percentile(values, 99)),
+            "max": float(values.max()), "count": int(len(values))}
+
+
+def pad_gallery(recogniser: FaceRecogniser, real: FaceGallery, size: int, seed: int = 0):
+    """Replace the recogniser's gallery with the real entries plus synthetic ones up to size."""
+    gallery = FaceGallery(use_ann=real.use_ann)
+    for name, encoding in zip(real.names, real.encodings):
+        gallery.add(name, encoding)
+    rng = np.random.default_rng(seed)
+    # Real encodings have components of roughly +-0.1; keep synthetic ones in the same range
+    for index in range(max(0, size - len(gallery))):
+        gallery.add(f"synthetic_{index}", rng.normal(0.0, 0.09, FaceGallery.ENCODING_SIZE))
+    recogniser.gallery = gallery
+
+
+def bench_frames(recogniser: ReplayRecogniser, repeats: int) -> Dict:
+    """Run every recorded frame through analyse_frame and collect stage timings."""
+    timings = {stage: [] for stage in STAGES}
+    faces = 0
+    frames = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        recogniser._reset_tracking()
+        for frame in recogniser.replay_source.frames:
+            result: FrameResult = recogniser.analyse_frame(frame)
+            frames += 1
+            faces += len(result.locations)
+            for stage in STAGES:
+                if stage in result.timings:
+                    timings[stage].append(result.timings[stage])
+    elapsed = time.perf_counter() - start
+    return {"frames": frames, "faces": faces, "fps": frames / elapsed if elapsed > 0 else 0.0,
+            "stages_ms": {stage: percentiles(samples) for stage, samples in timings.items()}}
+
+
+def bench_matching(gallery: FaceGallery, faces_per_frame: int, iterations: int, seed: int = 1) -> Dict:
+    """Time batched matching of N synthetic faces against the gallery."""
+    rng = np.random.default_rng(seed)
+    queries = rng.normal(0.0, 0.09, (faces_per_frame, FaceGallery.ENCODING_SIZE))
+    gallery.match(queries, k=FaceRecogniser.MATCH_TOP_K)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        gallery.match(queries, k=FaceRecogniser.MATCH_TOP_K)
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def bench_gallery_store(gallery: FaceGallery, directory: str, dtype: str, iterations: int = 20) -> Dict:
+    """Time publishing the gallery as a GalleryStore and opening it the way another process would."""
+    store = GalleryStore(os.path.join(directory, f"bench_{dtype}{GalleryStore.DEFAULT_FILENAME}"), dtype)
+    start = time.perf_counter()
+    store.publish(gallery.names, gallery.encodings)
+    published = time.perf_counter() - start
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        mapped = store.open()
+        samples.append(time.perf_counter() - start)
+    return {"dtype": dtype, "publish_ms": published * 1000.0, "bytes": os.path.getsize(mapped.path),
+            "open_ms": percentiles(samples)}
+
+
+def bench_end_to_end(recogniser: ReplayRecogniser, serial: ScriptedSerial, frame_budget: int) -> Dict:
+    """
+    Replay a serial trace through Main's backend; time each "FacialRecognition" request until
+    its reply comes back over the link.
+
+    The trace is written to a loopback SerialLink, so every message is framed, read and
+    dispatched to Main's handlers exactly as one from the controller, and recognition runs in
+    the executor. Replies are the DecisionEngine outcome for the recording within the frame
+    budget: "Authorised", "Unauthorised", "Timeout" or "Error".
+    """
+    import Main  # imports tkinter; only needed here
+
+    async def replay():
+        loop = asyncio.get_running_loop()
+        link = SerialLink("loop://", name="bench")
+        replies = asyncio.Queue()
+        for outcome in ("Authorised", "Unauthorised", "Timeout", "Error"):
+            link.on(outcome, replies.put_nowait)
+        backend = asyncio.ensure_future(Main.backend(None, HeadlessPanel(), link,
+                                                     ReplayService(recogniser, frame_budget)))
+        try:
+            if not await link.wait_connected(5.0):
+                raise RuntimeError("Loopback serial link did not open")
+            while True:
+                try:
+                    message = await loop.run_in_executor(None, serial.Read)  # Read sleeps for trace delays
+                except EOFError:
+                    break
+                start = time.perf_counter()
+                await link.send(message)
+                if message == "FacialRecognition":
+                    reply = await replies.get()
+                    serial.Write(reply)
+                    samples.append(serial.writes[-1][0] - start)
+                    outcomes[reply] = outcomes.get(reply, 0) + 1
+        finally:
+            link.close()
+            await asyncio.gather(backend, return_exceptions=True)
+
+    samples = []
+    outcomes = {}
+    asyncio.run(replay())
+    return {"requests": len(samples), "outcomes": outcomes, "latency_ms": percentiles(samples)}
+
+
+def compare(current: Dict, baseline: Dict):
+    """Print mean/p90 ratios (current / baseline) for every matching metric."""
+    def flatten(data, prefix=""):
+        if isinstance(data, dict):
+            for key, value in data.items():
+                yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(data, list):
+            for item in data:
+                label = ",".join(f"{key}={item[key]}" for key in ("gallery_size", "faces_per_frame") if key in item)
+                yield from flatten(item, f"{prefix}[{label}].")
+        elif isinstance(data, (int, float)):
+            yield prefix[:-1], data
+
+    base = dict(flatten(baseline.get("results", {})))
+    for key, value in flatten(current.get("results", {})):
+        if key in base and base[key] and (key.endswith(".p90") or key.endswith(".mean") or key.endswith(".fps")):
+            print(f"{key:<70} {base[key]:>10.3f} -> {value:>10.3f}  x{value / base[key]:.2f}")
+
+
+def main(argv: List[str] = None) -> int:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark recognition throughput and door-decision latency.")
+    parser.add_argument("--source", required=True, help="video file or directory of images")
+    parser.add_argument("--authorised-dir", default=os.path.join(script_dir, "images/authorised"))
+    parser.add_argument("--trace", help="scripted serial trace (default: one FacialRecognition request)")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--faces-per-frame", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--max-frames", type=int, default=300, help="frames loaded from the source")
+    parser.add_argument("--repeats", type=int, default=1, help="passes over the recording per gallery size")
+    parser.add_argument("--match-iterations", type=int, default=200)
+    parser.add_argument("--frame-budget", type=int, default=300, help="frames per recognition request")
+    parser.add_argument("--no-motion-gating", action="store_true")
+    parser.add_argument("--ann", action="store_true", help="use the approximate nearest-neighbour index")
+    parser.add_argument("--output", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args(argv)
+
+    source = ReplaySource(args.source, max_frames=args.max_frames)
+    with tempfile.TemporaryDirectory() as log_dir:
+        recogniser = ReplayRecogniser(source, authorised_dir=args.authorised_dir,
+                                      log_file=os.path.join(log_dir, "bench_detections.csv"),
+                                      motion_gating=not args.no_motion_gating, use_ann_index=args.ann)
+        real_gallery = recogniser.gallery
+
+        results = []
+        for size in args.gallery_sizes:
+            pad_gallery(recogniser, real_gallery, size)
+            print(f"Gallery size {size}...", file=sys.stderr)
+            entry = {"gallery_size": size, "frames": bench_frames(recogniser, args.repeats),
+                     "matching": [{"faces_per_frame": faces,
+                                   "latency_ms": bench_matching(recogniser.gallery, faces, args.match_iterations)}
+                                  for faces in args.faces_per_frame],
+                     "gallery_store": [bench_gallery_store(recogniser.gallery, log_dir, dtype)
+                                       for dtype in ("float32", "float16")]}
+            serial = (ScriptedSerial.from_file(args.trace) if args.trace
+                      else ScriptedSerial(["FacialRecognition"]))
+            entry["end_to_end"] = bench_end_to_end(recogniser, serial, args.frame_budget)
+            results.append(entry)
+        recogniser.release_resources()
+
+    report = {
+        "version": 1,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count(), "numpy": np.__version__, "opencv": cv2.__version__},
+        "config": {"source": args.source, "frames_loaded": len(source.frames), "repeats": args.repeats,
+                   "motion_gating": not args.no_motion_gating, "ann": args.ann,
+                   "frame_budget": args.frame_budget},
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+File: DecisionEngine.py
+
+Description:
+Bounded-latency door decision from a stream of per-frame recognition results.
+A single close match in one frame is weak evidence: a person turning their head or a motion
+blurred frame can produce a lucky match, and an unknown visitor would otherwise keep the
+door controller waiting forever. The engine keeps a rolling window of recent frames, votes
+per identity, and ends every session with an explicit outcome within a fixed deadline and
+frame budget.
+
+Outcomes:
+- "Authorised": one identity has AUTHORISE_VOTES matches in the window, or one match closer
+  than STRONG_MATCH_DISTANCE.
+- "Unauthorised": a full window of frames with faces and no authorised match, or faces were
+  seen but the deadline/frame budget ran out.
+- "Timeout": the deadline/frame budget ran out without a face being seen.
+
+Usage:
+    engine = DecisionEngine(deadline=8.0, frame_budget=200)
+    engine.start()
+    for frame in frames:
+        decision = engine.add(recogniser.analyse_frame(frame)) or engine.check()
+        if decision:
+            return decision.outcome
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from Metrics import metrics
+
+AUTHORISED = "Authorised"
+UNAUTHORISED = "Unauthorised"
+TIMEOUT = "Timeout"
+
+
+@dataclass
+class Decision:
+    """The outcome of one recognition session and the evidence behind it."""
+    outcome: str
+    name: Optional[str]
+    reason: str
+    frames: int
+    elapsed: float
+    votes: Dict[str, int] = field(default_factory=dict)
+
+
+class DecisionEngine:
+    """
+    Votes across frames and decides within a deadline; safe to feed and check from different threads.
+
+    Public Interface:
+    - start(): Begins a session
+    - add(result): Adds a frame's result (anything with names and distances); returns a Decision once decided
+    - check(): Returns a Decision once the deadline has passed, even without new frames
+    - finish(reason): Ends the session now with the deadline outcome (e.g. the source ran dry)
+    - decision: The session's Decision, or None while undecided
+    """
+
+    DEADLINE = 10.0
+    FRAME_BUDGET = 300
+    WINDOW_FRAMES = 15
+    AUTHORISE_VOTES = 3
+    STRONG_MATCH_DISTANCE = 0.4
+
+    def __init__(self, deadline: float = None, frame_budget: int = None, window_frames: int = None,
+                 authorise_votes: int = None, strong_match_distance: float = None):
+        """
+        Initialise the engine; start() begins the first session.
+
+        Args:
+            deadline: Seconds from start() to a forced decision (default: DEADLINE)
+            frame_budget: Frames from start() to a forced decision (default: FRAME_BUDGET)
+            window_frames: Frames in the rolling voting window (default: WINDOW_FRAMES)
+            authorise_votes: Matches for one identity in the window that authorise (default: AUTHORISE_VOTES)
+            strong_match_distance: A single match at or below this distance authorises at once
+                                   (default: STRONG_MATCH_DISTANCE; 0 disables)
+        """
+        self.deadline = deadline or self.DEADLINE
+        self.frame_budget = frame_budget or self.FRAME_BUDGET
+        self.window_frames = window_frames or self.WINDOW_FRAMES
+        self.authorise_votes = authorise_votes or self.AUTHORISE_VOTES
+        self.strong_match_distance = (self.STRONG_MATCH_DISTANCE if strong_match_distance is None
+                                      else strong_match_distance)
+
+        self.decision: Optional[Decision] = None
+        self.started_at = time.monotonic()
+        self.frames = 0
+        self.faces_seen = False
+        self._window = deque(maxlen=self.window_frames)  # per frame: (faces present, authorised names)
+        self._lock = threading.Lock()
+
+    # ========== PUBLIC METHODS ==========
+
+    def start(self, now: float = None):
+        """Begin a new session, forgetting all evidence."""
+        with self._lock:
+            self.decision = None
+            self.started_at = time.monotonic() if now is None else now
+            self.frames = 0
+            self.faces_seen = False
+            self._window.clear()
+
+    def add(self, result, now: float = None) -> Optional[Decision]:
+        """
+        Add one frame's recognition result.
+
+        Only faces encoded in this frame vote (result.fresh, when the result has it): a name the
+        tracker carried over from an earlier frame is the same evidence again, not a new match.
+        Frames with faces but none fresh (including results reused from tracking) count against
+        the frame budget but add nothing to the window.
+
+        Args:
+            result: FrameResult-like object with names and distances (and optionally reused, fresh)
+
+        Returns:
+            The Decision if this frame (or the deadline) decided the session, otherwise None
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.decision is not None:
+                return self.decision
+            self.frames += 1
+            if result.names:
+                self.faces_seen = True
+
+            reused = getattr(result, "reused", False)
+            fresh = getattr(result, "fresh", None) or [not reused] * len(result.names)
+            if not reused and (any(fresh) or not result.names):
+                authorised = {}
+                for name, distance, is_fresh in zip(result.names, result.distances, fresh):
+                    if is_fresh and name != UNAUTHORISED:
+                        authorised[name] = min(distance, authorised.get(name, distance))
+                self._window.append((any(fresh), set(authorised)))
+
+                strong = [name for name, distance in authorised.items()
+                          if distance <= self.strong_match_distance]
+                if strong:
+                    return self._decide(AUTHORISED, strong[0], "strong match", now)
+                votes = self._votes()
+                leader = max(votes, key=votes.get, default=None)
+                if leader is not None and votes[leader] >= self.authorise_votes:
+                    return self._decide(AUTHORISED, leader, f"{votes[leader]} of {len(self._window)} frames", now)
+                if (len(self._window) == self.window_frames
+                        and all(faces and not names for faces, names in self._window)):
+                    return self._decide(UNAUTHORISED, None, f"no match in {self.window_frames} frames", now)
+
+            return self._check_limits(now)
+
+    def check(self, now: float = None) -> Optional[Decision]:
+        """
+        Decide if the deadline has passed; call while waiting for frames.
+
+        Returns:
+            The Decision if the session is decided, otherwise None
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.decision is not None:
+                return self.decision
+            return self._check_limits(now)
+
+    def finish(self, reason: str = "stopped", now: float = None) -> Decision:
+        """End the session now with the outcome it would get at the deadline."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self.decision is not None:
+                return self.decision
+            return self._expire(reason, now)
+
+    # ========== PRIVATE METHODS ==========
+
+    def _votes(self) -> Dict[str, int]:
+        votes = {}
+        for _, names in self._window:
+            for name in names:
+                votes[name] = votes.get(name, 0) + 1
+        return votes
+
+    def _check_limits(self, now: float) -> Optional[Decision]:
+        if now - self.started_at >= self.deadline:
+            return self._expire(f"deadline {self.deadline:.1f}s", now)
+        if self.frames >= self.frame_budget:
+            return self._expire(f"frame budget {self.frame_budget}", now)
+        return None
+
+    def _expire(self, reason: str, now: float) -> Decision:
+        return self._decide(UNAUTHORISED if self.faces_seen else TIMEOUT, None, reason, now)
+
+    def _decide(self, outcome: str, name: Optional[str], reason: str, now: float) -> Decision:
+        self.decision = Decision(outcome, name, reason, self.frames, now - self.started_at, self._votes())
+        metrics.inc(f"decision.{outcome.lower()}")
+        metrics.observe("decision.latency", self.decision.elapsed)
+        print(f"Decision: {outcome}" + (f" ({name})" if name else "") +
+              f" after {self.frames} frame(s), {self.decision.elapsed:.2f}s: {reason}")
+        return self.decision
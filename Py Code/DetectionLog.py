@@ -0,0 +1,366 @@
+"""
+File: DetectionLog.py
+
+Description:
+Asynchronous, batched detection log.
+FaceRecogniser used to open face_detections.csv, append one row and close it for every logged
+detection, on the recognition thread. Here log() only puts the event on a queue; a background
+writer flushes batches to the configured backends, so no file I/O ever sits on the frame path.
+
+Backends:
+- CSVBackend: the existing face_detections.csv format, with size- or time-based rotation.
+- SQLiteBackend: optional embedded database indexed by timestamp, name and status, for fast
+  audit queries over months of history (e.g. all unauthorised events in the last 24 h).
+
+Usage:
+    python DetectionLog.py --db face_detections.db --status Unauthorised --hours 24
+"""
+import argparse
+import atexit
+import csv
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+
+@dataclass
+class DetectionEvent:
+    """
+    A single logged detection.
+
+    Attributes:
+        timestamp: Seconds since the epoch
+        name: Name of the detected person or "Unauthorised"
+        status: "Authorised" or "Unauthorised"
+        location: (top, right, bottom, left) coordinates
+    """
+    timestamp: float
+    name: str
+    status: str
+    location: Tuple[int, int, int, int]
+
+    @property
+    def timestamp_str(self) -> str:
+        return datetime.fromtimestamp(self.timestamp).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class CSVBackend:
+    """
+    Append-only CSV log with rotation.
+
+    The file is opened once per batch. When it exceeds max_bytes, or rotate_interval seconds
+    have passed since it was started, it is renamed to <path>.1 (older files shift up to
+    <path>.<backup_count>) and a fresh file with headers is started.
+    """
+
+    HEADER = ['timestamp', 'name', 'status', 'location']
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, rotate_interval: float = None,
+                 backup_count: int = 5):
+        """
+        Args:
+            path: CSV file path
+            max_bytes: Rotate once the file is larger than this (0: never)
+            rotate_interval: Rotate after this many seconds (None: never)
+            backup_count: Number of rotated files to keep
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self._started_at = os.path.getmtime(path) if os.path.exists(path) else time.time()
+        self._ensure_header()
+
+    def write_batch(self, events: List[DetectionEvent]):
+        """Append a batch of events, rotating first if needed."""
+        if self._should_rotate():
+            self.rotate()
+        with open(self.path, mode='a', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerows([event.timestamp_str, event.name, event.status,
+                              ",".join(str(value) for value in event.location)] for event in events)
+
+    def rotate(self):
+        """Shift the current file to <path>.1 and start a new one."""
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0 and os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.1")
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        self._started_at = time.time()
+        self._ensure_header()
+
+    def close(self):
+        pass
+
+    def _should_rotate(self) -> bool:
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._started_at >= self.rotate_interval
+
+    def _ensure_header(self):
+        """Create the log file with headers if it doesn't exist"""
+        if not os.path.exists(self.path):
+            with open(self.path, mode='w', newline='') as f:
+                csv.writer(f).writerow(self.HEADER)
+
+
+class SQLiteBackend:
+    """
+    Embedded SQLite detection store with indexes for audit queries.
+
+    Writes happen on the logger's writer thread; queries open their own read connection, so
+    they never wait on the writer (the database runs in WAL mode).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS detections (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL,
+            top INTEGER, right INTEGER, bottom INTEGER, left INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS detections_ts ON detections (ts);
+        CREATE INDEX IF NOT EXISTS detections_name_ts ON detections (name, ts);
+        CREATE INDEX IF NOT EXISTS detections_status_ts ON detections (status, ts);
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite database file path
+        """
+        self.path = path
+        self._connection = None
+        with closing(sqlite3.connect(self.path)) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(self.SCHEMA)
+
+    def write_batch(self, events: List[DetectionEvent]):
+        """Insert a batch of events in one transaction."""
+        if self._connection is None:
+            # Created lazily so the connection belongs to the writer thread
+            self._connection = sqlite3.connect(self.path)
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO detections (ts, name, status, top, right, bottom, left) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(event.timestamp, event.name, event.status, *event.location) for event in events])
+
+    def query(self, name: str = None, status: str = None, since: float = None, until: float = None,
+              limit: int = None) -> List[DetectionEvent]:
+        """
+        Return matching events, newest first.
+
+        Args:
+            name: Only this person
+            status: Only "Authorised" or "Unauthorised"
+            since: Only events at or after this epoch time
+            until: Only events before this epoch time
+            limit: Maximum number of events
+        """
+        clauses, params = [], []
+        for column, operator, value in (("name", "=", name), ("status", "=", status),
+                                        ("ts", ">=", since), ("ts", "<", until)):
+            if value is not None:
+                clauses.append(f"{column} {operator} ?")
+                params.append(value)
+        sql = "SELECT ts, name, status, top, right, bottom, left FROM detections"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with closing(sqlite3.connect(self.path)) as connection:
+            rows = connection.execute(sql, params).fetchall()
+        return [DetectionEvent(row[0], row[1], row[2], tuple(row[3:7])) for row in rows]
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class DetectionLogger:
+    """
+    Non-blocking detection logger with a background batch writer.
+
+    Public Interface:
+    - log(name, status, location): Queues an event (never blocks)
+    - flush(timeout): Waits until every queued event has been written
+    - query(...): Audit query against the SQLite backend
+    - unauthorised_since(hours): Unauthorised events in the last N hours
+    - close(): Flushes and stops the writer
+
+    Usage:
+        logger = DetectionLogger("face_detections.csv", sqlite_path="face_detections.db")
+        logger.log("alice", "Authorised", (10, 60, 60, 10))
+    """
+
+    BATCH_SIZE = 100
+    FLUSH_INTERVAL = 1.0
+    MAX_QUEUE_SIZE = 10000
+
+    def __init__(self, csv_path: Optional[str] = "face_detections.csv", sqlite_path: str = None,
+                 max_bytes: int = 10 * 1024 * 1024, rotate_interval: float = None,
+                 flush_interval: float = None, batch_size: int = None):
+        """
+        Args:
+            csv_path: CSV log path (None: no CSV log)
+            sqlite_path: SQLite database path (None: no database)
+            max_bytes: CSV size rotation threshold
+            rotate_interval: CSV time rotation interval in seconds
+            flush_interval: Maximum seconds an event waits before being written
+            batch_size: Events written per batch at most
+        """
+        self.flush_interval = flush_interval or self.FLUSH_INTERVAL
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.backends = []
+        self.csv = None
+        self.sqlite = None
+        if csv_path is not None:
+            self.csv = CSVBackend(csv_path, max_bytes=max_bytes, rotate_interval=rotate_interval)
+            self.backends.append(self.csv)
+        if sqlite_path is not None:
+            self.sqlite = SQLiteBackend(sqlite_path)
+            self.backends.append(self.sqlite)
+
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue = queue.Queue(self.MAX_QUEUE_SIZE)
+        self._closed = False
+        self._thread = threading.Thread(target=self._writer_loop, name="DetectionLogger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ========== PUBLIC METHODS ==========
+
+    def log(self, name: str, status: str, location: Tuple[int, int, int, int], timestamp: float = None):
+        """
+        Queue a detection for writing. Never blocks; drops the event if the queue is full.
+
+        Args:
+            name: Name of the detected person or "Unauthorised"
+            status: "Authorised" or "Unauthorised"
+            location: Tuple of (top, right, bottom, left) coordinates
+            timestamp: Epoch time of the detection (default: now)
+        """
+        if self._closed:
+            return
+        event = DetectionEvent(time.time() if timestamp is None else timestamp, name, status,
+                               tuple(int(value) for value in location))
+        try:
+            self._queue.put_nowait(event)
+            self.logged += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until all queued events have been written.
+
+        Returns:
+            bool: True if the queue drained before the timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._thread.is_alive() and self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def query(self, name: str = None, status: str = None, since: float = None, until: float = None,
+              limit: int = None) -> List[DetectionEvent]:
+        """
+        Query logged detections (see SQLiteBackend.query).
+
+        Raises:
+            RuntimeError: If no SQLite backend is configured
+        """
+        if self.sqlite is None:
+            raise RuntimeError("Detection queries need a SQLite backend (sqlite_path)")
+        self.flush(timeout=self.flush_interval * 2)
+        return self.sqlite.query(name=name, status=status, since=since, until=until, limit=limit)
+
+    def unauthorised_since(self, hours: float = 24) -> List[DetectionEvent]:
+        """All unauthorised detections in the last N hours, newest first."""
+        return self.query(status="Unauthorised", since=time.time() - hours * 3600)
+
+    def close(self):
+        """Write everything still queued and stop the writer thread."""
+        if self._closed:
+            return
+        self.flush(timeout=self.flush_interval * 5)
+        self._closed = True
+        self._thread.join(timeout=self.flush_interval * 2)
+
+    # ========== PRIVATE METHODS ==========
+
+    def _writer_loop(self):
+        """Collect events into batches and write them every flush interval or batch size."""
+        try:
+            self._collect_batches()
+        finally:
+            # Backends hold connections owned by this thread
+            for backend in self.backends:
+                backend.close()
+
+    def _collect_batches(self):
+        while not (self._closed and self._queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                if self._closed:
+                    deadline = 0
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[DetectionEvent]):
+        for backend in self.backends:
+            try:
+                backend.write_batch(batch)
+            except Exception as e:
+                print(f"Error writing detection log ({type(backend).__name__}): {e}")
+        self.written += len(batch)
+        self.batches += 1
+        for _ in batch:
+            self._queue.task_done()
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Query the detection database.")
+    parser.add_argument("--db", default="face_detections.db", help="SQLite database path")
+    parser.add_argument("--name", help="only this person")
+    parser.add_argument("--status", choices=["Authorised", "Unauthorised"], help="only this status")
+    parser.add_argument("--hours", type=float, default=24, help="look back this many hours (default: 24)")
+    parser.add_argument("--limit", type=int, default=None, help="maximum number of rows")
+    args = parser.parse_args(argv)
+
+    backend = SQLiteBackend(args.db)
+    for event in backend.query(name=args.name, status=args.status, since=time.time() - args.hours * 3600,
+                               limit=args.limit):
+        print(f"{event.timestamp_str}  {event.status:<12}  {event.name:<20}  {event.location}")
+
+
+if __name__ == "__main__":
+    main()
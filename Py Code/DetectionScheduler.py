@@ -0,0 +1,205 @@
+"""
+File: DetectionScheduler.py
+
+Description:
+Adaptive resolution and detector selection for FaceRecogniser.
+HOG detection cost grows with the number of pixels, while the smallest face it finds reliably
+is fixed in detector-input pixels. Rather than always detecting at a quarter of the camera
+resolution, the scheduler picks the coarsest scale at which the faces it has recently seen
+would still be large enough, capped by what the latency target allows on this machine.
+When a coarse pass finds a face but cannot confidently match it, a finer crop around that face
+(or a stronger detector) is tried next, but only while the frame's latency budget lasts.
+
+Key Features:
+- Per-frame scale from observed face size, quantised to a few levels so it does not flap.
+- Detection cost per pixel learned online (EWMA) for each detector model.
+- Escalation ladder (finer crop, full-resolution crop, CNN detector) gated by predicted cost.
+- Thread-safe: FramePipeline calls it from its detect, encode and match threads at once.
+"""
+import math
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class DetectionLevel:
+    """A scale (relative to the camera frame) and the face_recognition detector model to run."""
+    scale: float
+    model: str = "hog"
+
+
+class DetectionScheduler:
+    """
+    Chooses the detection scale per frame and the escalation steps for unconfirmed faces.
+
+    Public Interface:
+    - choose_scale(frame_shape): Scale for this frame's coarse detection pass
+    - observe_faces(locations): Face boxes (full-frame coordinates) seen in the latest frame
+    - record_detection(pixels, seconds, model): Feeds the per-pixel cost model
+    - escalations(box, frame_scale, elapsed): Levels worth trying for an unconfirmed face
+    - record_escalation(level, pixels, seconds): Feeds the cost model after an escalation
+    """
+
+    SCALE_LEVELS = (0.125, 0.25, 0.375, 0.5, 0.75, 1.0)
+    DEFAULT_SCALE = 0.25
+    # Smallest face height (detector-input pixels) that HOG with one upsample finds reliably
+    TARGET_FACE_SIZE = 60
+    LATENCY_TARGET = 0.15
+    DETECT_SHARE = 0.5
+    EWMA_ALPHA = 0.2
+    FACE_MEMORY = 1.0
+    CROP_PADDING = 0.5
+    # Cost of the CNN detector relative to HOG, used until it has actually been measured
+    MODEL_COST_FACTORS = {"hog": 1.0, "cnn": 20.0}
+    ESCALATION_LEVELS = (DetectionLevel(0.5), DetectionLevel(1.0), DetectionLevel(1.0, "cnn"))
+
+    def __init__(self, latency_target: float = None, default_scale: float = None, adaptive: bool = True,
+                 escalation_levels: Sequence[DetectionLevel] = None):
+        """
+        Initialise the scheduler.
+
+        Args:
+            latency_target: Seconds per frame the recogniser should stay within (default: LATENCY_TARGET)
+            default_scale: Scale used before any face has been seen (default: DEFAULT_SCALE)
+            adaptive: False pins the scale to default_scale and disables escalation
+            escalation_levels: Ordered escalation ladder (default: ESCALATION_LEVELS)
+        """
+        self.latency_target = latency_target or self.LATENCY_TARGET
+        self.default_scale = default_scale or self.DEFAULT_SCALE
+        self.adaptive = adaptive
+        self.escalation_levels = tuple(self.ESCALATION_LEVELS if escalation_levels is None else escalation_levels)
+
+        self.coarse_model = "hog"
+        self.cost_per_pixel: Dict[str, float] = {}
+        self.encode_cost = 0.0
+        self.face_heights: List[int] = []
+        self.faces_seen_at = 0.0
+        self.current_scale = self.default_scale
+        self.escalations_tried = 0
+        self._lock = threading.RLock()
+
+    # ========== PUBLIC METHODS ==========
+
+    def choose_scale(self, frame_shape: Tuple[int, ...]) -> float:
+        """
+        Pick the coarse detection scale for a frame.
+
+        Args:
+            frame_shape: Shape of the full-resolution frame
+
+        Returns:
+            Scale factor in SCALE_LEVELS (or default_scale when not adaptive)
+        """
+        if not self.adaptive:
+            return self.default_scale
+
+        now = time.monotonic()
+        with self._lock:
+            if self.face_heights and now - self.faces_seen_at <= self.FACE_MEMORY:
+                # Coarsest level at which the smallest recent face still reaches TARGET_FACE_SIZE
+                wanted = self.TARGET_FACE_SIZE / max(1, min(self.face_heights))
+                scale = next((level for level in self.SCALE_LEVELS if level >= wanted), self.SCALE_LEVELS[-1])
+            else:
+                scale = self.default_scale
+
+            # Never choose a scale whose predicted detection time exceeds the budget share
+            per_pixel = self.cost_per_pixel.get(self.coarse_model)
+            if per_pixel:
+                budget = self.latency_target * self.DETECT_SHARE
+                affordable = math.sqrt(budget / (per_pixel * frame_shape[0] * frame_shape[1]))
+                fitting = [level for level in self.SCALE_LEVELS if level <= affordable]
+                scale = min(scale, fitting[-1] if fitting else self.SCALE_LEVELS[0])
+
+            self.current_scale = scale
+        return scale
+
+    def observe_faces(self, locations: Sequence[Tuple[int, int, int, int]]):
+        """Remember the heights of the faces in the latest frame (full-frame coordinates)."""
+        if locations:
+            with self._lock:
+                self.face_heights = [bottom - top for (top, right, bottom, left) in locations]
+                self.faces_seen_at = time.monotonic()
+
+    def record_detection(self, pixels: int, seconds: float, model: str = "hog"):
+        """Update the per-pixel detection cost for a model."""
+        if pixels <= 0:
+            return
+        with self._lock:
+            self.cost_per_pixel[model] = self._ewma(self.cost_per_pixel.get(model), seconds / pixels)
+
+    def record_encoding(self, faces: int, seconds: float):
+        """Update the per-face encoding cost."""
+        if faces > 0:
+            with self._lock:
+                self.encode_cost = self._ewma(self.encode_cost or None, seconds / faces)
+
+    def escalations(self, box: Tuple[int, int, int, int], frame_scale: float, elapsed: float) -> List[DetectionLevel]:
+        """
+        Escalation levels to try, in order, for a face with no confident match.
+
+        Only levels finer than the coarse pass (or using a different detector) whose predicted
+        cost fits in the remaining latency budget are returned.
+
+        Args:
+            box: Face box in full-frame coordinates
+            frame_scale: Scale used for the coarse pass
+            elapsed: Seconds already spent on this frame
+        """
+        if not self.adaptive:
+            return []
+        remaining = self.latency_target - elapsed
+        levels = []
+        with self._lock:
+            for level in self.escalation_levels:
+                if level.scale <= frame_scale and level.model == self.coarse_model:
+                    continue
+                cost = self.predict_cost(level, self.crop_pixels(box, level.scale))
+                if cost > remaining:
+                    break
+                remaining -= cost
+                levels.append(level)
+        return levels
+
+    def record_escalation(self, level: DetectionLevel, pixels: int, seconds: float):
+        """Feed an escalation's measured cost back into the model."""
+        with self._lock:
+            self.escalations_tried += 1
+            self.record_detection(pixels, max(0.0, seconds - self.encode_cost), level.model)
+
+    def predict_cost(self, level: DetectionLevel, pixels: int) -> float:
+        """Predicted seconds to detect and encode one face at a level."""
+        with self._lock:
+            per_pixel = self.cost_per_pixel.get(level.model)
+            if per_pixel is None:
+                per_pixel = (self.cost_per_pixel.get(self.coarse_model, 0.0)
+                             * self.MODEL_COST_FACTORS.get(level.model, 1.0))
+            return per_pixel * pixels + self.encode_cost
+
+    def crop_box(self, box: Tuple[int, int, int, int], frame_shape: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+        """Padded crop (top, right, bottom, left) around a face, clipped to the frame."""
+        top, right, bottom, left = box
+        pad_y = int((bottom - top) * self.CROP_PADDING)
+        pad_x = int((right - left) * self.CROP_PADDING)
+        return (max(0, top - pad_y), min(frame_shape[1], right + pad_x),
+                min(frame_shape[0], bottom + pad_y), max(0, left - pad_x))
+
+    def crop_pixels(self, box: Tuple[int, int, int, int], scale: float) -> int:
+        """Approximate detector-input pixels of a padded crop at a scale."""
+        top, right, bottom, left = box
+        padding = 1 + 2 * self.CROP_PADDING
+        return int((bottom - top) * padding * scale * (right - left) * padding * scale)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"scale": self.current_scale, "escalations": self.escalations_tried,
+                    "cost_per_megapixel": {model: cost * 1e6 for model, cost in self.cost_per_pixel.items()},
+                    "encode_cost": self.encode_cost}
+
+    # ========== PRIVATE METHODS ==========
+
+    def _ewma(self, previous, sample: float) -> float:
+        if previous is None or not math.isfinite(previous):
+            return sample
+        return previous + self.EWMA_ALPHA * (sample - previous)
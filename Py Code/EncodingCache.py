@@ -0,0 +1,232 @@
+"""
+File: EncodingCache.py
+
+Description:
+Persistent on-disk cache of face encodings for the authorised image gallery.
+Encoding a gallery image (decode + dlib HOG + 128-d embedding) is by far the most expensive
+part of starting a FaceRecogniser. This cache stores every encoding in a single compact
+binary file (.npz, float32) keyed by the image's relative path, and validates each entry
+against the file's size/mtime and, if those changed, its content hash.
+
+Key Features:
+- Single file read on a warm start: no image is decoded when nothing changed.
+- Only stale (new or modified) images are re-encoded.
+- Entries for deleted images are dropped on the next check.
+- Images without a detectable face are remembered, so they are not re-encoded every start.
+- Atomic save (write to temp file, then rename) so a crash never leaves a half-written cache.
+"""
+import hashlib
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class EncodingCache:
+    """
+    Content-validated cache mapping gallery image paths to face encodings.
+
+    Usage:
+        cache = EncodingCache("images/authorised/.encoding_cache.npz")
+        for filename in cache.stale_paths("images/authorised", filenames):
+            cache.put("images/authorised", filename, encode(filename))
+        cache.prune(filenames)
+        cache.save()
+    """
+
+    CACHE_VERSION = 1
+    DEFAULT_FILENAME = ".encoding_cache.npz"
+    ENCODING_SIZE = 128
+    HASH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, cache_path: Optional[str]):
+        """
+        Initialise the cache and load any existing cache file.
+
+        Args:
+            cache_path: Path of the binary cache file (None: keep the cache in memory only)
+        """
+        self.cache_path = cache_path
+        # relative path -> (mtime_ns, size, sha1 hex, encoding or None)
+        self._entries: Dict[str, Tuple[int, int, str, Optional[np.ndarray]]] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    # ========== PUBLIC METHODS ==========
+
+    def load(self) -> bool:
+        """
+        Read the cache file into memory.
+
+        Returns:
+            bool: True if a valid cache file was loaded
+        """
+        self._entries = {}
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return False
+
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                if int(data["version"]) != self.CACHE_VERSION:
+                    print("Encoding cache version mismatch, rebuilding")
+                    self._dirty = True
+                    return False
+                paths = data["paths"]
+                mtimes = data["mtimes"]
+                sizes = data["sizes"]
+                hashes = data["hashes"]
+                has_face = data["has_face"]
+                encodings = data["encodings"]
+        except Exception as e:
+            print(f"Warning: Could not read encoding cache {self.cache_path}: {e}")
+            self._dirty = True
+            return False
+
+        for i, path in enumerate(paths):
+            encoding = encodings[i].copy() if has_face[i] else None
+            self._entries[str(path)] = (int(mtimes[i]), int(sizes[i]), str(hashes[i]), encoding)
+        return True
+
+    def save(self, force: bool = False):
+        """
+        Write the cache to disk atomically if it changed.
+
+        Args:
+            force: Write even if nothing changed since the last load/save
+        """
+        if self.cache_path is None or not (self._dirty or force):
+            return
+
+        paths = sorted(self._entries)
+        count = len(paths)
+        encodings = np.zeros((count, self.ENCODING_SIZE), dtype=np.float32)
+        has_face = np.zeros(count, dtype=bool)
+        mtimes = np.zeros(count, dtype=np.int64)
+        sizes = np.zeros(count, dtype=np.int64)
+        hashes = []
+        for i, path in enumerate(paths):
+            mtime_ns, size, digest, encoding = self._entries[path]
+            mtimes[i] = mtime_ns
+            sizes[i] = size
+            hashes.append(digest)
+            if encoding is not None:
+                encodings[i] = encoding
+                has_face[i] = True
+
+        cache_dir = os.path.dirname(os.path.abspath(self.cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f,
+                     version=np.int64(self.CACHE_VERSION),
+                     paths=np.array(paths, dtype=str),
+                     mtimes=mtimes,
+                     sizes=sizes,
+                     hashes=np.array(hashes, dtype=str),
+                     has_face=has_face,
+                     encodings=encodings)
+        os.replace(tmp_path, self.cache_path)
+        self._dirty = False
+
+    def stale_paths(self, base_dir: str, rel_paths: List[str]) -> List[str]:
+        """
+        Return the images whose cached encoding is missing or out of date.
+
+        Entries whose size/mtime changed but whose content hash is identical (e.g. a copy or
+        touch) are revalidated in place without re-encoding.
+        Images deleted since rel_paths was listed are treated as removed: their entries are
+        dropped and they are not returned.
+
+        Args:
+            base_dir: Directory the relative paths are resolved against
+            rel_paths: Relative paths of the images to check
+
+        Returns:
+            List of relative paths that need encoding
+        """
+        stale = []
+        for rel_path in rel_paths:
+            full_path = os.path.join(base_dir, rel_path)
+            try:
+                stat = os.stat(full_path)
+                entry = self._entries.get(rel_path)
+                if entry is None:
+                    self.misses += 1
+                    stale.append(rel_path)
+                    continue
+
+                mtime_ns, size, digest, encoding = entry
+                if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+                    self.hits += 1
+                    continue
+                unchanged = self._hash_file(full_path) == digest
+            except FileNotFoundError:
+                self._drop(rel_path)
+                continue
+
+            if unchanged:
+                self._entries[rel_path] = (stat.st_mtime_ns, stat.st_size, digest, encoding)
+                self._dirty = True
+                self.hits += 1
+                continue
+
+            self.misses += 1
+            stale.append(rel_path)
+        return stale
+
+    def put(self, base_dir: str, rel_path: str, encoding: Optional[np.ndarray]):
+        """
+        Store a freshly computed encoding for an image.
+
+        Args:
+            base_dir: Directory the relative path is resolved against
+            rel_path: Relative path of the image
+            encoding: 128-d face encoding, or None if the image has no face
+        """
+        full_path = os.path.join(base_dir, rel_path)
+        try:
+            stat = os.stat(full_path)
+            digest = self._hash_file(full_path)
+        except FileNotFoundError:
+            self._drop(rel_path)  # deleted while it was being encoded
+            return
+        if encoding is not None:
+            encoding = np.asarray(encoding, dtype=np.float32).reshape(self.ENCODING_SIZE)
+        self._entries[rel_path] = (stat.st_mtime_ns, stat.st_size, digest, encoding)
+        self._dirty = True
+
+    def get(self, rel_path: str) -> Optional[np.ndarray]:
+        """Return the cached encoding for an image, or None if absent or faceless."""
+        entry = self._entries.get(rel_path)
+        return None if entry is None else entry[3]
+
+    def prune(self, rel_paths: List[str]):
+        """
+        Drop entries for images that no longer exist in the gallery.
+
+        Args:
+            rel_paths: Relative paths of all images currently in the gallery
+        """
+        keep = set(rel_paths)
+        removed = [path for path in self._entries if path not in keep]
+        for path in removed:
+            del self._entries[path]
+        if removed:
+            self._dirty = True
+
+    # ========== PRIVATE METHODS ==========
+
+    def _drop(self, rel_path: str):
+        """Forget an image that no longer exists."""
+        if self._entries.pop(rel_path, None) is not None:
+            self._dirty = True
+
+    def _hash_file(self, path: str) -> str:
+        """Return the SHA-1 hex digest of a file's contents."""
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                sha1.update(chunk)
+        return sha1.hexdigest()
@@ -0,0 +1,247 @@
+"""
+File: Enrollment.py
+
+Description:
+Parallel bulk enrollment of authorised faces.
+Decoding a photo and computing its dlib encoding is CPU-bound and independent per image, so a
+site's staff photos are spread across a process pool instead of being encoded one at a time.
+Results are written to the gallery's encoding cache (see EncodingCache.py), so the next
+FaceRecogniser start loads them with a single file read.
+
+Gallery layout:
+    images/authorised/alice.jpg          -> "alice"
+    images/authorised/bob/front.jpg      -> "bob"  (several photos per person)
+    images/authorised/bob/side.jpg       -> "bob"
+
+Usage:
+    python Enrollment.py --source staff_photos --workers 8
+    python Enrollment.py --dir images/authorised
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from EncodingCache import EncodingCache
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+PROGRESS_INTERVAL = 0.5
+
+
+@dataclass
+class EnrollmentReport:
+    """
+    Summary of a bulk enrollment run.
+
+    Attributes:
+        total: Number of images considered
+        cached: Images whose cached encoding was still valid
+        encoded: Images encoded in this run
+        no_face: Images in which no face was found
+        failures: Image path -> error message for images that could not be processed
+        elapsed: Wall-clock seconds spent encoding
+        workers: Number of worker processes used
+    """
+    total: int = 0
+    cached: int = 0
+    encoded: int = 0
+    no_face: List[str] = field(default_factory=list)
+    failures: Dict[str, str] = field(default_factory=dict)
+    elapsed: float = 0.0
+    workers: int = 1
+
+    @property
+    def throughput(self) -> float:
+        """Images encoded per second."""
+        return self.encoded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.total} image(s): {self.cached} cached, {self.encoded} encoded "
+                f"({self.throughput:.1f} img/s on {self.workers} worker(s)), "
+                f"{len(self.no_face)} without a face, {len(self.failures)} failed")
+
+
+def list_gallery_images(authorised_dir: str) -> List[str]:
+    """
+    List gallery images as paths relative to the gallery directory.
+
+    Images directly in the directory and one level of per-person subdirectories are included.
+
+    Args:
+        authorised_dir: Gallery directory
+
+    Returns:
+        Sorted list of relative image paths
+    """
+    rel_paths = []
+    for entry in sorted(os.listdir(authorised_dir)):
+        full_path = os.path.join(authorised_dir, entry)
+        if os.path.isdir(full_path):
+            for filename in sorted(os.listdir(full_path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    rel_paths.append(os.path.join(entry, filename))
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            rel_paths.append(entry)
+    return rel_paths
+
+
+def person_name(rel_path: str) -> str:
+    """Return the person a gallery image belongs to: its subdirectory, or its file name."""
+    head, filename = os.path.split(rel_path)
+    return os.path.basename(head) if head else os.path.splitext(filename)[0]
+
+
+def _encode_worker(image_path: str) -> Tuple[str, Optional[np.ndarray], Optional[str]]:
+    """
+    Encode the first face of an image (runs in a worker process).
+
+    Returns:
+        Tuple of (image path, encoding or None, error message or None)
+    """
+    try:
+        import face_recognition
+        image = face_recognition.load_image_file(image_path)
+        face_encodings = face_recognition.face_encodings(image)
+        return image_path, (face_encodings[0] if face_encodings else None), None
+    except Exception as e:
+        return image_path, None, str(e)
+
+
+def encode_images(image_paths: List[str], workers: int = None,
+                  progress: bool = True) -> Tuple[Dict[str, Optional[np.ndarray]], EnrollmentReport]:
+    """
+    Encode images across a process pool.
+
+    Args:
+        image_paths: Absolute paths of the images to encode
+        workers: Number of worker processes (default: CPU count)
+        progress: Print progress and throughput while encoding
+
+    Returns:
+        Tuple of (image path -> encoding or None, report). Failed images are not in the dict.
+    """
+    workers = max(1, min(workers or os.cpu_count() or 1, len(image_paths) or 1))
+    report = EnrollmentReport(total=len(image_paths), workers=workers)
+    encodings: Dict[str, Optional[np.ndarray]] = {}
+    if not image_paths:
+        return encodings, report
+
+    start = time.perf_counter()
+    last_progress = start
+    if workers == 1:
+        results = map(_encode_worker, image_paths)
+    else:
+        # Spawn, not fork: this runs on background threads (camera init, gallery watcher) while
+        # other threads hold locks that a forked child would inherit locked
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        results = (future.result() for future in
+                   as_completed([executor.submit(_encode_worker, path) for path in image_paths]))
+
+    try:
+        for done, (image_path, encoding, error) in enumerate(results, start=1):
+            if error is not None:
+                report.failures[image_path] = error
+            else:
+                encodings[image_path] = encoding
+                report.encoded += 1
+                if encoding is None:
+                    report.no_face.append(image_path)
+
+            now = time.perf_counter()
+            if progress and (done == len(image_paths) or now - last_progress >= PROGRESS_INTERVAL):
+                last_progress = now
+                print(f"\rEncoding [{done}/{len(image_paths)}] {done / (now - start):.1f} img/s", end="", flush=True)
+    finally:
+        if workers > 1:
+            executor.shutdown()
+    if progress:
+        print()
+
+    report.elapsed = time.perf_counter() - start
+    return encodings, report
+
+
+def enroll_directory(authorised_dir: str, cache_file: str = None, workers: int = None,
+                     progress: bool = True) -> EnrollmentReport:
+    """
+    Bring the gallery's encoding cache up to date, encoding stale images in parallel.
+
+    Args:
+        authorised_dir: Gallery directory
+        cache_file: Encoding cache path (default: inside authorised_dir)
+        workers: Number of worker processes (default: CPU count)
+        progress: Print progress while encoding
+
+    Returns:
+        EnrollmentReport for the run
+    """
+    cache = EncodingCache(cache_file or os.path.join(authorised_dir, EncodingCache.DEFAULT_FILENAME))
+    rel_paths = list_gallery_images(authorised_dir)
+    stale = cache.stale_paths(authorised_dir, rel_paths)
+
+    encodings, report = encode_images([os.path.join(authorised_dir, rel_path) for rel_path in stale],
+                                      workers=workers, progress=progress)
+    for rel_path in stale:
+        full_path = os.path.join(authorised_dir, rel_path)
+        if full_path in encodings:
+            cache.put(authorised_dir, rel_path, encodings[full_path])
+    cache.prune(rel_paths)
+    cache.save()
+
+    report.total = len(rel_paths)
+    report.cached = len(rel_paths) - len(stale)
+    return report
+
+
+def import_images(source_dir: str, authorised_dir: str) -> int:
+    """
+    Copy a staff photo tree into the gallery, keeping the name/subdirectory layout.
+
+    Args:
+        source_dir: Directory laid out like the gallery (name.jpg or name/*.jpg)
+        authorised_dir: Gallery directory
+
+    Returns:
+        Number of images copied
+    """
+    copied = 0
+    for rel_path in list_gallery_images(source_dir):
+        destination = os.path.join(authorised_dir, rel_path)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.copy2(os.path.join(source_dir, rel_path), destination)
+        copied += 1
+    return copied
+
+
+def main(argv: List[str] = None) -> int:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Bulk-enroll authorised faces using all CPU cores.")
+    parser.add_argument("--dir", default=os.path.join(script_dir, "images/authorised"),
+                        help="gallery directory (default: images/authorised)")
+    parser.add_argument("--source", help="copy this photo tree (name.jpg or name/*.jpg) into the gallery first")
+    parser.add_argument("--cache", help="encoding cache file (default: inside the gallery directory)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.dir, exist_ok=True)
+    if args.source:
+        print(f"Imported {import_images(args.source, args.dir)} image(s) from {args.source}")
+
+    report = enroll_directory(args.dir, cache_file=args.cache, workers=args.workers)
+    print(report.summary())
+    for image_path in report.no_face:
+        print(f"Warning: No faces found in {image_path}")
+    for image_path, error in report.failures.items():
+        print(f"Error: {image_path}: {error}")
+    return 1 if report.failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+File: EvidenceBuffer.py
+
+Description:
+Pre/post-event evidence clips from a memory-bounded ring of recent camera frames.
+Until now an unauthorised face or an "AlarmActive" left only a CSV row with a bounding box.
+The capture loop offers every frame to push(); at most max_fps of them are copied (downscaled
+to width) into a ring that is allocated once, sized by memory_limit_mb, and reused, so the
+frame path never allocates. trigger() marks an event: the frames of the last pre_seconds and
+the next post_seconds are pinned in the ring and, once the post-event window has passed, a
+background thread JPEG-encodes them into one clip file and releases them. Overlapping events
+extend the open clip instead of starting a new one.
+
+Clips are MJPEG files (concatenated JPEGs, playable with e.g. "ffplay -f mjpeg clip.mjpeg"),
+named <date>-<time>_<clip>_<reasons>.mjpeg and written under a temporary name first, so a
+clip that is visible in output_dir is complete.
+
+Memory:
+    The ring never holds more than memory_limit_mb of frames (but at least MIN_SLOTS frames).
+    FREE_SLOTS are never pinned, so capture always has somewhere to write; an event longer than
+    the ring can hold is truncated (evidence.frames_truncated) rather than growing memory.
+
+Usage:
+    evidence = EvidenceBuffer("evidence", memory_limit_mb=64)
+    evidence.start()
+    recogniser = FaceRecogniser(evidence=evidence)   # pushes frames, triggers on unauthorised faces
+    evidence.trigger("alarm")                        # e.g. on "AlarmActive"
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, List, Optional
+
+import numpy as np
+
+from Metrics import metrics
+
+
+@dataclass
+class _Clip:
+    """An event window and the ring slots pinned for it, in capture order."""
+    number: int
+    reasons: List[str]
+    created: float  # wall clock, for the file name
+    start: float  # monotonic
+    end: float
+    slots: List[int] = field(default_factory=list)
+    truncated: int = 0
+
+
+class EvidenceBuffer:
+    """
+    Fixed-memory ring of recent frames that turns events into JPEG clips on a background thread.
+
+    Public Interface:
+    - push(frame): Offers a capture frame (rate-limited copy into the ring; call from one capture thread at a time)
+    - trigger(reason): Marks an event; frames from pre_seconds before to post_seconds after are saved
+    - start() / stop(): Runs the encoder thread; stop() finishes the open and queued clips
+    - stats(): Ring size, events, clips and encoding throughput
+    """
+
+    MEMORY_LIMIT_MB = 64
+    PRE_SECONDS = 3.0
+    POST_SECONDS = 3.0
+    MAX_FPS = 10.0
+    WIDTH = 640
+    JPEG_QUALITY = 80
+    MIN_SLOTS = 4
+    FREE_SLOTS = 2
+    CLOSE_INTERVAL = 0.2
+
+    def __init__(self, output_dir: str = "evidence", memory_limit_mb: float = None, pre_seconds: float = None,
+                 post_seconds: float = None, max_fps: float = None, width: int = None, quality: int = None):
+        """
+        Initialise the buffer; the ring is allocated when the first frame shows its size.
+
+        Args:
+            output_dir: Directory receiving the clips (created on first use)
+            memory_limit_mb: Upper bound for the ring's frame memory (default: MEMORY_LIMIT_MB)
+            pre_seconds: Seconds of frames kept from before an event (default: PRE_SECONDS)
+            post_seconds: Seconds of frames recorded after an event (default: POST_SECONDS)
+            max_fps: Frames per second copied into the ring (default: MAX_FPS)
+            width: Frames wider than this are downscaled on the way in (default: WIDTH; 0: full size)
+            quality: JPEG quality 0-100 (default: JPEG_QUALITY)
+        """
+        self.output_dir = output_dir
+        self.memory_limit = int((memory_limit_mb or self.MEMORY_LIMIT_MB) * 1024 * 1024)
+        self.pre_seconds = self.PRE_SECONDS if pre_seconds is None else pre_seconds
+        self.post_seconds = self.POST_SECONDS if post_seconds is None else post_seconds
+        self.max_fps = max_fps or self.MAX_FPS
+        self.width = self.WIDTH if width is None else width
+        self.quality = quality or self.JPEG_QUALITY
+
+        self.frames: Optional[np.ndarray] = None  # (slots, height, width, channels) uint8
+        self.times = np.zeros(0)
+        self.sequence = np.zeros(0, dtype=np.int64)  # -1: empty or being written
+        self.pins = np.zeros(0, dtype=np.int32)  # clips still needing each slot
+        self.pushed = 0
+        self.dropped = 0
+        self.events = 0
+        self.clips = 0
+        self.frames_encoded = 0
+        self.frames_truncated = 0
+        self.bytes_written = 0
+        self.encode_seconds = 0.0
+        self.last_clip: Optional[str] = None
+
+        self._cursor = 0
+        self._next_sequence = 0
+        self._pinned_slots = 0
+        self._last_push = float("-inf")
+        self._clip: Optional[_Clip] = None
+        self._queue: Deque[_Clip] = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        metrics.gauge_callback("evidence.encode_fps", self.encode_fps)
+        metrics.gauge_callback("evidence.pinned_frames", lambda: self._pinned_slots)
+
+    # ========== PUBLIC METHODS ==========
+
+    def push(self, frame: np.ndarray, now: float = None) -> bool:
+        """
+        Offer a captured frame; it is copied into the ring unless it arrives faster than max_fps.
+
+        Args:
+            frame: BGR frame; not retained, so the caller may reuse its buffer
+            now: time.monotonic() of the capture (default: now)
+
+        Returns:
+            bool: True if the frame was stored
+        """
+        now = time.monotonic() if now is None else now
+        if now - self._last_push < 1.0 / self.max_fps:
+            return False
+        with self._lock:
+            self._last_push = now
+            if self.frames is None or self.frames.shape[1:] != self._ring_shape(frame):
+                if self._pinned_slots:
+                    self.dropped += 1  # size changed mid-event; keep the pinned frames intact
+                    return False
+                self._allocate(frame)
+            slot = self._free_slot()
+            if slot is None:
+                self.dropped += 1
+                return False
+            self.sequence[slot] = -1
+            target = self.frames[slot]
+
+        # Copy outside the lock: the slot is unpinned and marked as being written
+        if frame.shape == target.shape:
+            np.copyto(target, frame)
+        else:
+            import cv2  # deferred like _write_clip's; already loaded by the camera by now
+            cv2.resize(frame, (target.shape[1], target.shape[0]), dst=target, interpolation=cv2.INTER_AREA)
+
+        with self._lock:
+            self._next_sequence += 1
+            self.sequence[slot] = self._next_sequence
+            self.times[slot] = now
+            self.pushed += 1
+            clip = self._clip
+            if clip is not None:
+                if now <= clip.end:
+                    self._pin(clip, slot)
+                else:
+                    self._close_clip()
+        return True
+
+    def trigger(self, reason: str, now: float = None):
+        """
+        Mark an event; an open clip is extended instead of starting another.
+
+        Args:
+            reason: Short label used in the clip name (e.g. "unauthorised", "alarm")
+            now: time.monotonic() of the event (default: now)
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.events += 1
+            metrics.inc("evidence.events")
+            clip = self._clip
+            if clip is not None:
+                clip.end = max(clip.end, now + self.post_seconds)
+                if reason not in clip.reasons:
+                    clip.reasons.append(reason)
+                return
+            self.clips += 1
+            clip = _Clip(self.clips, [reason], time.time(), now - self.pre_seconds, now + self.post_seconds)
+            for slot in np.argsort(self.sequence):
+                if self.sequence[slot] >= 0 and self.times[slot] >= clip.start:
+                    self._pin(clip, int(slot))
+            self._clip = clip
+        print(f"Evidence: recording clip {clip.number} ({reason})")
+        self._wake.set()
+
+    def start(self):
+        """Start the encoder thread (no-op if already running)."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._encode_loop, name="EvidenceBuffer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Close the open clip, encode everything queued and stop the encoder thread."""
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def encode_fps(self) -> float:
+        """Frames encoded per second of encoder time."""
+        return self.frames_encoded / self.encode_seconds if self.encode_seconds > 0 else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"slots": len(self.sequence), "memory_bytes": 0 if self.frames is None else self.frames.nbytes,
+                    "memory_limit": self.memory_limit, "pushed": self.pushed, "dropped": self.dropped,
+                    "events": self.events, "clips": self.clips, "pending_clips": len(self._queue),
+                    "frames_encoded": self.frames_encoded, "frames_truncated": self.frames_truncated,
+                    "bytes_written": self.bytes_written, "encode_fps": self.encode_fps(),
+                    "encode_mb_per_second": (self.bytes_written / self.encode_seconds / 1e6
+                                             if self.encode_seconds > 0 else 0.0)}
+
+    # ========== PRIVATE METHODS ==========
+
+    def _ring_shape(self, frame: np.ndarray) -> tuple:
+        height, width = frame.shape[:2]
+        if self.width and width > self.width:
+            height, width = max(1, height * self.width // width), self.width
+        return (height, width) + frame.shape[2:]
+
+    def _allocate(self, frame: np.ndarray):
+        """(Re)build the ring for this frame size within the memory limit (call with the lock held)."""
+        shape = self._ring_shape(frame)
+        frame_bytes = int(np.prod(shape))
+        slots = self.memory_limit // frame_bytes
+        if slots < self.MIN_SLOTS:
+            print(f"Warning: evidence memory limit holds {slots} frame(s) of {shape}; using {self.MIN_SLOTS}")
+            slots = self.MIN_SLOTS
+        self.frames = np.zeros((slots,) + shape, dtype=np.uint8)
+        self.times = np.zeros(slots)
+        self.sequence = np.full(slots, -1, dtype=np.int64)
+        self.pins = np.zeros(slots, dtype=np.int32)
+        self._cursor = 0
+        print(f"Evidence ring: {slots} frames of {shape[1]}x{shape[0]} "
+              f"({self.frames.nbytes / 1024 / 1024:.1f} MB, {slots / self.max_fps:.1f}s)")
+
+    def _free_slot(self) -> Optional[int]:
+        """Next unpinned slot in ring order, overwriting the oldest (call with the lock held)."""
+        slots = len(self.sequence)
+        for offset in range(slots):
+            slot = (self._cursor + offset) % slots
+            if self.pins[slot] == 0:
+                self._cursor = (slot + 1) % slots
+                return slot
+        return None
+
+    def _pin(self, clip: _Clip, slot: int):
+        """Keep a slot for a clip, unless that would leave capture without FREE_SLOTS (call with the lock held)."""
+        if self.pins[slot] == 0:
+            if self._pinned_slots >= len(self.pins) - self.FREE_SLOTS:
+                clip.truncated += 1
+                self.frames_truncated += 1
+                metrics.inc("evidence.frames_truncated")
+                return
+            self._pinned_slots += 1
+        self.pins[slot] += 1
+        clip.slots.append(slot)
+
+    def _unpin(self, slot: int):
+        with self._lock:
+            self.pins[slot] -= 1
+            if self.pins[slot] == 0:
+                self._pinned_slots -= 1
+
+    def _close_clip(self):
+        """Queue the open clip for encoding (call with the lock held)."""
+        self._queue.append(self._clip)
+        self._clip = None
+        self._wake.set()
+
+    def _encode_loop(self):
+        """Close clips whose window has passed without new frames and encode queued clips."""
+        while True:
+            stopping = self._stop_event.is_set()
+            with self._lock:
+                clip = self._clip
+                if clip is not None and (stopping or time.monotonic() > clip.end):
+                    self._close_clip()
+                clip = self._queue.popleft() if self._queue else None
+            if clip is not None:
+                self._write_clip(clip)
+                continue
+            if stopping:
+                break
+            self._wake.wait(self.CLOSE_INTERVAL)
+            self._wake.clear()
+
+    def _write_clip(self, clip: _Clip):
+        """JPEG-encode a clip's frames into one MJPEG file, releasing each slot once encoded."""
+        reasons = "-".join(re.sub(r"[^A-Za-z0-9_-]+", "", reason) for reason in clip.reasons)
+        name = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(clip.created))}_{clip.number:04d}_{reasons}.mjpeg"
+        path = os.path.join(self.output_dir, name)
+        import cv2  # deferred so constructing the buffer does not load OpenCV before the window is up
+        params = [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+        encoded = 0
+        size = 0
+        started = time.perf_counter()
+        remaining = deque(clip.slots)
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(path + ".part", "wb") as output:
+                while remaining:
+                    slot = remaining[0]
+                    begin = time.perf_counter()
+                    ok, buffer = cv2.imencode(".jpg", self.frames[slot], params)
+                    remaining.popleft()
+                    self._unpin(slot)
+                    metrics.observe("evidence.encode", time.perf_counter() - begin)
+                    if ok:
+                        output.write(buffer)
+                        encoded += 1
+                        size += buffer.nbytes
+            os.replace(path + ".part", path)
+        except OSError as e:
+            print(f"Error writing evidence clip {path}: {e}")
+            return
+        finally:
+            for slot in remaining:
+                self._unpin(slot)
+            self.encode_seconds += time.perf_counter() - started
+            self.frames_encoded += encoded
+
+        self.bytes_written += size
+        self.last_clip = path
+        metrics.inc("evidence.clips")
+        truncated = f", {clip.truncated} truncated" if clip.truncated else ""
+        print(f"Evidence clip saved: {path} ({encoded} frames{truncated}, {size / 1024:.0f} KB)")
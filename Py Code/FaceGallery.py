@@ -0,0 +1,429 @@
+"""
+File: FaceGallery.py
+
+Description:
+In-memory gallery of authorised face encodings held as one contiguous float32 matrix.
+Matching every face of a frame is a single batched distance computation against the whole
+gallery, instead of one face_recognition.face_distance call (and list -> array conversion) per
+face. For very large galleries an optional approximate nearest-neighbour index (hnswlib, runs
+in-process with no services) keeps matching cost roughly constant as headcount grows.
+
+Key Features:
+- Contiguous float32 matrix with a parallel name/id index and cached squared norms.
+- Batched Euclidean distances for all faces in a frame.
+- Top-k results per face (best entry per distinct name) with the margin to the runner-up.
+- Optional hnswlib index, used automatically above ANN_MIN_SIZE entries when installed.
+- Copy-on-write updates: removing or replacing people builds a new matrix and swaps it in with a
+  single reference assignment, so matching never waits on an update or sees half of one.
+- Memory-mapped generations: publish()/map_store() back the gallery with a read-only GalleryStore
+  mapping shared by every process that opens it; the first write copies it into private memory.
+"""
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from GalleryStore import GalleryStore, MappedGallery
+
+try:
+    import hnswlib
+except ImportError:  # optional dependency
+    hnswlib = None
+
+
+@dataclass
+class GalleryMatch:
+    """
+    Nearest gallery entries for one query face.
+
+    Attributes:
+        names: Up to k distinct names, closest first
+        distances: Euclidean distance for each name
+        ids: Gallery row id of each name's closest entry
+        margin: Distance gap between the best name and the runner-up (inf if only one name)
+    """
+    names: List[str]
+    distances: List[float]
+    ids: List[int]
+    margin: float
+
+    @property
+    def best_name(self) -> Optional[str]:
+        return self.names[0] if self.names else None
+
+    @property
+    def best_distance(self) -> float:
+        return self.distances[0] if self.distances else float("inf")
+
+
+class _GalleryData:
+    """
+    One generation of gallery storage.
+
+    Rows are only ever appended: a row is written before count is raised past it, so a reader
+    that reads count once sees a consistent prefix. Anything else builds a new generation.
+    A mapped generation (from a GalleryStore) is full, so its first append copies it.
+    """
+
+    __slots__ = ("matrix", "sq_norms", "names", "count", "ann_index", "ann_count", "name_groups")
+
+    def __init__(self, capacity: int, size: int):
+        self.matrix = np.zeros((capacity, size), dtype=np.float32)
+        self.sq_norms = np.zeros(capacity, dtype=np.float32)
+        self.names: List[str] = []
+        self.count = 0
+        self.ann_index = None
+        self.ann_count = 0
+        self.name_groups = None  # (count, row order grouped by name, group starts, group names)
+
+    @classmethod
+    def mapped(cls, mapped: "MappedGallery") -> "_GalleryData":
+        data = cls(0, mapped.matrix.shape[1])
+        data.matrix = mapped.matrix
+        data.sq_norms = mapped.sq_norms
+        data.names = list(mapped.names)
+        data.count = len(data.names)
+        return data
+
+
+class FaceGallery:
+    """
+    Contiguous float32 store of face encodings with batched nearest-neighbour matching.
+
+    Public Interface:
+    - add(name, encoding) -> int: Adds an encoding and returns its row id
+    - update(changes): Atomically replaces or removes the encodings of several people
+    - replace(name, encodings) / remove(name): Single-person forms of update()
+    - contains(name, encoding, tolerance): Whether a near-identical entry already exists
+    - publish(store) / map_store(store): Write the gallery to a GalleryStore / switch to its current version
+    - match(encodings, k) -> List[GalleryMatch]: Batched top-k matching
+    - names / encodings: Current name list and (count, 128) encoding matrix view
+    - clear(): Removes all entries
+
+    Usage:
+        gallery = FaceGallery()
+        gallery.add("alice", encoding)
+        matches = gallery.match(frame_encodings, k=3)
+    """
+
+    ENCODING_SIZE = 128
+    INITIAL_CAPACITY = 64
+    CANDIDATE_SLACK = 8
+    ANN_MIN_SIZE = 2000
+    ANN_EF_CONSTRUCTION = 200
+    ANN_M = 16
+    ANN_EF_SEARCH = 64
+    MATCH_CHUNK_ROWS = 4096  # float16 rows upcast at a time (2 MB as float32)
+
+    def __init__(self, use_ann: bool = False):
+        """
+        Initialise an empty gallery.
+
+        Args:
+            use_ann: Use an hnswlib index for galleries of at least ANN_MIN_SIZE entries
+                     (ignored with a warning if hnswlib is not installed)
+        """
+        if use_ann and hnswlib is None:
+            print("Warning: hnswlib not installed, using exact matching")
+        self.use_ann = use_ann and hnswlib is not None
+        # Serialises writers; readers take one reference to _data and never lock
+        self._lock = threading.Lock()
+        self._data = _GalleryData(self.INITIAL_CAPACITY, self.ENCODING_SIZE)
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return self._data.count
+
+    @property
+    def names(self) -> List[str]:
+        """Names of all entries, indexed by row id."""
+        data = self._data
+        return data.names[:data.count]
+
+    @property
+    def encodings(self) -> np.ndarray:
+        """Read-only (count, 128) view of all encodings."""
+        data = self._data
+        view = data.matrix[:data.count]
+        view.flags.writeable = False
+        return view
+
+    # ========== PUBLIC METHODS ==========
+
+    def add(self, name: str, encoding: np.ndarray) -> int:
+        """
+        Append an encoding to the gallery.
+
+        Args:
+            name: Name to associate with the encoding
+            encoding: 128-d face encoding
+
+        Returns:
+            int: Row id of the new entry
+        """
+        vector = np.asarray(encoding, dtype=np.float32).reshape(self.ENCODING_SIZE)
+        with self._lock:
+            data = self._data
+            if data.count == len(data.matrix):
+                data = self._copy(data, range(data.count), max(self.INITIAL_CAPACITY, 2 * len(data.matrix)))
+            row = data.count
+            data.matrix[row] = vector
+            data.sq_norms[row] = np.dot(vector, vector)
+            data.names.append(name)
+            data.count += 1
+            self._data = data
+        return row
+
+    def update(self, changes: Dict[str, Optional[Sequence[np.ndarray]]]):
+        """
+        Replace the encodings of several people in one atomic step.
+
+        A new matrix is built from the unchanged rows plus the new encodings and then swapped
+        in, so concurrent match() calls see either the old gallery or the new one.
+
+        Args:
+            changes: Name -> new encodings; None or an empty list removes the person
+        """
+        new_rows = [(name, np.asarray(encoding, dtype=np.float32).reshape(self.ENCODING_SIZE))
+                    for name, encodings in changes.items() if encodings is not None
+                    for encoding in encodings]
+        with self._lock:
+            old = self._data
+            keep = [row for row in range(old.count) if old.names[row] not in changes]
+            data = self._copy(old, keep, max(self.INITIAL_CAPACITY, 2 * (len(keep) + len(new_rows))))
+            for name, vector in new_rows:
+                row = data.count
+                data.matrix[row] = vector
+                data.sq_norms[row] = np.dot(vector, vector)
+                data.names.append(name)
+                data.count += 1
+            self._data = data
+            self.generation += 1
+
+    def replace(self, name: str, encodings: Sequence[np.ndarray]):
+        """Atomically replace all encodings of a person."""
+        self.update({name: encodings})
+
+    def remove(self, name: str) -> int:
+        """
+        Remove every encoding of a person.
+
+        Returns:
+            int: Number of entries removed
+        """
+        removed = self.names.count(name)
+        if removed:
+            self.update({name: None})
+        return removed
+
+    def contains(self, name: str, encoding: np.ndarray, tolerance: float) -> bool:
+        """Return True if the person already has an entry within tolerance of encoding."""
+        data = self._data
+        rows = [row for row in range(data.count) if data.names[row] == name]
+        if not rows:
+            return False
+        vector = np.asarray(encoding, dtype=np.float32).reshape(self.ENCODING_SIZE)
+        return bool(np.min(np.linalg.norm(data.matrix[rows] - vector, axis=1)) <= tolerance)
+
+    def publish(self, store: "GalleryStore") -> int:
+        """
+        Write the current entries as a new store version and switch to matching from its mapping.
+
+        Writers wait until the switch is done, so no entry added meanwhile is lost.
+
+        Returns:
+            int: The published version
+
+        Raises:
+            OSError: If the store cannot be written (the gallery is left unchanged)
+        """
+        with self._lock:
+            data = self._data
+            version = store.publish(data.names[:data.count], data.matrix[:data.count])
+            self._data = _GalleryData.mapped(store.open())
+            self.generation += 1
+        return version
+
+    def map_store(self, store: "GalleryStore") -> int:
+        """
+        Replace all entries with the store's current version, mapped read-only.
+
+        Returns:
+            int: The mapped version
+
+        Raises:
+            FileNotFoundError: If nothing has been published to the store
+        """
+        mapped = store.open()
+        with self._lock:
+            self._data = _GalleryData.mapped(mapped)
+            self.generation += 1
+        return mapped.version
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data = _GalleryData(self.INITIAL_CAPACITY, self.ENCODING_SIZE)
+            self.generation += 1
+
+    def match(self, encodings: Sequence[np.ndarray], k: int = 1) -> List[GalleryMatch]:
+        """
+        Find the closest gallery names for every query encoding in one batched pass.
+
+        Args:
+            encodings: Query encodings, one per face
+            k: Number of distinct names to return per face
+
+        Returns:
+            One GalleryMatch per query encoding, in input order
+        """
+        if len(encodings) == 0:
+            return []
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, self.ENCODING_SIZE)
+
+        data = self._data
+        count = data.count
+        if count == 0:
+            return [GalleryMatch([], [], [], float("inf")) for _ in range(len(queries))]
+
+        # Two names are needed for the margin, even when only the best is returned
+        wanted = max(k, 2)
+        if self.use_ann and count >= self.ANN_MIN_SIZE:
+            candidate_ids, candidate_distances = self._ann_candidates(data, queries, count, wanted)
+        else:
+            candidate_ids, candidate_distances = self._exact_candidates(data, queries, count, wanted)
+
+        names = data.names
+        return [self._collapse(ids, distances, names, k)
+                for ids, distances in zip(candidate_ids, candidate_distances)]
+
+    # ========== PRIVATE METHODS ==========
+
+    def _copy(self, data: _GalleryData, rows: Sequence[int], capacity: int) -> _GalleryData:
+        """Build a new generation holding the given rows of data (in order)."""
+        copy = _GalleryData(capacity, self.ENCODING_SIZE)
+        rows = np.asarray(list(rows), dtype=np.int64)
+        copy.count = len(rows)
+        copy.matrix[:copy.count] = data.matrix[rows]
+        copy.sq_norms[:copy.count] = data.sq_norms[rows]
+        copy.names = [data.names[row] for row in rows]
+        return copy
+
+    def _name_groups(self, data: _GalleryData, count: int):
+        """
+        Rows of the first count entries grouped by name, cached on the generation.
+
+        Returns:
+            (row order with each name's rows together, start of each group in that order,
+             name of each group)
+        """
+        groups = data.name_groups
+        if groups is None or groups[0] != count:
+            codes = {}
+            row_codes = np.fromiter((codes.setdefault(name, len(codes)) for name in data.names[:count]),
+                                    dtype=np.int64, count=count)
+            order = np.argsort(row_codes, kind="stable")
+            starts = np.flatnonzero(np.diff(row_codes[order], prepend=-1))
+            groups = (count, order, starts, list(codes))
+            data.name_groups = groups  # same result whichever reader builds it first
+        return groups[1:]
+
+    def _exact_candidates(self, data: _GalleryData, queries: np.ndarray, count: int, wanted: int):
+        """
+        Brute-force distances to every entry: |q|^2 + |g|^2 - 2 q.g, in one matrix product.
+
+        Returns the closest row of each of the wanted nearest names. With several photos per
+        person, the per-name minimum is taken over all of their rows, so one person's photos
+        can never crowd the runner-up out of the margin.
+        """
+        gallery = data.matrix[:count]
+        if gallery.dtype == np.float32:
+            products = queries @ gallery.T
+        else:
+            # float16 store: upcast cache-sized chunks, never a float32 copy of the whole mapping
+            products = np.empty((len(queries), count), dtype=np.float32)
+            for start in range(0, count, self.MATCH_CHUNK_ROWS):
+                chunk = gallery[start:start + self.MATCH_CHUNK_ROWS].astype(np.float32)
+                np.matmul(queries, chunk.T, out=products[:, start:start + len(chunk)])
+        sq_distances = (np.einsum("ij,ij->i", queries, queries)[:, None]
+                        + data.sq_norms[:count][None, :]
+                        - 2.0 * products)
+        np.maximum(sq_distances, 0.0, out=sq_distances)
+
+        order, starts, _ = self._name_groups(data, count)
+        if len(starts) == count:
+            # One row per name: rows are the names
+            return self._nearest(sq_distances, wanted)
+        group_ids, group_distances = self._nearest(np.minimum.reduceat(sq_distances[:, order], starts, axis=1),
+                                                   wanted)
+        ends = np.append(starts[1:], count)
+        ids = np.empty_like(group_ids)
+        for face, groups in enumerate(group_ids):
+            for position, group in enumerate(groups):
+                rows = order[starts[group]:ends[group]]
+                ids[face, position] = rows[np.argmin(sq_distances[face, rows])]
+        return ids, group_distances
+
+    @staticmethod
+    def _nearest(sq_distances: np.ndarray, wanted: int):
+        """Column ids and distances of the wanted smallest squared distances per row, closest first."""
+        columns = sq_distances.shape[1]
+        if wanted < columns:
+            ids = np.argpartition(sq_distances, wanted - 1, axis=1)[:, :wanted]
+        else:
+            ids = np.tile(np.arange(columns), (len(sq_distances), 1))
+        top = np.take_along_axis(sq_distances, ids, axis=1)
+        order = np.argsort(top, axis=1)
+        return np.take_along_axis(ids, order, axis=1), np.sqrt(np.take_along_axis(top, order, axis=1))
+
+    def _ann_candidates(self, data: _GalleryData, queries: np.ndarray, count: int, wanted: int):
+        """
+        Approximate candidates from the generation's hnswlib index, extended with rows added since.
+
+        The candidate pool is widened until every face has wanted distinct names in it (or the
+        whole gallery is searched), since one person's photos may fill the first neighbours.
+        The index may include rows appended after the caller read count; their names are already
+        in data.names, so results stay valid.
+        """
+        with self._lock:
+            count = data.count
+            if data.ann_index is None:
+                data.ann_index = hnswlib.Index(space="l2", dim=self.ENCODING_SIZE)
+                data.ann_index.init_index(max_elements=count,
+                                          ef_construction=self.ANN_EF_CONSTRUCTION, M=self.ANN_M)
+                data.ann_count = 0
+            if data.ann_count < count:
+                if data.ann_index.get_max_elements() < count:
+                    data.ann_index.resize_index(2 * count)
+                data.ann_index.add_items(np.asarray(data.matrix[data.ann_count:count], dtype=np.float32),
+                                         np.arange(data.ann_count, count))
+                data.ann_count = count
+            index = data.ann_index
+        wanted = min(wanted, len(self._name_groups(data, count)[2]))
+        candidates = min(count, wanted + self.CANDIDATE_SLACK)
+        while True:
+            index.set_ef(max(self.ANN_EF_SEARCH, candidates))
+            ids, sq_distances = index.knn_query(queries, k=candidates)
+            if candidates == count or all(len({data.names[row] for row in rows}) >= wanted for rows in ids):
+                return ids.astype(np.int64), np.sqrt(np.maximum(sq_distances, 0.0))
+            candidates = min(count, 4 * candidates)
+
+    def _collapse(self, ids: np.ndarray, distances: np.ndarray, names: List[str], k: int) -> GalleryMatch:
+        """Keep the closest entry per distinct name and compute the best-vs-runner-up margin."""
+        seen = set()
+        top_names, top_distances, top_ids = [], [], []
+        for row, distance in zip(ids, distances):
+            name = names[row]
+            if name in seen:
+                continue
+            seen.add(name)
+            top_names.append(name)
+            top_distances.append(float(distance))
+            top_ids.append(int(row))
+            if len(top_names) == max(k, 2):
+                break
+
+        margin = top_distances[1] - top_distances[0] if len(top_distances) > 1 else float("inf")
+        return GalleryMatch(top_names[:k], top_distances[:k], top_ids[:k], margin)
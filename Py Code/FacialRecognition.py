@@ -1,379 +1,1148 @@
-"""
-File: face-recognition-oop3.py
-Author: Dirc-Robert Wortley
-Date: 29.04.2025 14:52
-
-Based on the work of Adam Geitgey (https://github.com/ageitgey/face_recognition/tree/master),
-and protected under the MIT License.
-
-Description:
-Face Recognition System (Real-Time)
-This script implements a real-time face recognition system using OpenCV and the face_recognition library.
-It is designed for robustness, with automatic camera reconnection handling and smoothed frame rate display.
-Authorised faces are loaded from a specified directory and matched against camera input frames in real-time.
-
-Key Features:
-- Object-Oriented Design: Structured for easy integration into larger OOP-based applications and systems.
-- Robust Camera Handling: Automatically detects and recovers from camera disconnection errors.
-- Real-Time Recognition: Annotates video stream with bounding boxes and names of recognised individuals.
-- Configurable Face Library: Allows dynamic addition of authorised individuals.
-
-"""
-import face_recognition
-import cv2
-import numpy as np
-import os
-import time
-from typing import List, Tuple, Optional
-import csv
-from datetime import datetime
-
-class FaceRecogniser:
-    """
-    Face recognition system that detects and identifies faces in real-time using a webcam.
-
-    Public Interface:
-    - __init__(authorised_dir: str = None, camera_index: int = 0)
-    - run_realtime_recognition(): Starts the real-time recognition loop
-    - add_authorised_face(image_path: str, name: str): Adds new authorised faces
-    - release_resources(): Cleans up system resources
-
-    Key Methods:
-    - recognise_faces(frame): Detects and recognises faces in a frame
-    - process_frame(frame): Processes frame with annotations
-
-    Usage:
-        recogniser = FaceRecogniser()
-        try:
-            recogniser.run_realtime_recognition()
-        finally:
-            recogniser.release_resources()
-    """
-
-    # Configuration constants
-    FACE_MATCH_THRESHOLD = 0.6
-    CAMERA_WARMUP_TIME = 2.0
-    FRAME_SCALE_FACTOR = 0.25
-    MAX_RETRIES = 3
-    FPS_BUFFER_SIZE = 10
-
-    def __init__(self, authorised_dir: str = None, camera_index: int = 0, log_file: str = "face_detections.csv"):
-        """
-        Initialise the face recognition system.
-
-        Args:
-            authorised_dir: Path to directory containing authorised person images
-            camera_index: Index of the camera to use (default: 0)
-            log_file: Path to CSV file for logging detections
-
-        Raises:
-            FileNotFoundError: If authorized directory doesn't exist
-            RuntimeError: If camera cannot be initialised
-        """
-        if authorised_dir is None:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            authorised_dir = os.path.join(script_dir, "images/authorised")
-
-        self.authorised_dir = authorised_dir
-        self.camera_index = camera_index
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.video_capture = None
-        self.log_file = log_file
-        self.last_detection_time = {}  # To track when each person was last detected
-
-        print(f"Initialising FaceRecogniser with image directory: {self.authorised_dir}")
-
-        if not os.path.exists(self.authorised_dir):
-            raise FileNotFoundError(
-                f"Authorised faces directory not found: {self.authorised_dir}\n"
-                f"Please create it and add authorised person images."
-            )
-
-        # Initialize the log file with headers if it doesn't exist
-        self._initialize_log_file()
-
-        self._initialise_recogniser()
-
-    def _initialize_log_file(self):
-        """Create the log file with headers if it doesn't exist"""
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, mode='w', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(['timestamp', 'name', 'status', 'location'])
-
-    def _log_detection(self, name: str, status: str, location: Tuple[int, int, int, int]):
-        """
-        Log a face detection to the CSV file.
-
-        Args:
-            name: Name of the detected person or "Unauthorised"
-            status: "Authorised" or "Unauthorised"
-            location: Tuple of (top, right, bottom, left) coordinates
-        """
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        location_str = f"{location[0]},{location[1]},{location[2]},{location[3]}"
-
-        with open(self.log_file, mode='a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([timestamp, name, status, location_str])
-
-    def _should_log_detection(self, name: str) -> bool:
-        """
-        Determine if a detection should be logged to prevent duplicate entries.
-
-        Args:
-            name: Name of the detected person
-
-        Returns:
-            bool: True if the detection should be logged
-        """
-        current_time = time.time()
-        # Only log if this person hasn't been detected in the last 10 seconds
-        if name not in self.last_detection_time or (current_time - self.last_detection_time[name]) > 10:
-            self.last_detection_time[name] = current_time
-            return True
-        return False
-
-    # ========== PUBLIC METHODS ==========
-
-    def run_realtime_recognition(self):
-        """Run continuous face recognition with error recovery"""
-        print("Starting real-time recognition. Press 'q' to quit.")
-        frame_count = 0
-        start_time = time.time()
-        fps_buffer = []
-        retry_count = 0
-
-        try:
-            while True:
-                ret, frame = self.video_capture.read()
-
-                if not ret or frame is None:
-                    retry_count += 1
-                    if retry_count > self.MAX_RETRIES:
-                        print("Camera error: Attempting to reconnect...")
-                        self.video_capture.release()
-                        self._initialise_camera()
-                        retry_count = 0
-                        continue
-
-                    print(f"Warning: Frame read failed (attempt {retry_count}/{self.MAX_RETRIES})")
-                    time.sleep(0.5)
-                    continue
-
-                retry_count = 0
-                processed_frame = self.process_frame(frame)
-                frame_count += 1
-
-                _, recognised_names = self.recognise_faces(frame)
-                if any(name != "Unauthorised" for name in recognised_names):
-                    print(f"Authorised face detected: {recognised_names}")
-                    return "Authorised"
-
-                # Calculate and display FPS
-                elapsed = time.time() - start_time
-                current_fps = frame_count / elapsed
-                fps_buffer.append(current_fps)
-                if len(fps_buffer) > self.FPS_BUFFER_SIZE:
-                    fps_buffer.pop(0)
-                smoothed_fps = sum(fps_buffer) / len(fps_buffer)
-
-                cv2.putText(processed_frame, f"FPS: {smoothed_fps:.1f}", (10, 30),
-                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                cv2.imshow('Face Recognition', processed_frame)
-
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-
-        except KeyboardInterrupt:
-            print("\nStopping recognition...")
-        except Exception as e:
-            print(f"Error during recognition: {e}")
-        finally:
-            self.release_resources()
-
-    def recognise_faces(self, frame: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], List[str]]:
-        """
-        Detect and recognise faces in a frame.
-
-        Args:
-            frame: Input frame from camera
-
-        Returns:
-            Tuple of (face_locations, names) where:
-            - face_locations: List of (top, right, bottom, left) coordinates
-            - names: List of corresponding names or "Unauthorised"
-        """
-        small_frame = cv2.resize(frame, (0, 0), fx=self.FRAME_SCALE_FACTOR, fy=self.FRAME_SCALE_FACTOR)
-        rgb_small_frame = np.ascontiguousarray(small_frame[:, :, ::-1])
-
-        face_locations = face_recognition.face_locations(rgb_small_frame, model="hog")
-        face_encodings = face_recognition.face_encodings(rgb_small_frame, face_locations)
-
-        names = []
-        for face_encoding in face_encodings:
-            if not self.known_face_encodings:
-                names.append("Unauthorised")
-                continue
-
-            face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-            best_match_index = np.argmin(face_distances)
-
-            if face_distances[best_match_index] < self.FACE_MATCH_THRESHOLD:
-                names.append(self.known_face_names[best_match_index])
-            else:
-                names.append("Unauthorised")
-
-        # Scale face locations back to original frame size
-        face_locations = [(top*4, right*4, bottom*4, left*4)
-                         for (top, right, bottom, left) in face_locations]
-
-        # Log detections
-        for (location, name) in zip(face_locations, names):
-            status = "Authorised" if name != "Unauthorised" else "Unauthorised"
-            if self._should_log_detection(name):
-                self._log_detection(name, status, location)
-
-        return face_locations, names
-
-    def process_frame(self, frame: np.ndarray) -> np.ndarray:
-        """
-        Process a frame with face recognition and annotations.
-
-        Args:
-            frame: Input frame from camera
-
-        Returns:
-            Annotated frame with face boxes and names
-        """
-        face_locations, names = self.recognise_faces(frame)
-
-        for (top, right, bottom, left), name in zip(face_locations, names):
-            # Expand the box slightly for better visibility
-            width = right - left
-            height = bottom - top
-            left = max(0, left - int(width * 0.125))
-            right = min(frame.shape[1], right + int(width * 0.125))
-            top = max(0, top - int(height * 0.125))
-            bottom = min(frame.shape[0], bottom + int(height * 0.125))
-
-            # Set box color based on authorization status
-            box_colour = (0, 0, 255) if name == "Unauthorised" else (0, 255, 0)
-
-            # Draw face box and label
-            cv2.rectangle(frame, (left, top), (right, bottom), box_colour, 2)
-            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), box_colour, cv2.FILLED)
-            font = cv2.FONT_HERSHEY_DUPLEX
-            cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.8, (255, 255, 255), 1)
-
-        return frame
-
-    def add_authorised_face(self, image_path: str, name: str):
-        """
-        Add a new authorised face to the system.
-
-        Args:
-            image_path: Path to the image file
-            name: Name to associate with the face
-
-        Raises:
-            Exception: If face cannot be loaded or encoded
-        """
-        try:
-            image = face_recognition.load_image_file(image_path)
-            face_encodings = face_recognition.face_encodings(image)
-
-            if face_encodings:
-                self.known_face_encodings.append(face_encodings[0])
-                self.known_face_names.append(name)
-                print(f"Added new authorised person: {name}")
-            else:
-                print(f"Warning: No faces found in {image_path}")
-
-        except Exception as e:
-            print(f"Error adding authorised face: {e}")
-            raise
-
-    def release_resources(self):
-        """Clean up all system resources."""
-        if self.video_capture is not None:
-            self.video_capture.release()
-        cv2.destroyAllWindows()
-        print("Resources released")
-
-    # ========== PRIVATE METHODS ==========
-
-    def _initialise_recogniser(self):
-        """Initialise camera first, then load faces"""
-        self._initialise_camera()
-        self._load_authorised_faces()
-
-    def _load_authorised_faces(self):
-        """Load all authorised faces from the specified directory"""
-        print(f"Loading authorised faces from: {self.authorised_dir}")
-
-        try:
-            for filename in sorted(os.listdir(self.authorised_dir)):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    image_path = os.path.join(self.authorised_dir, filename)
-                    print(f"Processing image: {image_path}")
-
-                    image = face_recognition.load_image_file(image_path)
-                    face_encodings = face_recognition.face_encodings(image)
-
-                    if face_encodings:
-                        if len(face_encodings) > 1:
-                            print(f"Warning: Multiple faces in {filename}. Using first face.")
-                        self.known_face_encodings.append(face_encodings[0])
-                        name = os.path.splitext(filename)[0]
-                        self.known_face_names.append(name)
-                        print(f"Loaded authorised person: {name}")
-                    else:
-                        print(f"Warning: No faces found in {filename}")
-
-            if not self.known_face_encodings:
-                raise ValueError("No authorised faces found in the directory")
-
-        except Exception as e:
-            print(f"Error loading image files: {e}")
-            raise
-
-    def _initialise_camera(self, width: int = 1280, height: int = 720):
-        """
-        Initialise video capture with warmup period.
-
-        Args:
-            width: Desired frame width
-            height: Desired frame height
-
-        Raises:
-            RuntimeError: If camera cannot be opened
-        """
-        print("Initialising camera...")
-        self.video_capture = cv2.VideoCapture(self.camera_index)
-
-        if not self.video_capture.isOpened():
-            raise RuntimeError("Camera could not be opened. Check if it's connected or in use.")
-
-        self.video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
-        self.video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
-
-        actual_width = self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)
-        actual_height = self.video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
-        print(f"Camera resolution set to: {int(actual_width)}x{int(actual_height)}")
-
-        time.sleep(self.CAMERA_WARMUP_TIME)
-        print("Camera ready")
-
-
-if __name__ == "__main__":
-    try:
-        recogniser = FaceRecogniser()
-        recogniser.run_realtime_recognition()
-    except Exception as e:
-        print(f"Error: {e}")
-    finally:
-        if 'recogniser' in locals():
+"""
+File: face-recognition-oop3.py
+Author: Dirc-Robert Wortley
+Date: 29.04.2025 14:52
+
+Based on the work of Adam Geitgey (https://github.com/ageitgey/face_recognition/tree/master),
+and protected under the MIT License.
+
+Description:
+Face Recognition System (Real-Time)
+This script implements a real-time face recognition system using OpenCV and the face_recognition library.
+It is designed for robustness, with automatic camera reconnection handling and smoothed frame rate display.
+Authorised faces are loaded from a specified directory and matched against camera input frames in real-time.
+
+Key Features:
+- Object-Oriented Design: Structured for easy integration into larger OOP-based applications and systems.
+- Robust Camera Handling: Automatically detects and recovers from camera disconnection errors.
+- Real-Time Recognition: Annotates video stream with bounding boxes and names of recognised individuals.
+- Configurable Face Library: Allows dynamic addition, replacement and removal of authorised individuals.
+- Gallery Hot-Reload: Changes in the authorised directory are picked up while recognition runs;
+  only changed images are re-encoded and affected people are swapped in atomically.
+- Vectorised Gallery: Authorised encodings live in one float32 matrix matched in a single batched pass.
+- Single-Pass Frames: Each frame is recognised once into a FrameResult shared by annotation, logging and decisions.
+- Adaptive Detection: The detection scale follows face size and the latency budget; unconfirmed
+  faces are retried on finer crops or the CNN detector while time allows (DetectionScheduler.py).
+- Motion Gating: Static frames skip detection and tracked faces are only re-encoded when their identity expires.
+- Background Logging: Detections are queued and written in batches off the frame path (CSV and optional SQLite).
+- Encoding Cache: Gallery encodings are persisted to disk so only new or changed images are re-encoded.
+- Shared Gallery Store: The gallery can be published to a versioned memory-mapped file that other
+  recogniser processes map read-only instead of loading their own copy (GalleryStore.py).
+- Parallel Enrollment: Large batches of new images are encoded across a process pool.
+- Headless Mode: Annotation and display can be skipped entirely on units without a screen,
+  with an optional rate-limited MJPEG preview encoded off the recognition thread (PreviewStream.py).
+- Evidence Clips: Unauthorised faces save the frames around them as JPEG clips, encoded off the
+  recognition thread from a fixed-memory ring (EvidenceBuffer.py).
+- Bounded Decisions: Matches are voted across frames and every session ends with "Authorised",
+  "Unauthorised" or "Timeout" within a deadline and frame budget (DecisionEngine.py).
+- Metrics: Per-stage timing histograms and counters are recorded in Metrics.metrics.
+
+"""
+import face_recognition
+import cv2
+import numpy as np
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional
+from dataclasses import dataclass, field
+
+from DecisionEngine import DecisionEngine
+from DetectionLog import DetectionLogger
+from DetectionScheduler import DetectionLevel, DetectionScheduler
+from EncodingCache import EncodingCache
+from Enrollment import EnrollmentReport, encode_images, list_gallery_images, person_name
+from FaceGallery import FaceGallery, GalleryMatch
+from GalleryStore import GalleryStore
+from GalleryWatcher import GalleryWatcher
+from Metrics import metrics
+from MotionTracking import FaceTrack, FaceTracker, MotionGate
+
+@dataclass
+class FrameResult:
+    """
+    Outcome of recognising a single frame.
+
+    Attributes:
+        locations: (top, right, bottom, left) face boxes in full-frame coordinates
+        names: Matched name per face, or "Unauthorised"
+        distances: Best gallery distance per face (inf if the gallery is empty)
+        timings: Seconds spent in each stage ("resize", "detect", "encode", "match", "escalate", "total")
+        matches: Top-k gallery candidates and margin per face
+        reused: True if the scene was static and the tracked result was returned without detection
+        scale: Downscale factor used for detection (None if detection was skipped)
+        fresh: Per face, True if it was encoded and matched in this frame; False if its name
+               was carried over from the tracker (no new evidence)
+    """
+    locations: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    distances: List[float] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+    matches: List[GalleryMatch] = field(default_factory=list)
+    reused: bool = False
+    scale: Optional[float] = None
+    fresh: List[bool] = field(default_factory=list)
+
+    @property
+    def authorised_names(self) -> List[str]:
+        """Names of all authorised faces in the frame."""
+        return [name for name in self.names if name != "Unauthorised"]
+
+    @property
+    def authorised(self) -> bool:
+        """True if any face in the frame is authorised."""
+        return bool(self.authorised_names)
+
+
+@dataclass
+class StagedFrame:
+    """
+    A frame between the stages of analyse_frame: detect_stage -> encode_stage -> match_stage.
+
+    Attributes:
+        frame: Full-resolution BGR frame
+        started: perf_counter() time the frame's latency budget started (e.g. its capture time)
+        now: monotonic() time used for the tracker's identity freshness
+        timings: Seconds spent in each stage so far
+        scale: Downscale factor used for detection
+        rgb_small_frame: Downscaled RGB frame that detection and encoding run on
+        locations: Face boxes in full-frame coordinates
+        tracks: Tracker tracks for locations (empty without motion gating)
+        pending: Tracks encoded in this frame (None: every face is encoded)
+        encode_locations: Boxes of the faces encoded in this frame
+        encodings: Encodings of those faces
+        result: The finished FrameResult; set by detect_stage already if the tracker answered
+                for a static scene
+    """
+    frame: np.ndarray
+    started: float
+    now: float
+    timings: Dict[str, float] = field(default_factory=dict)
+    scale: Optional[float] = None
+    rgb_small_frame: Optional[np.ndarray] = None
+    locations: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    tracks: List[FaceTrack] = field(default_factory=list)
+    pending: Optional[List[FaceTrack]] = None
+    encode_locations: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    encodings: List[np.ndarray] = field(default_factory=list)
+    result: Optional[FrameResult] = None
+
+
+class FaceRecogniser:
+    """
+    Face recognition system that detects and identifies faces in real-time using a webcam.
+
+    Public Interface:
+    - __init__(authorised_dir: str = None, camera_index: int = 0, log_file: str = "face_detections.csv",
+               cache_file: str = None, use_encoding_cache: bool = True, use_ann_index: bool = False,
+               multi_photo_mode: str = "all", enrollment_workers: int = None, motion_gating: bool = True,
+               log_db: str = None)
+    - run_realtime_recognition(release_on_exit: bool = True): Starts the real-time recognition loop
+    - run_pipelined_recognition(release_on_exit: bool = True): Same, with each stage on its own thread
+    - add_authorised_face(image_path: str, name: str): Adds new authorised faces
+    - add_authorised_faces(image_paths: List[str], name: str): Adds several photos of one person in parallel
+    - open_camera() / close_camera(): Powers the camera up or down, keeping loaded faces
+    - camera_healthy(): Checks that the camera still delivers frames
+    - release_resources(): Cleans up system resources
+
+    Key Methods:
+    - analyse_frame(frame): Recognises a frame once and returns a FrameResult
+    - detect_stage(frame) / encode_stage(staged) / match_stage(staged): analyse_frame split into
+      its stages, so they can run on separate threads (FramePipeline)
+    - recognise_faces(frame): Detects and recognises faces in a frame
+    - process_frame(frame, result): Annotates a frame from its FrameResult
+
+    Usage:
+        recogniser = FaceRecogniser()
+        try:
+            recogniser.run_realtime_recognition()
+        finally:
+            recogniser.release_resources()
+    """
+
+    # Configuration constants
+    FACE_MATCH_THRESHOLD = 0.6
+    CAMERA_WARMUP_TIME = 2.0
+    FRAME_SCALE_FACTOR = 0.25
+    MAX_RETRIES = 3
+    FPS_BUFFER_SIZE = 10
+    MATCH_TOP_K = 3
+    PARALLEL_ENCODE_MIN = 8
+    DUPLICATE_DISTANCE = 0.05
+
+    def __init__(self, authorised_dir: str = None, camera_index: int = 0, log_file: str = "face_detections.csv",
+                 cache_file: str = None, use_encoding_cache: bool = True, use_ann_index: bool = False,
+                 multi_photo_mode: str = "all", enrollment_workers: int = None, motion_gating: bool = True,
+                 log_db: str = None, headless: bool = False, preview=None, adaptive_detection: bool = True,
+                 latency_target: float = None, watch_gallery: bool = False, gallery_poll_interval: float = None,
+                 share_with: "FaceRecogniser" = None, decision_deadline: float = None,
+                 frame_budget: int = None, evidence=None, use_gallery_store: bool = False,
+                 gallery_store_path: str = None, gallery_store_dtype: str = "float32",
+                 gallery_from_store: bool = False):
+        """
+        Initialise the face recognition system.
+
+        Args:
+            authorised_dir: Path to directory containing authorised person images
+            camera_index: Index of the camera to use (default: 0; None: no camera, frames are
+                          passed to analyse_frame by the caller, e.g. RecognitionWorker)
+            log_file: Path to CSV file for logging detections
+            cache_file: Path to the face encoding cache (default: inside authorised_dir)
+            use_encoding_cache: Reuse cached encodings for unchanged gallery images
+            use_ann_index: Use an approximate nearest-neighbour index for large galleries
+            multi_photo_mode: "all" keeps every photo's encoding for a person, "centroid" keeps their mean
+            enrollment_workers: Processes used to encode new gallery images (default: CPU count)
+            motion_gating: Skip detection on static frames and track faces between frames
+            log_db: Optional SQLite database that also receives detections, for audit queries
+            headless: Never annotate frames or open an OpenCV window (for units without a display)
+            preview: Optional started PreviewStream that receives frames for remote viewing
+            adaptive_detection: Choose the detection scale per frame and retry unconfirmed faces at
+                                finer scales; False always detects with HOG at FRAME_SCALE_FACTOR
+            latency_target: Per-frame latency the adaptive scheduler aims for, in seconds
+            watch_gallery: Poll authorised_dir and apply added, changed and removed images live
+            gallery_poll_interval: Seconds between gallery polls (default: GalleryWatcher.POLL_INTERVAL)
+            share_with: Recogniser for another camera whose gallery and detection logger are reused
+                        instead of loading authorised_dir again (hot-reloads reach both)
+            decision_deadline: Seconds a recognition session may run before it ends with
+                               "Unauthorised"/"Timeout" (default: DecisionEngine.DEADLINE)
+            frame_budget: Frames a recognition session may analyse (default: DecisionEngine.FRAME_BUDGET)
+            evidence: Optional started EvidenceBuffer that receives captured frames and is
+                      triggered by unauthorised faces
+            use_gallery_store: Publish the gallery to a GalleryStore after every change and match
+                               from its read-only mapping
+            gallery_store_path: Path of the store (default: inside authorised_dir)
+            gallery_store_dtype: "float32" or "float16" encodings in the published store
+            gallery_from_store: Map the store another recogniser publishes instead of loading
+                                authorised_dir; with watch_gallery, follow its new versions
+
+        Raises:
+            FileNotFoundError: If authorized directory doesn't exist
+            RuntimeError: If camera cannot be initialised
+            ValueError: If multi_photo_mode is not "all" or "centroid"
+        """
+        if multi_photo_mode not in ("all", "centroid"):
+            raise ValueError(f"Unknown multi_photo_mode: {multi_photo_mode}")
+
+        if share_with is not None:
+            authorised_dir = share_with.authorised_dir
+        if authorised_dir is None:
+            script_dir = os.path.dirname(os.path.abspath(__file__))
+            authorised_dir = os.path.join(script_dir, "images/authorised")
+
+        if cache_file is None:
+            cache_file = os.path.join(authorised_dir, EncodingCache.DEFAULT_FILENAME)
+        if gallery_store_path is None:
+            gallery_store_path = os.path.join(authorised_dir, GalleryStore.DEFAULT_FILENAME)
+
+        self.authorised_dir = authorised_dir
+        self.cache_file = cache_file
+        self.use_encoding_cache = use_encoding_cache
+        self.multi_photo_mode = multi_photo_mode
+        self.enrollment_workers = enrollment_workers
+        self.camera_index = camera_index
+        self.share_with = share_with
+        self.gallery = FaceGallery(use_ann=use_ann_index) if share_with is None else share_with.gallery
+        self.encoding_cache: Optional[EncodingCache] = None
+        self.gallery_from_store = gallery_from_store and share_with is None
+        self.gallery_store = (GalleryStore(gallery_store_path, gallery_store_dtype)
+                              if (use_gallery_store or gallery_from_store) and share_with is None else None)
+        self.gallery_watcher: Optional[GalleryWatcher] = None
+        self._gallery_images = set()  # relative paths currently reflected in the gallery
+        self._tracked_generation = 0
+        self._reload_lock = threading.RLock()
+        self.motion_gating = motion_gating
+        self.motion_gate = MotionGate()
+        self.face_tracker = FaceTracker()
+        # Stages of different frames may run on different threads (FramePipeline)
+        self._tracking_lock = threading.RLock()
+        self.scheduler = DetectionScheduler(latency_target=latency_target, default_scale=self.FRAME_SCALE_FACTOR,
+                                            adaptive=adaptive_detection)
+        self.decision_engine = DecisionEngine(deadline=decision_deadline, frame_budget=frame_budget)
+        self.video_capture = None
+        self.log_file = log_file
+        self.log_db = log_db
+        self.detection_logger = None
+        self.headless = headless
+        self.preview = preview
+        if preview is not None and preview.annotate is None:
+            preview.annotate = self.process_frame
+        self.evidence = evidence
+        self.last_detection_time = {}  # To track when each person was last detected
+
+        print(f"Initialising FaceRecogniser with image directory: {self.authorised_dir}")
+
+        if not os.path.exists(self.authorised_dir):
+            raise FileNotFoundError(
+                f"Authorised faces directory not found: {self.authorised_dir}\n"
+                f"Please create it and add authorised person images."
+            )
+
+        # Start the background detection logger (creates the CSV with headers if needed)
+        self.detection_logger = (DetectionLogger(csv_path=self.log_file, sqlite_path=self.log_db)
+                                 if share_with is None else share_with.detection_logger)
+
+        self._initialise_recogniser()
+
+        if watch_gallery and self.gallery_from_store:
+            self.gallery_watcher = GalleryWatcher(self.gallery_store.path, self.reload_gallery_store,
+                                                  gallery_poll_interval, signature=self.gallery_store.signature)
+            self.gallery_watcher.start()
+        elif watch_gallery:
+            self.gallery_watcher = GalleryWatcher(self.authorised_dir, self.reload_gallery, gallery_poll_interval)
+            self.gallery_watcher.start()
+
+    @property
+    def known_face_encodings(self) -> np.ndarray:
+        """(count, 128) float32 matrix of authorised encodings."""
+        return self.gallery.encodings
+
+    @property
+    def known_face_names(self) -> List[str]:
+        """Names of the authorised encodings, in gallery row order."""
+        return self.gallery.names
+
+    def _log_detection(self, name: str, status: str, location: Tuple[int, int, int, int]):
+        """
+        Queue a face detection for the background logger.
+
+        Args:
+            name: Name of the detected person or "Unauthorised"
+            status: "Authorised" or "Unauthorised"
+            location: Tuple of (top, right, bottom, left) coordinates
+        """
+        self.detection_logger.log(name, status, location)
+
+    def _should_log_detection(self, name: str) -> bool:
+        """
+        Determine if a detection should be logged to prevent duplicate entries.
+
+        Args:
+            name: Name of the detected person
+
+        Returns:
+            bool: True if the detection should be logged
+        """
+        current_time = time.time()
+        # Only log if this person hasn't been detected in the last 10 seconds
+        if name not in self.last_detection_time or (current_time - self.last_detection_time[name]) > 10:
+            self.last_detection_time[name] = current_time
+            return True
+        return False
+
+    # ========== PUBLIC METHODS ==========
+
+    def run_realtime_recognition(self, release_on_exit: bool = True, show_window: bool = None):
+        """
+        Run continuous face recognition with error recovery.
+
+        Args:
+            release_on_exit: Release the camera when the loop ends. A resident service passes
+                             False to keep the camera open between recognition sessions.
+            show_window: Annotate and display frames (default: not headless)
+
+        Returns:
+            The decision_engine outcome: "Authorised", "Unauthorised" or "Timeout";
+            None if the window was closed or recognition was interrupted
+        """
+        if self.video_capture is None or not self.video_capture.isOpened():
+            self.open_camera()
+        self._reset_tracking()
+        if show_window is None:
+            show_window = not self.headless
+
+        print("Starting real-time recognition." + (" Press 'q' to quit." if show_window else " (headless)"))
+        frame_count = 0
+        start_time = time.time()
+        fps_buffer = deque(maxlen=self.FPS_BUFFER_SIZE)
+        retry_count = 0
+        self.decision_engine.start()
+
+        try:
+            while True:
+                # Checked before reading so a dead camera cannot hold the door past the deadline
+                decision = self.decision_engine.check()
+                if decision is not None:
+                    return decision.outcome
+
+                ret, frame = self.video_capture.read()
+
+                if not ret or frame is None:
+                    retry_count += 1
+                    if retry_count > self.MAX_RETRIES:
+                        print("Camera error: Attempting to reconnect...")
+                        self.video_capture.release()
+                        self._initialise_camera()
+                        retry_count = 0
+                        continue
+
+                    print(f"Warning: Frame read failed (attempt {retry_count}/{self.MAX_RETRIES})")
+                    time.sleep(0.5)
+                    continue
+
+                retry_count = 0
+                frame_count += 1
+                if self.evidence is not None:
+                    self.evidence.push(frame)
+
+                result = self.analyse_frame(frame)
+                if self.evidence is not None and "Unauthorised" in result.names:
+                    self.evidence.trigger("unauthorised")
+                decision = self.decision_engine.add(result)
+                if decision is not None:
+                    return decision.outcome
+
+                # Calculate FPS
+                elapsed = time.time() - start_time
+                current_fps = frame_count / elapsed
+                fps_buffer.append(current_fps)
+                smoothed_fps = sum(fps_buffer) / len(fps_buffer)
+                metrics.set("recognition.fps", smoothed_fps)
+
+                if not show_window:
+                    # No drawing here; the preview thread annotates its own copy at its own rate
+                    if self.preview is not None:
+                        self.preview.submit(frame, result)
+                    continue
+
+                processed_frame = self.process_frame(frame, result)
+                cv2.putText(processed_frame, f"FPS: {smoothed_fps:.1f}", (10, 30),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                if self.preview is not None:
+                    self.preview.submit(processed_frame)
+
+                with metrics.timer("recognition.display"):
+                    cv2.imshow('Face Recognition', processed_frame)
+                    key = cv2.waitKey(1)
+                if key & 0xFF == ord('q'):
+                    break
+
+        except KeyboardInterrupt:
+            print("\nStopping recognition...")
+        except Exception as e:
+            print(f"Error during recognition: {e}")
+        finally:
+            if release_on_exit:
+                self.release_resources()
+            elif show_window:
+                cv2.destroyAllWindows()
+
+    def run_pipelined_recognition(self, release_on_exit: bool = True, show_window: bool = None):
+        """
+        Run recognition on a threaded capture/detect/encode/match/render pipeline.
+
+        Capture never waits on recognition and every stage works on the newest frame, so the
+        decision is made on a fresh image even when detection is slower than the camera.
+
+        Args:
+            release_on_exit: Release the camera when recognition ends
+            show_window: Display annotated frames (default: not headless)
+
+        Returns:
+            The decision_engine outcome: "Authorised", "Unauthorised" or "Timeout";
+            None if the window was closed or recognition was interrupted
+        """
+        from FramePipeline import FramePipeline
+
+        if self.video_capture is None or not self.video_capture.isOpened():
+            self.open_camera()
+        self._reset_tracking()
+
+        if show_window is None:
+            show_window = not self.headless
+
+        print("Starting pipelined recognition." + (" Press 'q' to quit." if show_window else " (headless)"))
+        pipeline = FramePipeline(self, show_window=show_window)
+        pipeline.start()
+        try:
+            while True:
+                # Without a window there is nothing to render between checks
+                decision = pipeline.wait_for_decision(timeout=0.01 if show_window else 0.5)
+                if decision is not None:
+                    return decision.outcome
+                if show_window and not pipeline.render_pending():
+                    break
+        except KeyboardInterrupt:
+            print("\nStopping recognition...")
+        except Exception as e:
+            print(f"Error during recognition: {e}")
+        finally:
+            pipeline.stop()
+            print(f"Pipeline stats: {pipeline.stats()}")
+            if release_on_exit:
+                self.release_resources()
+            elif show_window:
+                cv2.destroyAllWindows()
+
+    def analyse_frame(self, frame: np.ndarray) -> FrameResult:
+        """
+        Run detection, encoding and matching once on a frame.
+
+        The returned result is the single source for annotation, logging and the authorise
+        decision, so the expensive stages never run twice on the same frame.
+
+        Args:
+            frame: Input frame from camera (BGR)
+
+        Returns:
+            FrameResult with locations, names, distances and per-stage timings
+        """
+        staged = self.detect_stage(frame)
+        self.encode_stage(staged)
+        return self.match_stage(staged)
+
+    def detect_stage(self, frame: np.ndarray, started: float = None) -> StagedFrame:
+        """
+        First stage of analyse_frame: motion gate, downscale, detection and tracking.
+
+        Args:
+            frame: Input frame from camera (BGR)
+            started: perf_counter() time the frame's latency budget began (default: now)
+
+        Returns:
+            StagedFrame for encode_stage; its result is already set if nothing moved and every
+            tracked identity is still fresh
+        """
+        stage_start = time.perf_counter()
+        staged = StagedFrame(frame, stage_start if started is None else started, time.monotonic())
+        timings = staged.timings
+
+        with self._tracking_lock:
+            if self.gallery.generation != self._tracked_generation:
+                # People were replaced or removed: identities held by the tracker may be stale
+                self.face_tracker.clear()
+                self.motion_gate.reset()
+                self._tracked_generation = self.gallery.generation
+
+            static = self.motion_gating and self.motion_gate.is_static(frame)
+            if static:
+                tracks = self.face_tracker.visible_tracks()
+                if not any(self.face_tracker.needs_encoding(track, staged.now) for track in tracks):
+                    # Nothing moved and every tracked identity is still fresh
+                    self.face_tracker.reuses += len(tracks)
+                    timings["total"] = time.perf_counter() - staged.started
+                    staged.result = FrameResult([track.box for track in tracks],
+                                                [track.name for track in tracks],
+                                                [track.distance for track in tracks], timings,
+                                                [track.match for track in tracks], reused=True,
+                                                fresh=[False] * len(tracks))
+                    self._record_metrics(staged.result, 0)
+                    return staged
+
+        staged.scale = self.scheduler.choose_scale(frame.shape)
+        staged.rgb_small_frame = self._prepare_frame(frame, staged.scale)
+        stage_end = time.perf_counter()
+        timings["resize"] = stage_end - stage_start
+        if static:
+            # Faces have not moved, so their last boxes stand in for a new detection pass
+            staged.locations = [track.box for track in tracks]
+            timings["detect"] = 0.0
+        else:
+            staged.locations = self._scale_locations(
+                self._detect_faces(staged.rgb_small_frame, self.scheduler.coarse_model), staged.scale)
+            timings["detect"] = time.perf_counter() - stage_end
+            self.scheduler.record_detection(staged.rgb_small_frame.shape[0] * staged.rgb_small_frame.shape[1],
+                                            timings["detect"])
+        self.scheduler.observe_faces(staged.locations)
+
+        if self.motion_gating:
+            with self._tracking_lock:
+                staged.tracks = self.face_tracker.update(staged.locations)
+                staged.pending = [track for track in staged.tracks
+                                  if self.face_tracker.needs_encoding(track, staged.now)]
+            # Snapshot the boxes: a later frame's detect_stage moves the tracks on
+            staged.encode_locations = [track.box for track in staged.pending]
+        else:
+            staged.encode_locations = staged.locations
+        return staged
+
+    def encode_stage(self, staged: StagedFrame):
+        """Second stage of analyse_frame: encode the faces that need it (nothing if already finished)."""
+        if staged.result is not None:
+            return
+        start = time.perf_counter()
+        staged.encodings = self._encode_faces(staged.rgb_small_frame,
+                                              self._rescale_locations(staged.encode_locations, staged.scale))
+        staged.timings["encode"] = time.perf_counter() - start
+        self.scheduler.record_encoding(len(staged.encodings), staged.timings["encode"])
+
+    def match_stage(self, staged: StagedFrame) -> FrameResult:
+        """
+        Last stage of analyse_frame: match, escalate unconfirmed faces, update tracks and log.
+
+        Returns:
+            FrameResult with locations, names, distances and per-stage timings
+        """
+        if staged.result is not None:
+            return staged.result
+        timings = staged.timings
+        start = time.perf_counter()
+        names, distances, matches = self._match_faces(staged.encodings)
+        stage_end = time.perf_counter()
+        timings["match"] = stage_end - start
+
+        if self.scheduler.adaptive and "Unauthorised" in names:
+            # The frame's latency budget started when it did, not when this stage did
+            self._escalate(staged.frame, staged.encode_locations, staged.scale, names, distances, matches,
+                           staged.started)
+            timings["escalate"] = time.perf_counter() - stage_end
+
+        fresh = [True] * len(staged.locations)
+        if staged.pending is not None:
+            tracks, pending = staged.tracks, staged.pending
+            with self._tracking_lock:
+                for track, name, distance, match in zip(pending, names, distances, matches):
+                    track.assign(name, distance, match, staged.now)
+                self.face_tracker.encodes += len(pending)
+                self.face_tracker.reuses += len(tracks) - len(pending)
+            fresh = [any(track is encoded for encoded in pending) for track in tracks]
+            names = [track.name for track in tracks]
+            distances = [track.distance for track in tracks]
+            matches = [track.match for track in tracks]
+
+        self._log_result(staged.locations, names)
+        timings["total"] = time.perf_counter() - staged.started
+
+        staged.result = FrameResult(staged.locations, names, distances, timings, matches, scale=staged.scale,
+                                    fresh=fresh)
+        self._record_metrics(staged.result, len(staged.encodings))
+        return staged.result
+
+    def recognise_faces(self, frame: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], List[str]]:
+        """
+        Detect and recognise faces in a frame.
+
+        Args:
+            frame: Input frame from camera
+
+        Returns:
+            Tuple of (face_locations, names) where:
+            - face_locations: List of (top, right, bottom, left) coordinates
+            - names: List of corresponding names or "Unauthorised"
+        """
+        result = self.analyse_frame(frame)
+        return result.locations, result.names
+
+    def process_frame(self, frame: np.ndarray, result: FrameResult = None) -> np.ndarray:
+        """
+        Annotate a frame with face boxes and names.
+
+        Args:
+            frame: Input frame from camera
+            result: Recognition result for this frame; recognised here if omitted
+
+        Returns:
+            Annotated frame with face boxes and names
+        """
+        if result is None:
+            result = self.analyse_frame(frame)
+        face_locations, names = result.locations, result.names
+        start = time.perf_counter()
+
+        for (top, right, bottom, left), name in zip(face_locations, names):
+            # Expand the box slightly for better visibility
+            width = right - left
+            height = bottom - top
+            left = max(0, left - int(width * 0.125))
+            right = min(frame.shape[1], right + int(width * 0.125))
+            top = max(0, top - int(height * 0.125))
+            bottom = min(frame.shape[0], bottom + int(height * 0.125))
+
+            # Set box color based on authorization status
+            box_colour = (0, 0, 255) if name == "Unauthorised" else (0, 255, 0)
+
+            # Draw face box and label
+            cv2.rectangle(frame, (left, top), (right, bottom), box_colour, 2)
+            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), box_colour, cv2.FILLED)
+            font = cv2.FONT_HERSHEY_DUPLEX
+            cv2.putText(frame, name, (left + 6, bottom - 6), font, 0.8, (255, 255, 255), 1)
+
+        metrics.observe("recognition.annotate", time.perf_counter() - start)
+        return frame
+
+    def add_authorised_face(self, image_path: str, name: str):
+        """
+        Add a new authorised face to the system.
+
+        Args:
+            image_path: Path to the image file
+            name: Name to associate with the face
+
+        Raises:
+            Exception: If face cannot be loaded or encoded
+        """
+        try:
+            image = face_recognition.load_image_file(image_path)
+            face_encodings = face_recognition.face_encodings(image)
+
+            if face_encodings:
+                if self.gallery.contains(name, face_encodings[0], self.DUPLICATE_DISTANCE):
+                    print(f"{name} already has this face; not added again")
+                    return
+                self.gallery.add(name, face_encodings[0])
+                print(f"Added new authorised person: {name}")
+                self._publish_gallery()
+            else:
+                print(f"Warning: No faces found in {image_path}")
+
+        except Exception as e:
+            print(f"Error adding authorised face: {e}")
+            raise
+
+    def add_authorised_faces(self, image_paths: List[str], name: str) -> EnrollmentReport:
+        """
+        Add several photos of one authorised person, encoding them across a process pool.
+
+        Depending on multi_photo_mode every photo's encoding is stored under the name, or only
+        their centroid.
+
+        Args:
+            image_paths: Paths to the image files
+            name: Name to associate with the faces
+
+        Returns:
+            EnrollmentReport with throughput and per-image failures
+        """
+        encodings, report = encode_images(image_paths, workers=self.enrollment_workers)
+        self._add_person(name, [encoding for encoding in encodings.values() if encoding is not None])
+        print(report.summary())
+        self._publish_gallery()
+        return report
+
+    def replace_authorised_person(self, image_paths: List[str], name: str) -> EnrollmentReport:
+        """
+        Atomically swap a person's encodings for those of new photos.
+
+        Recognition keeps running on the old encodings until the new ones are swapped in. If no
+        face is found in any photo the person is left unchanged.
+
+        Args:
+            image_paths: Paths to the new image files
+            name: Person to update (added if not yet authorised)
+
+        Returns:
+            EnrollmentReport for the new photos
+        """
+        encodings, report = encode_images(image_paths, workers=self.enrollment_workers)
+        found = [encoding for encoding in encodings.values() if encoding is not None]
+        if found:
+            self.gallery.replace(name, self._person_encodings(found))
+            print(f"Replaced authorised person: {name} ({len(found)} photo(s))")
+            self._publish_gallery()
+        else:
+            print(f"Warning: No faces found for {name}; gallery unchanged")
+        return report
+
+    def remove_authorised_person(self, name: str) -> int:
+        """
+        Revoke a person immediately; frames matched after this call no longer authorise them.
+
+        Their images are not deleted: remove them from authorised_dir as well, or the next full
+        load (or a change to their images) restores them.
+
+        Args:
+            name: Person to remove
+
+        Returns:
+            int: Number of encodings removed
+        """
+        removed = self.gallery.remove(name)
+        print(f"Removed authorised person: {name} ({removed} encoding(s))" if removed
+              else f"Warning: {name} is not in the gallery")
+        if removed:
+            self._publish_gallery()
+        return removed
+
+    def reload_gallery(self) -> Dict[str, int]:
+        """
+        Apply changes in authorised_dir to the running gallery.
+
+        Only new or changed images are re-encoded, and only the people they belong to are
+        replaced, in one atomic gallery update; the frame loop never waits on it. Encodings added
+        through the API for an affected person are replaced by those from the directory.
+
+        Returns:
+            Name -> number of gallery entries now held, for every affected person (0: removed)
+        """
+        with self._reload_lock:
+            rel_paths, stale = self._refresh_encoding_cache()
+            removed = self._gallery_images - set(rel_paths)
+            affected = {person_name(rel_path) for rel_path in list(stale) + list(removed)}
+            if not affected:
+                return {}
+            by_name = self._encodings_by_name([rel_path for rel_path in rel_paths
+                                               if person_name(rel_path) in affected])
+            changes = {name: self._person_encodings(by_name.get(name, [])) for name in sorted(affected)}
+            self.gallery.update(changes)
+            self._gallery_images = set(rel_paths)
+            self._publish_gallery()
+
+        for name, encodings in changes.items():
+            print(f"Gallery reloaded: {name} ({len(encodings)} encoding(s))" if encodings
+                  else f"Gallery reloaded: {name} removed")
+        metrics.inc("gallery.reloads")
+        return {name: len(encodings) for name, encodings in changes.items()}
+
+    def reload_gallery_store(self) -> int:
+        """
+        Switch to the store's newest version (gallery_from_store recognisers).
+
+        Returns:
+            int: The mapped version
+        """
+        with self._reload_lock:
+            version = self.gallery.map_store(self.gallery_store)
+        print(f"Gallery store version {version} mapped ({len(self.gallery)} encoding(s))")
+        metrics.inc("gallery.reloads")
+        return version
+
+    def open_camera(self):
+        """
+        Open (or re-open) the camera without reloading the authorised faces.
+
+        Raises:
+            RuntimeError: If camera cannot be opened
+        """
+        self.close_camera()
+        self._initialise_camera()
+
+    def close_camera(self):
+        """Release the camera while keeping the loaded face encodings in memory."""
+        if self.video_capture is not None:
+            self.video_capture.release()
+            self.video_capture = None
+
+    def camera_healthy(self) -> bool:
+        """
+        Check that the camera is open and still delivers frames.
+
+        Returns:
+            bool: True if a frame could be grabbed
+        """
+        if self.video_capture is None or not self.video_capture.isOpened():
+            return False
+        return bool(self.video_capture.grab())
+
+    def release_resources(self):
+        """Clean up all system resources."""
+        if self.gallery_watcher is not None:
+            self.gallery_watcher.stop()
+        self.close_camera()
+        if self.detection_logger is not None:
+            self.detection_logger.flush(timeout=self.detection_logger.flush_interval * 2)
+        if not self.headless:
+            cv2.destroyAllWindows()
+        print("Resources released")
+
+    # ========== PRIVATE METHODS ==========
+
+    def _prepare_frame(self, frame: np.ndarray, scale: float = None) -> np.ndarray:
+        """Downscale a BGR frame (by FRAME_SCALE_FACTOR unless given) and convert it to contiguous RGB for dlib."""
+        scale = self.FRAME_SCALE_FACTOR if scale is None else scale
+        small_frame = frame if scale == 1.0 else cv2.resize(frame, (0, 0), fx=scale, fy=scale)
+        return np.ascontiguousarray(small_frame[:, :, ::-1])
+
+    def _detect_faces(self, rgb_small_frame: np.ndarray, model: str = "hog") -> List[Tuple[int, int, int, int]]:
+        """Return face boxes in downscaled-frame coordinates."""
+        return face_recognition.face_locations(rgb_small_frame, model=model)
+
+    def _encode_faces(self, rgb_small_frame: np.ndarray,
+                      face_locations: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+        """Return one 128-d encoding per detected face."""
+        return face_recognition.face_encodings(rgb_small_frame, face_locations)
+
+    def _match_faces(self, face_encodings: List[np.ndarray]) -> Tuple[List[str], List[float], List[GalleryMatch]]:
+        """
+        Match all encodings of a frame against the authorised gallery in one batched pass.
+
+        Returns:
+            Tuple of (names, best distances, top-k matches), one entry per encoding
+        """
+        matches = self.gallery.match(face_encodings, k=self.MATCH_TOP_K)
+        names = [match.best_name if match.best_distance < self.FACE_MATCH_THRESHOLD else "Unauthorised"
+                 for match in matches]
+        distances = [match.best_distance for match in matches]
+        return names, distances, matches
+
+    def _scale_locations(self, face_locations: List[Tuple[int, int, int, int]],
+                         scale: float = None) -> List[Tuple[int, int, int, int]]:
+        """Scale face locations found in a frame downscaled by scale back to original frame size."""
+        scale = self.FRAME_SCALE_FACTOR if scale is None else scale
+        return self._rescale_locations(face_locations, 1.0 / scale)
+
+    @staticmethod
+    def _rescale_locations(face_locations: List[Tuple[int, int, int, int]],
+                           factor: float) -> List[Tuple[int, int, int, int]]:
+        """Multiply (top, right, bottom, left) boxes by a factor."""
+        return [(int(round(top * factor)), int(round(right * factor)),
+                 int(round(bottom * factor)), int(round(left * factor)))
+                for (top, right, bottom, left) in face_locations]
+
+    def _escalate(self, frame: np.ndarray, face_locations: List[Tuple[int, int, int, int]], scale: float,
+                  names: List[str], distances: List[float], matches: List[GalleryMatch], started: float):
+        """
+        Retry unmatched faces on finer crops or another detector while the latency budget allows.
+
+        names, distances and matches are updated in place for faces that matched better.
+
+        Args:
+            frame: Full-resolution BGR frame
+            face_locations: Full-frame boxes, one per entry in names
+            scale: Scale of the coarse pass
+            started: perf_counter() value at which work on this frame began
+        """
+        for index, (box, name) in enumerate(zip(face_locations, names)):
+            if name != "Unauthorised":
+                continue
+            for level in self.scheduler.escalations(box, scale, time.perf_counter() - started):
+                level_start = time.perf_counter()
+                encoding = self._encode_crop(frame, box, level)
+                self.scheduler.record_escalation(level, self.scheduler.crop_pixels(box, level.scale),
+                                                 time.perf_counter() - level_start)
+                metrics.inc(f"recognition.escalations.{level.model}")
+                if encoding is None:
+                    continue
+                (new_name,), (new_distance,), (new_match,) = self._match_faces([encoding])
+                if new_distance < distances[index]:
+                    names[index], distances[index], matches[index] = new_name, new_distance, new_match
+                if new_name != "Unauthorised":
+                    metrics.inc("recognition.escalations_confirmed")
+                    break
+
+    def _encode_crop(self, frame: np.ndarray, box: Tuple[int, int, int, int],
+                     level: DetectionLevel) -> Optional[np.ndarray]:
+        """Re-detect and encode one face in a padded crop around box at a level's scale and detector."""
+        crop_top, crop_right, crop_bottom, crop_left = self.scheduler.crop_box(box, frame.shape)
+        rgb_crop = self._prepare_frame(frame[crop_top:crop_bottom, crop_left:crop_right], level.scale)
+        found = self._detect_faces(rgb_crop, level.model)
+        if found:
+            location = max(found, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+        else:
+            # Fall back to the coarse box mapped into the crop
+            top, right, bottom, left = box
+            location = self._rescale_locations([(top - crop_top, right - crop_left,
+                                                 bottom - crop_top, left - crop_left)], level.scale)[0]
+        encodings = self._encode_faces(rgb_crop, [location])
+        return encodings[0] if encodings else None
+
+    def _reset_tracking(self):
+        """Forget motion and track state so a new session starts from a full detection."""
+        with self._tracking_lock:
+            self.motion_gate.reset()
+            self.face_tracker.clear()
+
+    def _record_metrics(self, result: FrameResult, encoded: int):
+        """Feed a frame's stage timings and face counts into the metrics registry."""
+        if not metrics.enabled:
+            return
+        for stage, seconds in result.timings.items():
+            metrics.observe(f"recognition.{stage}", seconds)
+        metrics.inc("recognition.frames")
+        if result.scale is not None:
+            metrics.set("recognition.scale", result.scale)
+        if result.reused:
+            metrics.inc("recognition.frames_reused")
+        metrics.inc("recognition.faces", len(result.locations))
+        metrics.inc("recognition.faces_encoded", encoded)
+        if result.authorised:
+            metrics.inc("recognition.authorised_frames")
+
+    def _log_result(self, face_locations: List[Tuple[int, int, int, int]], names: List[str]):
+        """Log each detection in a frame, rate-limited per name."""
+        for (location, name) in zip(face_locations, names):
+            status = "Authorised" if name != "Unauthorised" else "Unauthorised"
+            if self._should_log_detection(name):
+                self._log_detection(name, status, location)
+
+    def _initialise_recogniser(self):
+        """Open and warm up the camera on a worker thread while the faces load on this one."""
+        if self.camera_index is None:
+            self._load_authorised_faces()
+            return
+        if self.share_with is not None:
+            self._initialise_camera()
+            return
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="CameraInit") as executor:
+            camera = executor.submit(self._initialise_camera)
+            try:
+                self._load_authorised_faces()
+                camera.result()
+            except BaseException:
+                # Never leave the camera open behind a constructor that failed
+                camera.exception()  # waits for the camera thread
+                self.close_camera()
+                raise
+
+    def _load_authorised_faces(self):
+        """Load all authorised faces from the specified directory, reusing cached encodings"""
+        if self.gallery_from_store:
+            self._map_gallery_store()
+            return
+        print(f"Loading authorised faces from: {self.authorised_dir}")
+
+        try:
+            # Without the on-disk cache, the same bookkeeping is kept in memory for hot-reload
+            self.encoding_cache = EncodingCache(self.cache_file if self.use_encoding_cache else None)
+            rel_paths, _ = self._refresh_encoding_cache()
+
+            for name, encodings in self._encodings_by_name(rel_paths).items():
+                self._add_person(name, encodings)
+                print(f"Loaded authorised person: {name} ({len(encodings)} photo(s))")
+            self._gallery_images = set(rel_paths)
+
+            if len(self.gallery) == 0:
+                raise ValueError("No authorised faces found in the directory")
+
+        except Exception as e:
+            print(f"Error loading image files: {e}")
+            raise
+        self._publish_gallery()
+
+    def _map_gallery_store(self):
+        """Match from the published gallery store instead of loading authorised_dir."""
+        started = time.perf_counter()
+        version = self.gallery.map_store(self.gallery_store)
+        if len(self.gallery) == 0:
+            raise ValueError(f"Gallery store {self.gallery_store.path} is empty")
+        print(f"Mapped gallery store {self.gallery_store.path} version {version}: {len(self.gallery)} encoding(s) "
+              f"of {len(set(self.gallery.names))} people in {time.perf_counter() - started:.3f}s")
+
+    def _publish_gallery(self):
+        """Publish the gallery to the store, if enabled, and match from the new mapping."""
+        if self.gallery_store is None or self.gallery_from_store:
+            return
+        with self._reload_lock:
+            try:
+                version = self.gallery.publish(self.gallery_store)
+            except OSError as e:
+                print(f"Warning: Could not publish gallery store: {e}")
+                return
+        print(f"Gallery store version {version} published ({len(self.gallery)} encoding(s))")
+
+    def _refresh_encoding_cache(self) -> Tuple[List[str], List[str]]:
+        """
+        Bring the encoding cache up to date with authorised_dir, encoding only new or changed images.
+
+        Returns:
+            Tuple of (all gallery images, images encoded now), as paths relative to authorised_dir
+        """
+        cache = self.encoding_cache
+        cache.hits = cache.misses = 0
+        rel_paths = list_gallery_images(self.authorised_dir)
+        stale = cache.stale_paths(self.authorised_dir, rel_paths)
+        encoded = self._encode_image_files([os.path.join(self.authorised_dir, rel_path) for rel_path in stale])
+        for rel_path in stale:
+            full_path = os.path.join(self.authorised_dir, rel_path)
+            if full_path in encoded:
+                cache.put(self.authorised_dir, rel_path, encoded[full_path])
+        cache.prune(rel_paths)
+        if self.use_encoding_cache:
+            print(f"Encoding cache: {cache.hits} hit(s), {cache.misses} re-encoded")
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"Warning: Could not write encoding cache: {e}")
+        return rel_paths, stale
+
+    def _encodings_by_name(self, rel_paths: List[str]) -> Dict[str, List[np.ndarray]]:
+        """Group the cached encodings of gallery images by person."""
+        encodings_by_name = {}
+        for rel_path in rel_paths:
+            encoding = self.encoding_cache.get(rel_path)
+            if encoding is None:
+                print(f"Warning: No faces found in {rel_path}")
+                continue
+            encodings_by_name.setdefault(person_name(rel_path), []).append(encoding)
+        return encodings_by_name
+
+    def _person_encodings(self, encodings: List[np.ndarray]) -> List[np.ndarray]:
+        """Encodings to store for one person according to multi_photo_mode."""
+        if self.multi_photo_mode == "centroid" and len(encodings) > 1:
+            return [np.mean(np.asarray(encodings, dtype=np.float32), axis=0)]
+        return list(encodings)
+
+    def _add_person(self, name: str, encodings: List[np.ndarray]):
+        """Add a person's encodings to the gallery according to multi_photo_mode."""
+        for encoding in self._person_encodings(encodings):
+            self.gallery.add(name, encoding)
+
+    def _encode_image_files(self, image_paths: List[str]) -> Dict[str, Optional[np.ndarray]]:
+        """
+        Encode gallery images, using a process pool for larger batches.
+
+        Returns:
+            Image path -> encoding or None; images that could not be read are omitted
+        """
+        if len(image_paths) < self.PARALLEL_ENCODE_MIN or self.enrollment_workers == 1:
+            encodings = {}
+            for image_path in image_paths:
+                try:
+                    encodings[image_path] = self._encode_image_file(image_path)
+                except Exception as e:
+                    print(f"Error: Could not encode {image_path}: {e}")
+            return encodings
+
+        encodings, report = encode_images(image_paths, workers=self.enrollment_workers)
+        print(report.summary())
+        for image_path, error in report.failures.items():
+            print(f"Error: Could not encode {image_path}: {error}")
+        return encodings
+
+    def _encode_image_file(self, image_path: str) -> Optional[np.ndarray]:
+        """
+        Decode an image and compute the encoding of its first face.
+
+        Args:
+            image_path: Path to the image file
+
+        Returns:
+            128-d face encoding, or None if no face was found
+        """
+        print(f"Processing image: {image_path}")
+        image = face_recognition.load_image_file(image_path)
+        face_encodings = face_recognition.face_encodings(image)
+
+        if not face_encodings:
+            return None
+        if len(face_encodings) > 1:
+            print(f"Warning: Multiple faces in {os.path.basename(image_path)}. Using first face.")
+        return face_encodings[0]
+
+    def _initialise_camera(self, width: int = 1280, height: int = 720):
+        """
+        Initialise video capture with warmup period.
+
+        Args:
+            width: Desired frame width
+            height: Desired frame height
+
+        Raises:
+            RuntimeError: If camera cannot be opened
+        """
+        print("Initialising camera...")
+        self.video_capture = cv2.VideoCapture(self.camera_index)
+
+        if not self.video_capture.isOpened():
+            raise RuntimeError("Camera could not be opened. Check if it's connected or in use.")
+
+        self.video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        actual_width = self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)
+        actual_height = self.video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        print(f"Camera resolution set to: {int(actual_width)}x{int(actual_height)}")
+
+        time.sleep(self.CAMERA_WARMUP_TIME)
+        print("Camera ready")
+
+
+if __name__ == "__main__":
+    try:
+        recogniser = FaceRecogniser()
+        recogniser.run_realtime_recognition()
+    except Exception as e:
+        print(f"Error: {e}")
+    finally:
+        if 'recogniser' in locals():
             recogniser.release_resources()
\ No newline at end of file
@@ -0,0 +1,332 @@
+"""
+File: FramePipeline.py
+
+Description:
+Threaded capture -> detect -> encode -> match -> render pipeline for FaceRecogniser.
+The serial recognition loop reads, recognises, draws and displays on one thread, so a slow HOG
+pass stalls capture and decisions are made on frames that have been sitting in OpenCV's buffer.
+Here every stage runs on its own thread and stages are joined by small bounded queues with a
+latest-wins drop policy: a slow stage never backs up the ones before it, it simply works on the
+newest frame available when it is ready.
+
+Key Features:
+- Capture thread that continuously drains the camera and only ever holds the newest frame.
+- Detection, encoding and matching stages joined by bounded, latest-wins queues; each runs
+  the recogniser's public stage (detect_stage/encode_stage/match_stage), so the pipeline gets
+  the same motion gate, tracker and adaptive scheduling as analyse_frame.
+- Render stage fed the same way, so display can never block recognition.
+- Per-stage queue depth, drop and throughput counters, and capture-to-decision latency.
+- Matched frames feed the recogniser's DecisionEngine, so a session ends within its deadline.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import cv2
+
+from DecisionEngine import Decision
+from FacialRecognition import FaceRecogniser, StagedFrame
+from Metrics import metrics
+
+
+class LatestQueue:
+    """
+    Bounded, thread-safe queue that drops the oldest item when full.
+
+    Attributes:
+        name: Stage name used in statistics
+        puts: Number of items offered
+        drops: Number of items discarded because a newer one arrived
+    """
+
+    def __init__(self, name: str, maxsize: int = 1):
+        self.name = name
+        self.maxsize = maxsize
+        self.puts = 0
+        self.drops = 0
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def put(self, item: Any):
+        """Add an item, discarding the oldest queued item if the queue is full."""
+        with self._condition:
+            self.puts += 1
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.drops += 1
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Remove and return the oldest item.
+
+        Args:
+            timeout: Seconds to wait for an item (None: wait until available or closed)
+
+        Returns:
+            The item, or None on timeout or when the queue is closed
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                return None
+            return self._items.popleft()
+
+    def close(self):
+        """Wake up all waiting consumers; subsequent gets return None once drained."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def depth(self) -> int:
+        """Number of items currently queued."""
+        with self._condition:
+            return len(self._items)
+
+
+class FramePipeline:
+    """
+    Staged, multi-threaded recognition pipeline driven by a FaceRecogniser.
+
+    Public Interface:
+    - start(): Starts the capture and worker threads
+    - wait_for_decision(timeout): Blocks until the recogniser's decision engine decides
+    - render_pending(): Draws and shows the newest result (call from the display thread)
+    - stats(): Per-stage queue depth, drops and throughput
+    - stop(): Stops all threads
+
+    Usage:
+        pipeline = FramePipeline(recogniser)
+        pipeline.start()
+        try:
+            while pipeline.wait_for_decision(0.01) is None:
+                if not pipeline.render_pending():
+                    break
+        finally:
+            pipeline.stop()
+    """
+
+    QUEUE_SIZE = 1
+    STAGE_TIMEOUT = 0.1
+    LATENCY_BUFFER_SIZE = 100
+
+    def __init__(self, recogniser: FaceRecogniser, show_window: bool = True, queue_size: int = None):
+        """
+        Initialise the pipeline without starting any threads.
+
+        Args:
+            recogniser: Recogniser providing the camera and the detect/encode/match stages
+            show_window: Feed the render stage and display annotated frames
+            queue_size: Capacity of each inter-stage queue (default: QUEUE_SIZE)
+        """
+        self.recogniser = recogniser
+        self.show_window = show_window
+        queue_size = queue_size or self.QUEUE_SIZE
+
+        self.captured = LatestQueue("capture", 1)
+        self.detected = LatestQueue("detect", queue_size)
+        self.encoded = LatestQueue("encode", queue_size)
+        self.rendered = LatestQueue("render", 1)
+        self.queues = [self.captured, self.detected, self.encoded, self.rendered]
+        for stage_queue in self.queues:
+            metrics.gauge_callback(f"pipeline.{stage_queue.name}_depth", stage_queue.depth)
+            metrics.gauge_callback(f"pipeline.{stage_queue.name}_drops", lambda q=stage_queue: q.drops)
+
+        self.processed: Dict[str, int] = {"capture": 0, "detect": 0, "encode": 0, "match": 0, "render": 0}
+        self.latencies = deque(maxlen=self.LATENCY_BUFFER_SIZE)
+        self.decision: Optional[Decision] = None
+        self.error: Optional[Exception] = None
+
+        self._decision_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._started_at = None
+
+    # ========== PUBLIC METHODS ==========
+
+    def start(self):
+        """Start the capture thread and the detection, encoding and matching stages; starts a decision session."""
+        self._stop_event.clear()
+        self._decision_event.clear()
+        self.decision = None
+        self.recogniser.decision_engine.start()
+        self._started_at = time.perf_counter()
+        for target in (self._capture_loop, self._detect_loop, self._encode_loop, self._match_loop):
+            thread = threading.Thread(target=target, name=f"FramePipeline-{target.__name__}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wait_for_decision(self, timeout: Optional[float] = None) -> Optional[Decision]:
+        """
+        Wait for the session's decision.
+
+        The deadline is also checked here, so a session still ends on time while a slow stage
+        holds up the match stage.
+
+        Args:
+            timeout: Seconds to wait (None: wait until the match stage decides)
+
+        Returns:
+            The Decision, or None if none yet
+
+        Raises:
+            Exception: Re-raises a fatal error from a pipeline thread
+        """
+        self._decision_event.wait(timeout)
+        if self.error is not None:
+            raise self.error
+        if self.decision is None:
+            self.decision = self.recogniser.decision_engine.check()
+        return self.decision
+
+    def render_pending(self) -> bool:
+        """
+        Annotate and display the newest matched frame, if any.
+
+        Must be called from the thread that owns the OpenCV window.
+
+        Returns:
+            bool: False if the user asked to quit ('q'), True otherwise
+        """
+        packet = self.rendered.get(timeout=0)
+        if packet is not None:
+            frame, result = packet
+            annotated = self.recogniser.process_frame(frame, result)
+            cv2.putText(annotated, f"FPS: {self.fps():.1f}", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            if self.recogniser.preview is not None:
+                self.recogniser.preview.submit(annotated)
+            cv2.imshow('Face Recognition', annotated)
+            self.processed["render"] += 1
+        return not (cv2.waitKey(1) & 0xFF == ord('q'))
+
+    def fps(self) -> float:
+        """Matched frames per second since start."""
+        if self._started_at is None:
+            return 0.0
+        elapsed = time.perf_counter() - self._started_at
+        return self.processed["match"] / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Snapshot of pipeline counters.
+
+        Returns:
+            Dict with per-queue depth/drops, per-stage processed counts, FPS and the mean and
+            worst capture-to-match latency over the last LATENCY_BUFFER_SIZE frames
+        """
+        latencies = list(self.latencies)
+        return {
+            "queues": {queue.name: {"depth": queue.depth(), "puts": queue.puts, "drops": queue.drops}
+                       for queue in self.queues},
+            "processed": dict(self.processed),
+            "fps": self.fps(),
+            "latency_mean": sum(latencies) / len(latencies) if latencies else None,
+            "latency_max": max(latencies) if latencies else None,
+        }
+
+    def stop(self):
+        """Stop all pipeline threads and wait for them to exit."""
+        self._stop_event.set()
+        for queue in self.queues:
+            queue.close()
+        for thread in self._threads:
+            thread.join(timeout=self.recogniser.CAMERA_WARMUP_TIME + 1.0)
+        self._threads = []
+
+    # ========== PRIVATE METHODS ==========
+
+    def _capture_loop(self):
+        """Continuously read the camera so only the newest frame is ever queued."""
+        frame_id = 0
+        retry_count = 0
+        while not self._stop_event.is_set():
+            capture = self.recogniser.video_capture
+            ret, frame = capture.read() if capture is not None else (False, None)
+
+            if not ret or frame is None:
+                retry_count += 1
+                if retry_count > self.recogniser.MAX_RETRIES:
+                    print("Camera error: Attempting to reconnect...")
+                    try:
+                        self.recogniser.open_camera()
+                    except RuntimeError as e:
+                        self._fail(e)
+                        return
+                    retry_count = 0
+                    continue
+                print(f"Warning: Frame read failed (attempt {retry_count}/{self.recogniser.MAX_RETRIES})")
+                time.sleep(0.5)
+                continue
+
+            retry_count = 0
+            frame_id += 1
+            self.processed["capture"] += 1
+            if self.recogniser.evidence is not None:
+                self.recogniser.evidence.push(frame)
+            self.captured.put((frame, time.perf_counter()))
+
+    def _detect_loop(self):
+        """Motion gate, downscale, detect and track on the newest captured frame."""
+        while not self._stop_event.is_set():
+            item = self.captured.get(self.STAGE_TIMEOUT)
+            if item is None:
+                continue
+            frame, captured_at = item
+            try:
+                staged = self.recogniser.detect_stage(frame, started=captured_at)
+            except Exception as e:
+                self._fail(e)
+                return
+            self.processed["detect"] += 1
+            self.detected.put(staged)
+
+    def _encode_loop(self):
+        """Encode the faces the detection stage left for encoding."""
+        while not self._stop_event.is_set():
+            staged: StagedFrame = self.detected.get(self.STAGE_TIMEOUT)
+            if staged is None:
+                continue
+            try:
+                self.recogniser.encode_stage(staged)
+            except Exception as e:
+                self._fail(e)
+                return
+            self.processed["encode"] += 1
+            self.encoded.put(staged)
+
+    def _match_loop(self):
+        """Match encodings against the gallery, publish decisions and feed the renderer."""
+        while not self._stop_event.is_set():
+            staged: StagedFrame = self.encoded.get(self.STAGE_TIMEOUT)
+            if staged is None:
+                continue
+            try:
+                result = self.recogniser.match_stage(staged)
+            except Exception as e:
+                self._fail(e)
+                return
+
+            self.latencies.append(time.perf_counter() - staged.started)
+            self.processed["match"] += 1
+
+            if self.show_window:
+                self.rendered.put((staged.frame, result))
+            elif self.recogniser.preview is not None:
+                self.recogniser.preview.submit(staged.frame, result)
+            if self.recogniser.evidence is not None and "Unauthorised" in result.names:
+                self.recogniser.evidence.trigger("unauthorised")
+            decision = self.recogniser.decision_engine.add(result)
+            if decision is not None and self.decision is None:
+                self.decision = decision
+                self._decision_event.set()
+
+    def _fail(self, error: Exception):
+        """Record a fatal stage error and wake the waiting caller."""
+        print(f"Error in recognition pipeline: {error}")
+        self.error = error
+        self._decision_event.set()
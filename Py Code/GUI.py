@@ -1,104 +1,290 @@
-import tkinter as tk
-#from Main import ask_password
-from tkinter import simpledialog, messagebox
-
-class GUI:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("Status Panel")
-
-        self.led_states = [False] * 6  # 6 LEDs
-
-        self.canvas = tk.Canvas(root, width=400, height=1080)
-        self.canvas.pack()
-
-        self.led_circles = []
-        self.comp_labels = [None]*5
-
-        self.draw_leds()
-        self.draw_components()
-
-    def draw_leds(self):
-        for i in range(5,-1,-1):
-            x = 25 + (i % 3) *   50
-            y = 50 + (i // 3) * 475
-            circle = self.canvas.create_oval(x, y, x+30, y+30, fill='gray')
-            self.led_circles.append(circle)
-
-    def draw_components(self):
-        self.canvas.create_rectangle(20, 30, 160, 575, outline='black')
-        self.canvas.create_rectangle(25, 100, 155, 475, outline='orange')
-        x = 175
-        y = 300
-        label = tk.Label(self.root, text = f"Motion Sensor: Clear", bg='lightgray', width=20)
-        label.place(x=x,y=y)
-        self.comp_labels[0] = label
-        for i in range(2):
-            x = 175
-            y = 25 + (i % 2) * 475
-            label = tk.Label(self.root, text=f"Solenoid: Disengaged", bg='lightgray', width=20)
-            label.place(x=x, y=y + 40)
-            self.comp_labels[2*i+1] = label
-            y = 0 + (i % 2) * 475
-            label = tk.Label(self.root, text=f"Magnetic Sensor: Off", bg='lightgray', width=20)
-            label.place(x=x, y=y+40)
-            self.comp_labels[2*i+2] = label
-
-    def update_disp(self,StateFeedback):
-        if StateFeedback[7] == '1':
-            self.comp_labels[0].config(text=f"Motion Sensor: Detected" ,bg='green')
-        else:
-            self.comp_labels[0].config(text=f"Motion Sensor: Clear" ,bg='lightgray')
-        if StateFeedback[0] == '1':
-            if StateFeedback[8] == '1':
-                self.comp_labels[1].config(text=f"Solenoid: Engaged", bg='green')
-            else:
-                self.comp_labels[1].config(text=f"Solenoid: Disengaged", bg='lightgray')
-            if StateFeedback[9] == '1':
-                self.comp_labels[2].config(text=f"Magentic Sensor: On", bg='green')
-            else:
-                self.comp_labels[2].config(text=f"Magnetic Sensor: Off", bg='lightgray')
-        else:
-            if StateFeedback[8] == '1':
-                self.comp_labels[3].config(text=f"Solenoid: Engaged", bg='green')
-            else:
-                self.comp_labels[3].config(text=f"Solenoid: Disengaged", bg='lightgray')
-            if StateFeedback[9] == '1':
-                self.comp_labels[4].config(text=f"Magentic Sensor: On", bg='green')
-            else:
-                self.comp_labels[4].config(text=f"Magnetic Sensor: Off", bg='lightgray')
-
-        k = 0
-        for i in range(2):
-            for j in range(3):
-                k += 1
-                if StateFeedback[k] == '1' and j == 0:
-                    self.canvas.itemconfig(self.led_circles[k-1], fill='red')
-                elif StateFeedback[k] == '1' and j == 1:
-                    self.canvas.itemconfig(self.led_circles[k-1], fill='orange')
-                elif StateFeedback[k] == '1' and j == 2:
-                    self.canvas.itemconfig(self.led_circles[k-1], fill='green')
-                else:
-                    self.canvas.itemconfig(self.led_circles[k - 1], fill='gray')
-
-    def ask_password_popup(self, correct_password, callback, attempts=3):
-        def attempt():
-            for _ in range(attempts):
-                password = simpledialog.askstring("Authentication", "Enter Password:", show='*')
-                if password is None:
-                    break
-                if password == correct_password:
-                    messagebox.showinfo("Access Granted", "Correct password.")
-                    callback(True)
-                    return
-                else:
-                    messagebox.showwarning("Incorrect", "Password is incorrect.")
-            messagebox.showerror("Access Denied", "Too many failed attempts.")
-            callback(False)
-
-        self.root.after(0, attempt)
-
-    def show_alarm_popup(self, write_callback):
-        response = messagebox.askyesno("Alarm Triggered", "Abort alarm?")
-        if response:
-            write_callback("Abort")
+import threading
+import time
+import tkinter as tk
+from Metrics import metrics
+#from Main import ask_password
+from tkinter import simpledialog, messagebox
+
+class GUI:
+    FRAME_INTERVAL_MS = 33  # at most ~30 repaints per second
+
+    def __init__(self, root, parent=None, height=1080):
+        self.root = root
+        # A panel embedded in a larger window (see DoorPanels) draws into its parent frame
+        self.master = root if parent is None else parent
+        if parent is None:
+            self.root.title("Status Panel")
+
+        self.led_states = [False] * 6  # 6 LEDs
+
+        self.canvas = tk.Canvas(self.master, width=400, height=height)
+        self.canvas.pack()
+
+        self.led_circles = []
+        self.comp_labels = [None]*5
+
+        # Last rendered option values per widget, so repaints only touch what changed
+        self._rendered = {}
+        # State codes posted from the backend thread, coalesced into one repaint per frame;
+        # newest code per door-select bit (StateFeedback[0]), in posting order
+        self._pending_states = {}
+        self._repaint_scheduled = False
+        self._pending_lock = threading.Lock()
+        self.stats = {"posted": 0, "coalesced": 0, "repaints": 0, "widget_updates": 0}
+        # Callbacks handed to Tk from other threads that have not run yet
+        self._queued = 0
+        self._state_posted_at = None
+        if parent is None:
+            metrics.gauge_callback("gui.queue_depth", lambda: self._queued)
+
+        self.draw_leds()
+        self.draw_components()
+
+    def draw_leds(self):
+        for i in range(5,-1,-1):
+            x = 25 + (i % 3) *   50
+            y = 50 + (i // 3) * 475
+            circle = self.canvas.create_oval(x, y, x+30, y+30, fill='gray')
+            self.led_circles.append(circle)
+
+    def draw_components(self):
+        self.canvas.create_rectangle(20, 30, 160, 575, outline='black')
+        self.canvas.create_rectangle(25, 100, 155, 475, outline='orange')
+        x = 175
+        y = 300
+        label = tk.Label(self.master, text = f"Motion Sensor: Clear", bg='lightgray', width=20)
+        label.place(x=x,y=y)
+        self.comp_labels[0] = label
+        for i in range(2):
+            x = 175
+            y = 25 + (i % 2) * 475
+            label = tk.Label(self.master, text=f"Solenoid: Disengaged", bg='lightgray', width=20)
+            label.place(x=x, y=y + 40)
+            self.comp_labels[2*i+1] = label
+            y = 0 + (i % 2) * 475
+            label = tk.Label(self.master, text=f"Magnetic Sensor: Off", bg='lightgray', width=20)
+            label.place(x=x, y=y+40)
+            self.comp_labels[2*i+2] = label
+
+    def post_state(self, StateFeedback):
+        """
+        Queue a state code for display; safe to call from any thread.
+
+        Bursts of codes arriving within one frame interval are merged, so a chattering sensor
+        cannot flood the Tk event queue. The newest code is kept per door-select bit, since each
+        one carries the solenoid and reed switch readings of a different door.
+        """
+        with self._pending_lock:
+            self.stats["posted"] += 1
+            metrics.inc("gui.states_posted")
+            if self._pending_states.pop(StateFeedback[0], None) is not None:
+                self.stats["coalesced"] += 1
+                metrics.inc("gui.states_coalesced")
+            self._pending_states[StateFeedback[0]] = StateFeedback
+            if self._repaint_scheduled:
+                return
+            self._repaint_scheduled = True
+            self._state_posted_at = time.perf_counter()
+            self._queued += 1
+        self.root.after(self.FRAME_INTERVAL_MS, self._flush_state)
+
+    def schedule(self, callback, *args):
+        """Run a callback on the Tk thread; safe to call from any thread."""
+        posted_at = time.perf_counter()
+        with self._pending_lock:
+            self._queued += 1
+
+        def run():
+            with self._pending_lock:
+                self._queued -= 1
+            metrics.observe("gui.queue_latency", time.perf_counter() - posted_at)
+            callback(*args)
+
+        self.root.after(0, run)
+
+    def _flush_state(self):
+        with self._pending_lock:
+            pending, self._pending_states = self._pending_states, {}
+            self._repaint_scheduled = False
+            self._queued -= 1
+            posted_at = self._state_posted_at
+        if pending:
+            # Includes the deliberate FRAME_INTERVAL_MS coalescing delay
+            metrics.observe("gui.state_latency", time.perf_counter() - posted_at)
+            with metrics.timer("gui.repaint"):
+                # Oldest first, so the LEDs and motion sensor end up showing the newest code
+                for StateFeedback in pending.values():
+                    self.update_disp(StateFeedback)
+
+    def update_disp(self,StateFeedback):
+        self.stats["repaints"] += 1
+        for key, options in self._desired_state(StateFeedback).items():
+            if self._rendered.get(key) == options:
+                continue
+            self._rendered[key] = options
+            self.stats["widget_updates"] += 1
+            kind, index = key
+            if kind == 'label':
+                text, bg = options
+                self.comp_labels[index].config(text=text, bg=bg)
+            else:
+                self.canvas.itemconfig(self.led_circles[index], fill=options)
+
+    def _desired_state(self, StateFeedback):
+        """Map a state code to the option values of the widgets it controls."""
+        state = {}
+        if StateFeedback[7] == '1':
+            state[('label', 0)] = ("Motion Sensor: Detected", 'green')
+        else:
+            state[('label', 0)] = ("Motion Sensor: Clear", 'lightgray')
+        # The first bit selects which door the solenoid and reed switch readings belong to
+        solenoid, magnetic = (1, 2) if StateFeedback[0] == '1' else (3, 4)
+        if StateFeedback[8] == '1':
+            state[('label', solenoid)] = ("Solenoid: Engaged", 'green')
+        else:
+            state[('label', solenoid)] = ("Solenoid: Disengaged", 'lightgray')
+        if StateFeedback[9] == '1':
+            state[('label', magnetic)] = ("Magentic Sensor: On", 'green')
+        else:
+            state[('label', magnetic)] = ("Magnetic Sensor: Off", 'lightgray')
+
+        k = 0
+        for i in range(2):
+            for j in range(3):
+                k += 1
+                if StateFeedback[k] == '1' and j == 0:
+                    state[('led', k-1)] = 'red'
+                elif StateFeedback[k] == '1' and j == 1:
+                    state[('led', k-1)] = 'orange'
+                elif StateFeedback[k] == '1' and j == 2:
+                    state[('led', k-1)] = 'green'
+                else:
+                    state[('led', k-1)] = 'gray'
+        return state
+
+    def ask_password_popup(self, correct_password, callback, attempts=3):
+        def attempt():
+            for _ in range(attempts):
+                password = simpledialog.askstring("Authentication", "Enter Password:", show='*')
+                if password is None:
+                    break
+                if password == correct_password:
+                    messagebox.showinfo("Access Granted", "Correct password.")
+                    callback(True)
+                    return
+                else:
+                    messagebox.showwarning("Incorrect", "Password is incorrect.")
+            messagebox.showerror("Access Denied", "Too many failed attempts.")
+            callback(False)
+
+        self.root.after(0, attempt)
+
+    def show_alarm_popup(self, write_callback):
+        response = messagebox.askyesno("Alarm Triggered", "Abort alarm?")
+        if response:
+            write_callback("Abort")
+
+
+class DoorPanels:
+    """
+    One status panel per door in a single scrollable window.
+
+    State codes from every door are coalesced into one repaint per frame interval, so the Tk
+    event queue carries at most one pending repaint however many doors are chattering.
+    """
+    FRAME_INTERVAL_MS = GUI.FRAME_INTERVAL_MS
+    PANEL_HEIGHT = 600
+    MAX_COLUMNS = 4
+
+    def __init__(self, root, door_names, columns=None):
+        self.root = root
+        self.root.title("Status Panels")
+        columns = columns or min(len(door_names), self.MAX_COLUMNS)
+
+        # Scrollable area: a frame inside a canvas window
+        outer = tk.Canvas(root, width=410 * columns, height=self.PANEL_HEIGHT + 40)
+        scrollbar = tk.Scrollbar(root, orient='vertical', command=outer.yview)
+        outer.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill='y')
+        outer.pack(side='left', fill='both', expand=True)
+        grid = tk.Frame(outer)
+        outer.create_window((0, 0), window=grid, anchor='nw')
+        grid.bind('<Configure>', lambda event: outer.configure(scrollregion=outer.bbox('all')))
+
+        self.panels = {}
+        self.headers = {}
+        for i, name in enumerate(door_names):
+            frame = tk.Frame(grid, bd=1, relief='groove')
+            frame.grid(row=i // columns, column=i % columns, padx=2, pady=2)
+            header = tk.Label(frame, text=name, font=('TkDefaultFont', 12, 'bold'))
+            header.pack()
+            self.headers[name] = header
+            # Own frame, so the panel's placed labels line up with its canvas below the header
+            body = tk.Frame(frame)
+            body.pack()
+            self.panels[name] = GUI(root, parent=body, height=self.PANEL_HEIGHT)
+
+        # Newest code per (door, door-select bit), in posting order
+        self._pending_states = {}
+        self._repaint_scheduled = False
+        self._pending_lock = threading.Lock()
+        self._queued = 0
+        self.stats = {"posted": 0, "coalesced": 0, "repaints": 0}
+        metrics.gauge_callback("gui.queue_depth", lambda: self._queued)
+
+    def post_state(self, door, StateFeedback):
+        """
+        Queue a door's state code for display; safe to call from any thread.
+
+        Codes are coalesced per door and door-select bit (StateFeedback[0]), like GUI.post_state.
+        """
+        key = (door, StateFeedback[0])
+        with self._pending_lock:
+            self.stats["posted"] += 1
+            metrics.inc("gui.states_posted")
+            if self._pending_states.pop(key, None) is not None:
+                self.stats["coalesced"] += 1
+                metrics.inc("gui.states_coalesced")
+            self._pending_states[key] = StateFeedback
+            if self._repaint_scheduled:
+                return
+            self._repaint_scheduled = True
+            self._queued += 1
+        self.root.after(self.FRAME_INTERVAL_MS, self._flush_states)
+
+    def set_status(self, door, text, bg=None):
+        """Show a short status next to a door's name; safe to call from any thread."""
+        self.schedule(lambda: self.headers[door].config(text=f"{door}: {text}" if text else door,
+                                                        bg=bg or self.root.cget('bg')))
+
+    def schedule(self, callback, *args):
+        """Run a callback on the Tk thread; safe to call from any thread."""
+        posted_at = time.perf_counter()
+        with self._pending_lock:
+            self._queued += 1
+
+        def run():
+            with self._pending_lock:
+                self._queued -= 1
+            metrics.observe("gui.queue_latency", time.perf_counter() - posted_at)
+            callback(*args)
+
+        self.root.after(0, run)
+
+    def _flush_states(self):
+        with self._pending_lock:
+            pending, self._pending_states = self._pending_states, {}
+            self._repaint_scheduled = False
+            self._queued -= 1
+        self.stats["repaints"] += 1
+        with metrics.timer("gui.repaint"):
+            for (door, _), StateFeedback in pending.items():
+                self.panels[door].update_disp(StateFeedback)
+
+    def ask_password_popup(self, correct_password, callback, attempts=3):
+        next(iter(self.panels.values())).ask_password_popup(correct_password, callback, attempts)
+
+    def show_alarm_popup(self, door, write_callback):
+        response = messagebox.askyesno("Alarm Triggered", f"Alarm at {door}. Abort alarm?")
+        if response:
+            write_callback("Abort")
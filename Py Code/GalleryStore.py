@@ -0,0 +1,244 @@
+"""
+File: GalleryStore.py
+
+Description:
+Compact, versioned on-disk gallery that several recogniser processes map instead of copying.
+Every FaceRecogniser process used to build its own gallery matrix from the encoding cache, so
+N cameras in N worker processes held N private copies. A GalleryStore file holds the encodings
+as one contiguous float32 (or float16) block plus an id/name table. Readers open it read-only
+with np.memmap, so all processes share the operating system's single page-cache copy, and
+opening costs the same whatever the gallery size: only the header and names are read.
+
+Publishing:
+    publish() writes a new data file (<path>.<version>) next to the manifest, then atomically
+    swaps the manifest (os.replace), which names the current data file. Data files are never
+    rewritten in place, so a process still mapping an older version is never disturbed, and
+    the swap also works on Windows, where a mapped file cannot be replaced. Old versions are
+    deleted once no longer mapped (on Windows, a later publish retries).
+
+File layout (little-endian):
+    header      HEADER struct: magic, format version, dtype code, dimension, name count,
+                row count, store version, names offset, matrix offset, norms offset
+    row ids     uint32[rows], index into the name table
+    name table  per name: uint16 byte length + UTF-8 bytes
+    matrix      float32/float16[rows, dimension], 64-byte aligned
+    norms       float32[rows], squared norms of the stored rows, 64-byte aligned
+
+Usage:
+    store = GalleryStore("images/authorised/.gallery_store")
+    store.publish(gallery.names, gallery.encodings)
+    mapped = store.open()   # in any process
+"""
+import os
+import struct
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+
+@dataclass
+class MappedGallery:
+    """One published gallery version, mapped read-only."""
+    version: int
+    names: List[str]
+    matrix: np.ndarray  # (rows, dimension) float32 or float16, read-only memmap
+    sq_norms: np.ndarray  # (rows,) float32, read-only memmap
+    path: str
+
+
+class GalleryStore:
+    """
+    Versioned gallery file with atomic publishing and read-only memory-mapped opening.
+
+    Public Interface:
+    - publish(names, encodings) -> int: Writes and swaps in a new version, returns its number
+    - open() -> MappedGallery: Maps the current version
+    - signature(): Current data file name, cheap to poll for changes (None if nothing published)
+    """
+
+    DEFAULT_FILENAME = ".gallery_store"
+    MAGIC = b"FGAL"
+    FORMAT_VERSION = 1
+    HEADER = struct.Struct("<4sHHIIQQQQQ")
+    DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+    ALIGNMENT = 64
+    KEEP_VERSIONS = 2
+    OPEN_RETRIES = 3
+
+    def __init__(self, path: str, dtype: str = "float32"):
+        """
+        Initialise the store; nothing is read or written yet.
+
+        Args:
+            path: Manifest path; data files are written next to it
+            dtype: "float32" or "float16" for published encodings (float16 halves the size;
+                   distances move by about 1e-4, far below the match threshold, but exact
+                   matching upcasts it in chunks, up to about twice as slow as float32)
+
+        Raises:
+            ValueError: If dtype is not float32 or float16
+        """
+        codes = {np.dtype(dt).name: code for code, dt in self.DTYPES.items()}
+        if dtype not in codes:
+            raise ValueError(f"Unsupported gallery store dtype: {dtype}")
+        self.path = path
+        self.dtype_code = codes[dtype]
+
+    # ========== PUBLIC METHODS ==========
+
+    def publish(self, names: Sequence[str], encodings: np.ndarray) -> int:
+        """
+        Write a new version and atomically make it current.
+
+        Args:
+            names: Name of every encoding row
+            encodings: (rows, dimension) encodings
+
+        Returns:
+            int: The new version number
+
+        Raises:
+            OSError: If the files cannot be written
+            ValueError: If encodings is not one row per name
+        """
+        dtype = self.DTYPES[self.dtype_code]
+        matrix = np.ascontiguousarray(encodings, dtype=dtype)
+        if matrix.ndim != 2 or len(matrix) != len(names):
+            raise ValueError(f"Expected {len(names)} encoding rows, got shape {matrix.shape}")
+        stored = matrix.astype(np.float32)
+        sq_norms = np.einsum("ij,ij->i", stored, stored).astype("<f4")
+
+        table = list(dict.fromkeys(names))
+        index = {name: position for position, name in enumerate(table)}
+        row_ids = np.asarray([index[name] for name in names], dtype="<u4")
+        encoded_names = [name.encode("utf-8") for name in table]
+        name_table = b"".join(struct.pack("<H", len(raw)) + raw for raw in encoded_names)
+
+        current = self._current_version()
+        version = current + 1
+        names_offset = self.HEADER.size + row_ids.nbytes
+        matrix_offset = self._align(names_offset + len(name_table))
+        norms_offset = self._align(matrix_offset + matrix.nbytes)
+        header = self.HEADER.pack(self.MAGIC, self.FORMAT_VERSION, self.dtype_code, matrix.shape[1], len(table),
+                                  len(names), version, names_offset, matrix_offset, norms_offset)
+
+        data_path = self._data_path(version)
+        self._write_atomically(data_path, [
+            (0, header), (self.HEADER.size, row_ids.tobytes()), (names_offset, name_table),
+            (matrix_offset, matrix.tobytes()), (norms_offset, sq_norms.tobytes())])
+        self._write_atomically(self.path, [(0, (os.path.basename(data_path) + "\n").encode("utf-8"))])
+        self._remove_old_versions(version)
+        return version
+
+    def open(self) -> MappedGallery:
+        """
+        Map the current version read-only.
+
+        Returns:
+            MappedGallery for the current version
+
+        Raises:
+            FileNotFoundError: If nothing has been published yet
+            ValueError: If the data file is not a gallery store this version understands
+        """
+        for attempt in range(self.OPEN_RETRIES):
+            data_path = self._current_data_path()
+            if data_path is None:
+                raise FileNotFoundError(f"No gallery store published at {self.path}")
+            try:
+                return self._map(data_path)
+            except FileNotFoundError:
+                # Two publishes between reading the manifest and opening the data: read it again
+                if attempt == self.OPEN_RETRIES - 1:
+                    raise
+
+    def signature(self) -> Optional[str]:
+        """Name of the current data file (changes with every publish), or None."""
+        data_path = self._current_data_path()
+        return None if data_path is None else os.path.basename(data_path)
+
+    # ========== PRIVATE METHODS ==========
+
+    def _map(self, data_path: str) -> MappedGallery:
+        with open(data_path, "rb") as handle:
+            header = handle.read(self.HEADER.size)
+            if len(header) != self.HEADER.size:
+                raise ValueError(f"Truncated gallery store: {data_path}")
+            (magic, format_version, dtype_code, dimension, name_count, rows, version,
+             names_offset, matrix_offset, norms_offset) = self.HEADER.unpack(header)
+            if magic != self.MAGIC or format_version != self.FORMAT_VERSION or dtype_code not in self.DTYPES:
+                raise ValueError(f"Unsupported gallery store: {data_path}")
+            row_ids = np.frombuffer(handle.read(rows * 4), dtype="<u4")
+            table_bytes = handle.read(matrix_offset - names_offset)
+
+        table = []
+        position = 0
+        for _ in range(name_count):
+            (length,) = struct.unpack_from("<H", table_bytes, position)
+            table.append(table_bytes[position + 2:position + 2 + length].decode("utf-8"))
+            position += 2 + length
+        names = [table[row_id] for row_id in row_ids]
+
+        dtype = self.DTYPES[dtype_code]
+        if rows == 0:
+            matrix = np.zeros((0, dimension), dtype=dtype)
+            sq_norms = np.zeros(0, dtype=np.float32)
+        else:
+            matrix = np.memmap(data_path, dtype=dtype, mode="r", offset=matrix_offset, shape=(rows, dimension))
+            sq_norms = np.memmap(data_path, dtype="<f4", mode="r", offset=norms_offset, shape=(rows,))
+        return MappedGallery(version, names, matrix, sq_norms, data_path)
+
+    def _current_data_path(self) -> Optional[str]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as handle:
+                name = handle.read().strip()
+        except FileNotFoundError:
+            return None
+        return os.path.join(os.path.dirname(os.path.abspath(self.path)), name) if name else None
+
+    def _current_version(self) -> int:
+        data_path = self._current_data_path()
+        if data_path is None:
+            return 0
+        try:
+            return int(data_path.rsplit(".", 1)[1])
+        except (IndexError, ValueError):
+            return 0
+
+    def _data_path(self, version: int) -> str:
+        return f"{self.path}.{version:06d}"
+
+    def _align(self, offset: int) -> int:
+        return -(-offset // self.ALIGNMENT) * self.ALIGNMENT
+
+    @staticmethod
+    def _write_atomically(path: str, chunks):
+        """Write (offset, bytes) chunks to a temporary file, flush it to disk, then rename it over path."""
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "wb") as handle:
+                for offset, chunk in chunks:
+                    handle.seek(offset)
+                    handle.write(chunk)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def _remove_old_versions(self, current: int):
+        """Delete data files more than KEEP_VERSIONS old; ones still mapped on Windows are retried later."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        prefix = os.path.basename(self.path) + "."
+        for filename in os.listdir(directory):
+            suffix = filename[len(prefix):]
+            if not filename.startswith(prefix) or not suffix.isdigit():
+                continue
+            if int(suffix) <= current - self.KEEP_VERSIONS:
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except OSError:
+                    pass  # still mapped by a reader (Windows)
@@ -0,0 +1,108 @@
+"""
+File: GalleryWatcher.py
+
+Description:
+Polling watcher for the authorised gallery directory.
+Every poll lists the gallery images (same layout rules as Enrollment.list_gallery_images) and
+compares their size and modification time with the previous poll. A change is reported only
+once the directory has stayed the same for one further poll, so a photo that is still being
+copied in is not encoded half-written. Polling needs no extra dependencies and works the same
+on Windows and Linux; for a directory of a few thousand files a poll costs milliseconds.
+A custom signature function lets the same watcher follow other sources, e.g. a GalleryStore.
+
+Usage:
+    watcher = GalleryWatcher("images/authorised", recogniser.reload_gallery)
+    watcher.start()
+"""
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from Enrollment import list_gallery_images
+
+
+class GalleryWatcher:
+    """
+    Calls on_change whenever the gallery directory's images settle after a change.
+
+    Public Interface:
+    - start() / stop(): Runs the polling thread
+    - poll(): Performs one poll; returns True if on_change was called
+    """
+
+    POLL_INTERVAL = 2.0
+
+    def __init__(self, directory: str, on_change: Callable[[], object], interval: float = None,
+                 signature: Callable[[], Any] = None):
+        """
+        Initialise the watcher; the directory's current contents count as already applied.
+
+        Args:
+            directory: Gallery directory
+            on_change: Called on the watcher thread when the directory changed
+            interval: Seconds between polls (default: POLL_INTERVAL)
+            signature: Returns a comparable snapshot of what is watched (default: size and
+                       modification time of every gallery image in directory)
+        """
+        self.directory = directory
+        self.on_change = on_change
+        self.interval = interval or self.POLL_INTERVAL
+        if signature is not None:
+            self._signature = signature
+        self.changes = 0
+        self._applied = self._signature()
+        self._previous = self._applied
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start polling on a daemon thread."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="GalleryWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll(self) -> bool:
+        """
+        Check the directory once.
+
+        Returns:
+            bool: True if a settled change was found and on_change was called
+        """
+        current = self._signature()
+        settled = current == self._previous
+        self._previous = current
+        if not settled or current == self._applied:
+            return False
+        self.on_change()
+        self._applied = current
+        self.changes += 1
+        return True
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Error reloading gallery: {e}")
+
+    def _signature(self) -> Dict[str, Tuple[int, int]]:
+        """Relative image path -> (mtime_ns, size) for every gallery image."""
+        signature = {}
+        if not os.path.isdir(self.directory):
+            return signature
+        for rel_path in list_gallery_images(self.directory):
+            try:
+                stat = os.stat(os.path.join(self.directory, rel_path))
+            except OSError:
+                continue  # removed between listing and stat; the next poll sees it gone
+            signature[rel_path] = (stat.st_mtime_ns, stat.st_size)
+        return signature
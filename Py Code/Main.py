@@ -1,71 +1,166 @@
-from SerialComm import SerialComm
-from FacialRecognition import FaceRecogniser
-from GUI import GUI
-import threading
-import time
-import tkinter as tk
-
-Hermes = SerialComm()
-
-def Main():
-    root = tk.Tk()
-    app = GUI(root)
-
-    def backend_loop():
-        result = {"auth": None}
-        event = threading.Event()
-
-        def set_auth_result(success):
-            result["auth"] = success
-            event.set()
-
-        app.ask_password_popup("placeholder", set_auth_result)
-        event.wait()
-
-        if result["auth"]:
-            Hermes.Write("SystemStart")
-        else:
-            root.quit()
-            return
-
-        while True:
-            Recieved = Hermes.Read()
-            if Recieved == "AlarmActive":
-                root.after(0, app.show_alarm_popup, Hermes.Write)
-            elif Recieved == "FacialRecognition":
-                try:
-                    recogniser = FaceRecogniser()
-                    Message = recogniser.run_realtime_recognition()
-                except Exception as e:
-                    print(f"Error: {e}")
-                    Message = "Error"
-                finally:
-                    if 'recogniser' in locals():
-                        recogniser.release_resources()
-                Hermes.Write(Message)
-            elif is_StateCode(Recieved):
-                root.after(0, app.update_disp, Recieved)
-
-    thread = threading.Thread(target=backend_loop, daemon=True)
-    thread.start()
-
-    root.mainloop()
-
-def ask_password(correct_password: str, attempts: int = 3):
-    for _ in range(attempts):
-        entered = input("Enter password: ")
-        if entered == correct_password:
-            print("Access granted.")
-            return True
-        else:
-            print("Incorrect password.")
-    print("Too many failed attempts.")
-    return False
-
-
-def is_StateCode(msg):
-    return len(msg) == 10 and all(c in '01' for c in msg)
-
-
-if __name__ == '__main__':
-    Main()
\ No newline at end of file
+from AsyncSerial import SerialLink, DEFAULT_PORT, DEFAULT_BAUDRATE
+from RecognitionService import RecognitionService
+from GUI import GUI
+from Metrics import metrics, MetricsServer, StatsFileWriter
+import argparse
+import asyncio
+import threading
+import time
+import tkinter as tk
+
+def Main(port: str = DEFAULT_PORT, baudrate: int = DEFAULT_BAUDRATE, metrics_port: int = None,
+         stats_file: str = None, headless: bool = False, preview_port: int = None, preview_file: str = None,
+         watch_gallery: bool = False, worker_process: bool = False, decision_deadline: float = None,
+         evidence_dir: str = None, evidence_memory_mb: float = None, gallery_store: bool = False,
+         gallery_float16: bool = False):
+    launched_at = time.monotonic()
+    # Optional metrics surfaces: a local HTTP endpoint and/or a rotated JSON-lines file
+    exporters = []
+    if metrics_port is not None:
+        exporters.append(MetricsServer(metrics, port=metrics_port))
+    if stats_file:
+        exporters.append(StatsFileWriter(metrics, stats_file))
+    # Optional remote view of the camera, encoded off the recognition thread
+    preview = None
+    if preview_port is not None or preview_file:
+        from PreviewStream import PreviewStream
+        preview = PreviewStream(port=preview_port, output_file=preview_file)
+        exporters.append(preview)
+    # Optional JPEG clips of the seconds around unauthorised faces and alarms
+    evidence = None
+    if evidence_dir:
+        from EvidenceBuffer import EvidenceBuffer
+        evidence = EvidenceBuffer(evidence_dir, memory_limit_mb=evidence_memory_mb)
+        exporters.append(evidence)
+    for exporter in exporters:
+        exporter.start()
+
+    # OpenCV, dlib and the gallery load in the background while the GUI and password prompt are up
+    recognition = RecognitionService(launched_at=launched_at, out_of_process=worker_process, headless=headless,
+                                     preview=preview, watch_gallery=watch_gallery,
+                                     decision_deadline=decision_deadline, evidence=evidence,
+                                     use_gallery_store=gallery_store,
+                                     gallery_store_dtype="float16" if gallery_float16 else "float32")
+    recognition.start_in_background()
+
+    root = tk.Tk()
+    app = GUI(root)
+    Hermes = SerialLink(port, baudrate)
+
+    def backend_loop():
+        result = {"auth": None}
+        event = threading.Event()
+
+        def set_auth_result(success):
+            result["auth"] = success
+            event.set()
+
+        app.ask_password_popup("placeholder", set_auth_result)
+        event.wait()
+
+        if not result["auth"]:
+            root.quit()
+            return
+
+        asyncio.run(backend(root, app, Hermes, recognition))
+
+    thread = threading.Thread(target=backend_loop, daemon=True)
+    thread.start()
+
+    root.mainloop()
+    Hermes.close()  # handed to the backend loop, which closes the port once its read returns
+    thread.join(timeout=2.0)
+    recognition.stop()
+    for exporter in exporters:
+        exporter.stop()
+
+async def backend(root, app, Hermes: SerialLink, recognition: RecognitionService):
+    """Serve the controller: dispatch incoming messages and answer recognition requests."""
+    loop = asyncio.get_running_loop()
+    recognition_busy = asyncio.Lock()
+
+    def run_recognition():
+        # Keep the camera and gallery resident so each door approach skips the warmup; a request
+        # that arrives while the service is still loading waits for it (or retries a failed start)
+        recognition.wait_ready()
+        return recognition.recognise()
+
+    def record_alarm_evidence():
+        try:
+            recognition.record_evidence("alarm")
+        except Exception as e:
+            print(f"Error recording alarm evidence: {e}")
+
+    def on_alarm(Recieved):
+        app.schedule(app.show_alarm_popup, Hermes.send_threadsafe)
+        loop.run_in_executor(None, record_alarm_evidence)
+
+    async def on_facial_recognition(Recieved):
+        if recognition_busy.locked():
+            print("Recognition already in progress")
+            return
+        async with recognition_busy:
+            try:
+                Message = await loop.run_in_executor(None, run_recognition)
+            except Exception as e:
+                print(f"Error: {e}")
+                Message = "Error"
+            if Message is None:
+                # Interrupted (window closed, camera lost): the controller still needs an answer
+                # to leave step 2, and Procedure.cpp handles Timeout like Unauthorised
+                Message = "Timeout"
+            await Hermes.send(Message)
+
+    def on_state_code(Recieved):
+        app.post_state(Recieved)
+
+    Hermes.on("AlarmActive", on_alarm)
+    Hermes.on("FacialRecognition", on_facial_recognition)
+    Hermes.on_match(is_StateCode, on_state_code)
+    Hermes.on_default(print)
+
+    await Hermes.send("SystemStart")
+    await Hermes.run()
+
+def ask_password(correct_password: str, attempts: int = 3):
+    for _ in range(attempts):
+        entered = input("Enter password: ")
+        if entered == correct_password:
+            print("Access granted.")
+            return True
+        else:
+            print("Incorrect password.")
+    print("Too many failed attempts.")
+    return False
+
+
+def is_StateCode(msg):
+    return len(msg) == 10 and all(c in '01' for c in msg)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Burglar alarm control panel")
+    parser.add_argument("--port", default=DEFAULT_PORT, help="serial port or pyserial URL (default: COM4)")
+    parser.add_argument("--baud", type=int, default=DEFAULT_BAUDRATE, help="baud rate (default: 9600)")
+    parser.add_argument("--metrics-port", type=int, help="serve metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--stats-file", help="append a metrics snapshot to this file every 10 s")
+    parser.add_argument("--headless", action="store_true", help="never open the camera window")
+    parser.add_argument("--preview-port", type=int, help="serve an MJPEG preview on http://127.0.0.1:PORT/")
+    parser.add_argument("--preview-file", help="append an MJPEG preview to this file")
+    parser.add_argument("--watch-gallery", action="store_true",
+                        help="apply changes to images/authorised without restarting")
+    parser.add_argument("--worker-process", action="store_true",
+                        help="run recognition in a separate, supervised process")
+    parser.add_argument("--decision-deadline", type=float,
+                        help="seconds before recognition answers Unauthorised/Timeout (default: 10)")
+    parser.add_argument("--gallery-store", action="store_true",
+                        help="publish the gallery as a memory-mapped store other processes can map")
+    parser.add_argument("--gallery-float16", action="store_true",
+                        help="store gallery encodings as float16 (half the size, slower exact matching)")
+    parser.add_argument("--evidence-dir", help="save JPEG clips around unauthorised faces and alarms here")
+    parser.add_argument("--evidence-memory", type=float,
+                        help="MB of recent frames kept for evidence clips (default: 64)")
+    args = parser.parse_args()
+    Main(args.port, args.baud, args.metrics_port, args.stats_file, args.headless, args.preview_port,
+         args.preview_file, args.watch_gallery, args.worker_process, args.decision_deadline,
+         args.evidence_dir, args.evidence_memory, args.gallery_store, args.gallery_float16)
\ No newline at end of file
@@ -0,0 +1,426 @@
+"""
+File: Metrics.py
+
+Description:
+Low-overhead in-process metrics for the recognition, serial and GUI hot paths.
+Recording a sample is a bucket lookup and a few additions under a lock, so instrumentation can
+stay enabled in production. Values are only aggregated when someone asks for them, either over
+a local HTTP endpoint or in a periodically rotated stats file.
+
+Key Features:
+- Histogram: fixed log-spaced buckets (10 us .. ~10 s by default) with count/sum/min/max and
+  estimated percentiles.
+- Counter and Gauge, plus gauges sampled from a callback at snapshot time (e.g. queue depth),
+  which cost nothing on the hot path.
+- timer(name): context manager that records elapsed seconds into a histogram.
+- MetricsServer: GET http://127.0.0.1:9108/metrics returns JSON; /metrics?format=prometheus
+  returns the Prometheus text format.
+- StatsFileWriter: appends one JSON snapshot per interval to a size-rotated file.
+
+Usage:
+    from Metrics import metrics
+    with metrics.timer("recognition.detect"):
+        ...
+    metrics.inc("serial.messages_read")
+"""
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 9108
+
+
+def _default_buckets() -> List[float]:
+    """Upper bounds in seconds: 10 us doubling up to ~10.5 s."""
+    return [1e-5 * 2 ** index for index in range(21)]
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Point-in-time value, either set explicitly or read from a callback at snapshot time."""
+
+    def __init__(self, callback: Callable[[], float] = None):
+        self.value = 0.0
+        self.callback = callback
+
+    def set(self, value: float):
+        self.value = value
+
+    def read(self) -> Optional[float]:
+        if self.callback is None:
+            return self.value
+        try:
+            return float(self.callback())
+        except Exception:
+            return None
+
+
+class Histogram:
+    """
+    Bucketed distribution of observed values.
+
+    Percentiles are estimated by linear interpolation inside the bucket that contains them,
+    which is accurate to within one bucket (a factor of two with the default buckets).
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self, buckets: Sequence[float] = None):
+        """
+        Args:
+            buckets: Sorted bucket upper bounds (default: 10 us .. ~10 s, doubling)
+        """
+        self.bounds = list(buckets) if buckets is not None else _default_buckets()
+        self.counts = [0] * (len(self.bounds) + 1)  # the last bucket catches overflow
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record one sample."""
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value < self.min:
+                self.min = value
+            if value > self.max:
+                self.max = value
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Estimate the given percentile, or None if nothing was observed."""
+        with self._lock:
+            counts, count, low, high = list(self.counts), self.count, self.min, self.max
+        if count == 0:
+            return None
+        rank = percent / 100.0 * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else low
+                upper = self.bounds[index] if index < len(self.bounds) else high
+                lower, upper = max(lower, low), min(upper, high)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return high
+
+    def summary(self) -> Dict[str, float]:
+        """Count, sum, mean, min, max and estimated percentiles."""
+        if self.count == 0:
+            return {"count": 0}
+        result = {"count": self.count, "sum": self.total, "mean": self.total / self.count,
+                  "min": self.min, "max": self.max}
+        for percent in self.PERCENTILES:
+            result[f"p{percent}"] = self.percentile(percent)
+        return result
+
+
+class _Timer:
+    """Context manager recording elapsed seconds into a histogram."""
+
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    """Timer used while metrics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class MetricsRegistry:
+    """
+    Named counters, gauges and histograms.
+
+    Public Interface:
+    - inc(name, amount) / set(name, value) / observe(name, seconds): Record values
+    - timer(name): Context manager timing a block into a histogram
+    - gauge_callback(name, callback): Gauge read lazily at snapshot time
+    - snapshot(): Dict of every metric
+    - prometheus_text(): Prometheus exposition format
+    - enabled: When False, recording calls return immediately
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.counters: Dict[str, Counter] = {}
+        self.gauges: Dict[str, Gauge] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    # ========== PUBLIC METHODS ==========
+
+    def counter(self, name: str) -> Counter:
+        metric = self.counters.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.counters.setdefault(name, Counter())
+        return metric
+
+    def gauge(self, name: str) -> Gauge:
+        metric = self.gauges.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.gauges.setdefault(name, Gauge())
+        return metric
+
+    def histogram(self, name: str, buckets: Sequence[float] = None) -> Histogram:
+        metric = self.histograms.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self.histograms.setdefault(name, Histogram(buckets))
+        return metric
+
+    def inc(self, name: str, amount: float = 1):
+        """Increment a counter."""
+        if self.enabled:
+            self.counter(name).inc(amount)
+
+    def set(self, name: str, value: float):
+        """Set a gauge."""
+        if self.enabled:
+            self.gauge(name).set(value)
+
+    def observe(self, name: str, value: float):
+        """Record a sample (seconds, for latencies) in a histogram."""
+        if self.enabled:
+            self.histogram(name).observe(value)
+
+    def timer(self, name: str):
+        """Context manager recording the block's elapsed seconds in a histogram."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self.histogram(name))
+
+    def gauge_callback(self, name: str, callback: Callable[[], float]):
+        """Register a gauge whose value is read from callback when a snapshot is taken."""
+        with self._lock:
+            self.gauges[name] = Gauge(callback)
+
+    def snapshot(self) -> Dict:
+        """
+        Collect every metric.
+
+        Returns:
+            Dict with "time", "uptime", "counters", "gauges" and "histograms" (summaries)
+        """
+        with self._lock:
+            counters, gauges, histograms = dict(self.counters), dict(self.gauges), dict(self.histograms)
+        now = time.time()
+        return {
+            "time": now,
+            "uptime": now - self.started_at,
+            "counters": {name: metric.value for name, metric in sorted(counters.items())},
+            "gauges": {name: metric.read() for name, metric in sorted(gauges.items())},
+            "histograms": {name: metric.summary() for name, metric in sorted(histograms.items())},
+        }
+
+    def prometheus_text(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters, gauges, histograms = dict(self.counters), dict(self.gauges), dict(self.histograms)
+        lines = []
+        for name, metric in sorted(counters.items()):
+            lines += [f"# TYPE {self._prometheus_name(name)}_total counter",
+                      f"{self._prometheus_name(name)}_total {metric.value}"]
+        for name, metric in sorted(gauges.items()):
+            value = metric.read()
+            if value is not None:
+                lines += [f"# TYPE {self._prometheus_name(name)} gauge", f"{self._prometheus_name(name)} {value}"]
+        for name, metric in sorted(histograms.items()):
+            base = self._prometheus_name(name)
+            lines.append(f"# TYPE {base} histogram")
+            with metric._lock:
+                counts, count, total = list(metric.counts), metric.count, metric.total
+            cumulative = 0
+            for bound, bucket_count in zip(metric.bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'{base}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines += [f'{base}_bucket{{le="+Inf"}} {count}', f"{base}_sum {total}", f"{base}_count {count}"]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Drop every metric except callback gauges."""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.gauges = {name: gauge for name, gauge in self.gauges.items() if gauge.callback is not None}
+            self.started_at = time.time()
+
+    # ========== PRIVATE METHODS ==========
+
+    @staticmethod
+    def _prometheus_name(name: str) -> str:
+        return "facerec_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+class MetricsServer:
+    """
+    Local HTTP pull endpoint serving a registry's snapshot.
+
+    Usage:
+        server = MetricsServer(metrics, port=9108)
+        server.start()   # curl http://127.0.0.1:9108/metrics
+    """
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        """
+        Args:
+            registry: Registry to serve
+            host: Interface to bind (loopback by default, so nothing is exposed off the machine)
+            port: TCP port (0 picks a free one)
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start serving on a daemon thread."""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                if parse_qs(url.query).get("format") == ["prometheus"]:
+                    body, content_type = registry.prometheus_text().encode(), "text/plain; version=0.0.4"
+                else:
+                    body, content_type = json.dumps(registry.snapshot()).encode(), "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MetricsServer", daemon=True)
+        self._thread.start()
+        print(f"Metrics available at http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        """Stop serving."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class StatsFileWriter:
+    """
+    Appends a JSON snapshot per interval to a stats file, rotating it by size.
+
+    Rotation shifts <path> to <path>.1 (older files up to <path>.<backup_count>), like the
+    detection log.
+    """
+
+    INTERVAL = 10.0
+
+    def __init__(self, registry: MetricsRegistry, path: str, interval: float = None,
+                 max_bytes: int = 5 * 1024 * 1024, backup_count: int = 3):
+        """
+        Args:
+            registry: Registry to snapshot
+            path: JSON-lines stats file
+            interval: Seconds between snapshots (default: INTERVAL)
+            max_bytes: Rotate once the file is larger than this
+            backup_count: Number of rotated files to keep
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval or self.INTERVAL
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start writing snapshots on a daemon thread."""
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="StatsFileWriter", daemon=True)
+        self._thread.start()
+
+    def write_snapshot(self):
+        """Append one snapshot now, rotating first if the file is full."""
+        if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+            self._rotate()
+        with open(self.path, "a") as f:
+            f.write(json.dumps(self.registry.snapshot()) + "\n")
+
+    def stop(self):
+        """Write a final snapshot and stop."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._write_safely()
+        self._write_safely()
+
+    def _write_safely(self):
+        try:
+            self.write_snapshot()
+        except OSError as e:
+            print(f"Error writing stats file {self.path}: {e}")
+
+    def _rotate(self):
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+# Process-wide registry used by the instrumented modules
+metrics = MetricsRegistry(enabled=os.environ.get("FACEREC_METRICS", "1") != "0")
@@ -0,0 +1,197 @@
+"""
+File: MotionTracking.py
+
+Description:
+Cheap per-frame work reduction for the recognition loop.
+- MotionGate compares a tiny blurred greyscale copy of each frame with the previous one, so
+  HOG detection can be skipped while the scene at the door is static.
+- FaceTracker follows detected faces between frames by box overlap, so a face is only
+  re-encoded when a new track appears or the track's identity has expired, instead of on
+  every frame.
+"""
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from FaceGallery import GalleryMatch
+
+
+class MotionGate:
+    """
+    Frame-difference motion detector.
+
+    Usage:
+        gate = MotionGate()
+        if gate.is_static(frame):
+            ...  # reuse the previous detections
+    """
+
+    GATE_WIDTH = 64
+    BLUR_KERNEL = (5, 5)
+    PIXEL_THRESHOLD = 12
+    MOTION_FRACTION = 0.005
+    FORCE_CHECK_INTERVAL = 2.0
+
+    def __init__(self, motion_fraction: float = None, force_check_interval: float = None):
+        """
+        Initialise the gate.
+
+        Args:
+            motion_fraction: Fraction of changed pixels that counts as motion
+            force_check_interval: Seconds after which a frame is reported as changed regardless,
+                                  so slow changes (e.g. lighting) are eventually re-examined
+        """
+        self.motion_fraction = self.MOTION_FRACTION if motion_fraction is None else motion_fraction
+        self.force_check_interval = (self.FORCE_CHECK_INTERVAL if force_check_interval is None
+                                     else force_check_interval)
+        self.previous: Optional[np.ndarray] = None
+        self.last_forced = time.monotonic()
+        self.static_frames = 0
+        self.moving_frames = 0
+
+    def is_static(self, frame: np.ndarray) -> bool:
+        """
+        Check whether a frame differs meaningfully from the previous one.
+
+        Args:
+            frame: BGR frame
+
+        Returns:
+            bool: True if the scene has not changed
+        """
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (self.GATE_WIDTH, max(1, height * self.GATE_WIDTH // width)),
+                           interpolation=cv2.INTER_AREA)
+        grey = cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), self.BLUR_KERNEL, 0)
+
+        previous, self.previous = self.previous, grey
+        now = time.monotonic()
+        if previous is None or previous.shape != grey.shape or now - self.last_forced >= self.force_check_interval:
+            self.last_forced = now
+            self.moving_frames += 1
+            return False
+
+        changed = np.count_nonzero(cv2.absdiff(grey, previous) > self.PIXEL_THRESHOLD)
+        if changed > self.motion_fraction * grey.size:
+            self.moving_frames += 1
+            return False
+        self.static_frames += 1
+        return True
+
+    def reset(self):
+        """Forget the reference frame so the next frame counts as motion."""
+        self.previous = None
+
+
+class FaceTrack:
+    """A face followed across frames, with the identity from its last encoding."""
+
+    def __init__(self, track_id: int, box: Tuple[int, int, int, int]):
+        self.track_id = track_id
+        self.box = box
+        self.name = "Unauthorised"
+        self.distance = float("inf")
+        self.match: Optional[GalleryMatch] = None
+        self.identified_at: Optional[float] = None
+        self.misses = 0
+
+    def assign(self, name: str, distance: float, match: GalleryMatch, now: float):
+        """Record the identity from a fresh encoding."""
+        self.name = name
+        self.distance = distance
+        self.match = match
+        self.identified_at = now
+
+
+class FaceTracker:
+    """
+    Greedy IoU tracker for face boxes.
+
+    Public Interface:
+    - update(locations): Associates detections with tracks, returns the live tracks
+    - needs_encoding(track, now): Whether a track's identity must be (re)computed
+    - tracks: Currently live tracks
+    """
+
+    IOU_THRESHOLD = 0.3
+    MAX_MISSES = 2
+    AUTHORISED_TTL = 2.0
+    UNAUTHORISED_TTL = 0.5
+
+    def __init__(self, authorised_ttl: float = None, unauthorised_ttl: float = None):
+        """
+        Initialise the tracker.
+
+        Args:
+            authorised_ttl: Seconds an authorised identity is trusted before re-encoding
+            unauthorised_ttl: Seconds before an unrecognised face is re-encoded (kept short so a
+                              person turning towards the camera is picked up quickly)
+        """
+        self.authorised_ttl = self.AUTHORISED_TTL if authorised_ttl is None else authorised_ttl
+        self.unauthorised_ttl = self.UNAUTHORISED_TTL if unauthorised_ttl is None else unauthorised_ttl
+        self.tracks: List[FaceTrack] = []
+        self._next_id = 1
+        self.encodes = 0
+        self.reuses = 0
+
+    def update(self, locations: List[Tuple[int, int, int, int]]) -> List[FaceTrack]:
+        """
+        Associate detected boxes with existing tracks.
+
+        Args:
+            locations: (top, right, bottom, left) boxes detected in this frame
+
+        Returns:
+            Tracks for this frame, one per location and in the same order
+        """
+        unmatched = list(self.tracks)
+        frame_tracks = []
+        for box in locations:
+            best, best_iou = None, self.IOU_THRESHOLD
+            for track in unmatched:
+                overlap = self._iou(track.box, box)
+                if overlap >= best_iou:
+                    best, best_iou = track, overlap
+            if best is None:
+                best = FaceTrack(self._next_id, box)
+                self._next_id += 1
+            else:
+                unmatched.remove(best)
+                best.box = box
+                best.misses = 0
+            frame_tracks.append(best)
+
+        for track in unmatched:
+            track.misses += 1
+        self.tracks = frame_tracks + [track for track in unmatched if track.misses <= self.MAX_MISSES]
+        return frame_tracks
+
+    def needs_encoding(self, track: FaceTrack, now: float = None) -> bool:
+        """Return True if the track is new or its identity has expired."""
+        now = time.monotonic() if now is None else now
+        if track.identified_at is None:
+            return True
+        ttl = self.unauthorised_ttl if track.name == "Unauthorised" else self.authorised_ttl
+        return now - track.identified_at >= ttl
+
+    def visible_tracks(self) -> List[FaceTrack]:
+        """Tracks that were matched to a detection in the most recent update."""
+        return [track for track in self.tracks if track.misses == 0]
+
+    def clear(self):
+        """Drop all tracks."""
+        self.tracks = []
+
+    @staticmethod
+    def _iou(a: Tuple[int, int, int, int], b: Tuple[int, int, int, int]) -> float:
+        """Intersection over union of two (top, right, bottom, left) boxes."""
+        top, bottom = max(a[0], b[0]), min(a[2], b[2])
+        left, right = max(a[3], b[3]), min(a[1], b[1])
+        if bottom <= top or right <= left:
+            return 0.0
+        intersection = (bottom - top) * (right - left)
+        area_a = (a[2] - a[0]) * (a[1] - a[3])
+        area_b = (b[2] - b[0]) * (b[1] - b[3])
+        return intersection / float(area_a + area_b - intersection)
@@ -0,0 +1,220 @@
+"""
+File: PreviewStream.py
+
+Description:
+Optional, rate-limited preview of the recognition output for headless door units.
+The recognition loop only hands over a reference to the newest frame and its FrameResult;
+annotation and JPEG encoding happen on the preview thread at no more than max_fps, and frames
+arriving in between simply replace each other. Recognition throughput is therefore the same
+whether or not anyone is watching.
+
+Outputs (either or both):
+- A local MJPEG HTTP stream: open http://127.0.0.1:8081/ in a browser or VLC.
+- An MJPEG file (concatenated JPEGs, playable with e.g. "ffplay -f mjpeg preview.mjpeg").
+
+Usage:
+    preview = PreviewStream(recogniser.process_frame, port=8081)
+    preview.start()
+    recogniser = FaceRecogniser(headless=True, preview=preview)
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from Metrics import metrics
+
+DEFAULT_PORT = 8081
+
+
+class PreviewStream:
+    """
+    Latest-wins MJPEG preview encoded on its own thread.
+
+    Public Interface:
+    - submit(frame, result): Offers a frame for preview (never blocks, never copies)
+    - start() / stop(): Runs the encoder thread and the optional HTTP server
+    - stats(): Submitted, encoded and skipped frame counts and connected clients
+    """
+
+    MAX_FPS = 5.0
+    JPEG_QUALITY = 70
+    BOUNDARY = "frame"
+
+    def __init__(self, annotate: Callable[[np.ndarray, Any], np.ndarray] = None, max_fps: float = None,
+                 port: int = None, host: str = "127.0.0.1", output_file: str = None,
+                 width: int = None, quality: int = None):
+        """
+        Initialise the stream without starting it.
+
+        Args:
+            annotate: Draws a result onto a frame (e.g. FaceRecogniser.process_frame); may be set later
+            max_fps: Maximum preview frame rate (default: MAX_FPS)
+            port: Serve MJPEG over HTTP on this port (None: no server, 0: any free port)
+            host: Interface to bind (loopback by default)
+            output_file: Append the MJPEG stream to this file
+            width: Downscale preview frames to this width before encoding
+            quality: JPEG quality 0-100 (default: JPEG_QUALITY)
+        """
+        self.annotate = annotate
+        self.max_fps = max_fps or self.MAX_FPS
+        self.port = port
+        self.host = host
+        self.output_file = output_file
+        self.width = width
+        self.quality = quality or self.JPEG_QUALITY
+
+        self.submitted = 0
+        self.encoded = 0
+        self.clients = 0
+        self.latest_jpeg: Optional[bytes] = None
+
+        self._pending = None
+        self._pending_lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._jpeg_ready = threading.Condition()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._file = None
+
+    # ========== PUBLIC METHODS ==========
+
+    def submit(self, frame: np.ndarray, result: Any = None):
+        """
+        Offer the newest frame and its recognition result.
+
+        Only a reference is stored; an unencoded earlier frame is replaced. The caller must not
+        draw on the frame afterwards.
+        """
+        with self._pending_lock:
+            self._pending = (frame, result)
+            self.submitted += 1
+        self._frame_ready.set()
+
+    def start(self):
+        """Start the encoder thread and the configured outputs (no-op if already running)."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        if self.output_file:
+            self._file = open(self.output_file, "ab")
+        if self.port is not None:
+            self._start_server()
+        self._thread = threading.Thread(target=self._encode_loop, name="PreviewStream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop encoding, disconnect clients and close the file."""
+        self._stop_event.set()
+        self._frame_ready.set()
+        with self._jpeg_ready:
+            self._jpeg_ready.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        return {"submitted": self.submitted, "encoded": self.encoded,
+                "skipped": max(0, self.submitted - self.encoded), "clients": self.clients}
+
+    # ========== PRIVATE METHODS ==========
+
+    def _encode_loop(self):
+        """Encode the newest submitted frame, at most max_fps times per second."""
+        interval = 1.0 / self.max_fps
+        next_slot = time.monotonic()
+        while not self._stop_event.is_set():
+            self._frame_ready.wait()
+            delay = next_slot - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                break
+            with self._pending_lock:
+                pending, self._pending = self._pending, None
+                self._frame_ready.clear()
+            if pending is None:
+                continue
+            next_slot = time.monotonic() + interval
+
+            try:
+                with metrics.timer("preview.encode"):
+                    jpeg = self._encode(*pending)
+            except Exception as e:
+                print(f"Preview encoding error: {e}")
+                continue
+            self.encoded += 1
+            metrics.inc("preview.frames")
+            self._publish(jpeg)
+
+    def _encode(self, frame: np.ndarray, result: Any) -> bytes:
+        """Annotate a copy of the frame and compress it."""
+        import cv2  # deferred so constructing the preview does not load OpenCV before the window is up
+        frame = frame.copy()
+        if self.annotate is not None and result is not None:
+            frame = self.annotate(frame, result)
+        if self.width and frame.shape[1] > self.width:
+            height = frame.shape[0] * self.width // frame.shape[1]
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        return buffer.tobytes()
+
+    def _publish(self, jpeg: bytes):
+        """Hand a JPEG to the file and to every connected HTTP client."""
+        if self._file is not None:
+            try:
+                self._file.write(jpeg)
+                self._file.flush()
+            except OSError as e:
+                print(f"Error writing preview file {self.output_file}: {e}")
+        with self._jpeg_ready:
+            self.latest_jpeg = jpeg
+            self._jpeg_ready.notify_all()
+
+    def _start_server(self):
+        """Serve multipart/x-mixed-replace MJPEG to any number of local clients."""
+        stream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={stream.BOUNDARY}")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                stream.clients += 1
+                last = None
+                try:
+                    while not stream._stop_event.is_set():
+                        with stream._jpeg_ready:
+                            while stream.latest_jpeg is last and not stream._stop_event.is_set():
+                                stream._jpeg_ready.wait(1.0)
+                            jpeg = last = stream.latest_jpeg
+                        if jpeg is None:
+                            continue
+                        self.wfile.write(f"--{stream.BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                         f"Content-Length: {len(jpeg)}\r\n\r\n".encode())
+                        self.wfile.write(jpeg)
+                        self.wfile.write(b"\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    stream.clients -= 1
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="PreviewServer", daemon=True).start()
+        print(f"Preview stream at http://{self.host}:{self.port}/")
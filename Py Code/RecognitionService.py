@@ -0,0 +1,347 @@
+"""
+File: RecognitionService.py
+
+Description:
+Resident, pre-warmed face recognition service.
+Constructing a FaceRecogniser opens and warms up the camera and loads the authorised gallery,
+which costs several seconds. This service builds the recogniser once and keeps the camera and
+encodings in memory between door approaches, so a "FacialRecognition" request only pays for
+the recognition itself.
+
+Lifecycle:
+    Stopped --start()--> Idle --arm()--> Armed --recognise()--> Recognising --> Idle
+    An idle service powers the camera down after IDLE_POWER_DOWN_TIME seconds; the next arm()
+    powers it back up. The camera is health-checked periodically while idle and re-opened if
+    it stops delivering frames.
+
+Worker process:
+    With out_of_process=True the recogniser is a RecognitionWorker.ProcessRecogniser: the same
+    lifecycle applies, but the analysis runs in a supervised child process fed through shared
+    memory, so the GUI stays responsive and a recogniser crash does not take the alarm down.
+
+Cold start:
+    Importing FacialRecognition loads OpenCV, dlib and its models, so it is deferred until the
+    service starts. start_in_background() builds everything on a worker thread, letting the GUI
+    and serial link come up immediately, and records how long it took until the first frame
+    was ready for a decision (startup_report).
+"""
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+from Metrics import metrics
+
+if TYPE_CHECKING:
+    from FacialRecognition import FaceRecogniser
+
+
+class RecognitionService:
+    """
+    Long-lived owner of a FaceRecogniser with an explicit lifecycle.
+
+    Public Interface:
+    - start(): Builds the recogniser (camera + gallery) and starts the idle monitor
+    - start_in_background(): Runs start() on a worker thread; wait_ready() blocks until done
+    - arm(): Makes sure the camera is powered up and ready for a request
+    - recognise(): Runs recognition until a decision, then returns to idle
+    - idle(): Marks the service idle, starting the power-down timer
+    - power_down(): Releases the camera while keeping encodings in memory
+    - health_check(): Checks the camera and re-opens it if it stopped delivering frames
+    - record_evidence(reason): Saves an evidence clip around now (needs an EvidenceBuffer)
+    - stop(): Releases everything
+
+    Usage:
+        service = RecognitionService()
+        service.start()
+        message = service.recognise()
+        service.stop()
+    """
+
+    STOPPED = "Stopped"
+    IDLE = "Idle"
+    ARMED = "Armed"
+    RECOGNISING = "Recognising"
+
+    IDLE_POWER_DOWN_TIME = 300.0
+    HEALTH_CHECK_INTERVAL = 30.0
+    MONITOR_INTERVAL = 1.0
+
+    def __init__(self, recogniser_factory: Callable[..., "FaceRecogniser"] = None,
+                 idle_power_down_time: float = None, health_check_interval: float = None,
+                 pipelined: bool = False, launched_at: float = None, out_of_process: bool = False,
+                 **recogniser_kwargs):
+        """
+        Initialise the service without touching the camera or importing the recognition stack.
+
+        Args:
+            recogniser_factory: Callable that builds the FaceRecogniser (default: FaceRecogniser,
+                                imported when the service starts)
+            idle_power_down_time: Seconds idle before the camera is released (None: class default,
+                                  0: never power down)
+            health_check_interval: Seconds between camera health checks while idle
+            pipelined: Use the threaded recognition pipeline instead of the serial loop
+            launched_at: time.monotonic() at application launch, the reference for startup_report
+            out_of_process: Run recognition in a supervised worker process (RecognitionWorker)
+                            while the camera stays in this process
+            **recogniser_kwargs: Forwarded to recogniser_factory
+        """
+        self.recogniser_factory = recogniser_factory
+        self.recogniser_kwargs = recogniser_kwargs
+        self.pipelined = pipelined
+        self.out_of_process = out_of_process
+        self.idle_power_down_time = (self.IDLE_POWER_DOWN_TIME if idle_power_down_time is None
+                                     else idle_power_down_time)
+        self.health_check_interval = (self.HEALTH_CHECK_INTERVAL if health_check_interval is None
+                                      else health_check_interval)
+
+        self.launched_at = time.monotonic() if launched_at is None else launched_at
+        self.startup_report: Dict[str, float] = {}
+        self.startup_error: Optional[Exception] = None
+
+        self.recogniser: Optional["FaceRecogniser"] = None
+        self.state = self.STOPPED
+        self.camera_powered = False
+        self.last_used = time.monotonic()
+        self.last_health_check = time.monotonic()
+
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._monitor_thread = None
+        self._ready_event = threading.Event()
+
+    # ========== PUBLIC METHODS ==========
+
+    def start(self):
+        """
+        Build the recogniser and start the idle monitor.
+
+        Raises:
+            FileNotFoundError, RuntimeError, ValueError: If the recogniser cannot be initialised
+        """
+        with self._lock:
+            if self.state != self.STOPPED:
+                return
+            began = time.monotonic()
+            factory = self.recogniser_factory
+            if factory is None and self.out_of_process:
+                from RecognitionWorker import ProcessRecogniser
+                factory = ProcessRecogniser
+            elif factory is None:
+                from FacialRecognition import FaceRecogniser
+                factory = FaceRecogniser
+            imported = time.monotonic()
+            self.recogniser = factory(**self.recogniser_kwargs)
+            initialised = time.monotonic()
+            try:
+                self._warm_first_frame()
+            except BaseException:
+                # Stay STOPPED without holding the camera, so a later start() begins cleanly
+                self.recogniser.release_resources()
+                self.recogniser = None
+                raise
+            ready = time.monotonic()
+
+            self.camera_powered = True
+            self._stop_event.clear()
+            self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+            self.state = self.IDLE
+            self.last_used = time.monotonic()
+            self._monitor_thread.start()
+
+        self.startup_report = {"import": imported - began, "initialise": initialised - imported,
+                               "first_frame": ready - initialised, "time_to_ready": ready - self.launched_at}
+        for stage, seconds in self.startup_report.items():
+            metrics.set(f"startup.{stage}", seconds)
+        print("Recognition service started: " +
+              ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in self.startup_report.items()))
+
+    def start_in_background(self) -> threading.Thread:
+        """
+        Run start() on a daemon thread so the caller (GUI, serial link) is not held up.
+
+        Errors are kept in startup_error; a later start() or recognise() retries.
+
+        Returns:
+            The started thread
+        """
+        def run():
+            try:
+                self.start()
+                self.startup_error = None
+            except Exception as e:
+                self.startup_error = e
+                print(f"Error: Recognition service failed to start: {e}")
+            finally:
+                self._ready_event.set()
+
+        self._ready_event.clear()
+        thread = threading.Thread(target=run, name="RecognitionService-start", daemon=True)
+        thread.start()
+        return thread
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """
+        Wait for a background start to finish.
+
+        Returns:
+            bool: True if the service is started
+        """
+        self._ready_event.wait(timeout)
+        return self.state != self.STOPPED
+
+    def arm(self):
+        """
+        Prepare for a recognition request, powering the camera up if it was released.
+
+        Raises:
+            RuntimeError: If the service is not started or the camera cannot be opened
+        """
+        with self._lock:
+            if self.state == self.STOPPED:
+                raise RuntimeError("Recognition service is not started")
+            if not self.camera_powered:
+                print("Powering camera up")
+                self.recogniser.open_camera()
+                self.camera_powered = True
+                self.last_health_check = time.monotonic()
+            self.state = self.ARMED
+
+    def recognise(self) -> Optional[str]:
+        """
+        Run recognition until a decision is reached, then return to idle.
+
+        Returns:
+            The recogniser's decision ("Authorised", "Unauthorised" or "Timeout"), or None if
+            recognition was stopped
+        """
+        with self._lock:
+            if self.state == self.STOPPED:
+                self.start()
+            if self.state != self.ARMED:
+                self.arm()
+            self.state = self.RECOGNISING
+            try:
+                if self.pipelined:
+                    return self.recogniser.run_pipelined_recognition(release_on_exit=False)
+                return self.recogniser.run_realtime_recognition(release_on_exit=False)
+            finally:
+                self.idle()
+
+    def idle(self):
+        """Mark the service idle and restart the power-down timer."""
+        with self._lock:
+            if self.state == self.STOPPED:
+                return
+            self.state = self.IDLE
+            self.last_used = time.monotonic()
+
+    def power_down(self):
+        """Release the camera but keep the gallery encodings in memory."""
+        with self._lock:
+            if self.recogniser is not None and self.camera_powered:
+                print("Idle: powering camera down")
+                self.recogniser.close_camera()
+                self.camera_powered = False
+
+    def health_check(self) -> bool:
+        """
+        Check that the camera delivers frames, re-opening it once if it does not.
+
+        Returns:
+            bool: True if the camera is healthy (or intentionally powered down)
+        """
+        with self._lock:
+            self.last_health_check = time.monotonic()
+            if self.recogniser is None:
+                return False
+            if not self.camera_powered:
+                return True
+            if self.recogniser.camera_healthy():
+                return True
+
+            print("Camera health check failed: re-opening camera")
+            try:
+                self.recogniser.open_camera()
+            except RuntimeError as e:
+                print(f"Camera could not be re-opened: {e}")
+                self.camera_powered = False
+                return False
+            return self.recogniser.camera_healthy()
+
+    def record_evidence(self, reason: str) -> bool:
+        """
+        Trigger the recogniser's EvidenceBuffer, e.g. when the controller reports "AlarmActive".
+
+        A running recognition session already feeds the buffer. Otherwise the camera is read
+        here for the clip's post-event window, so a request arriving meanwhile waits at most
+        post_seconds.
+
+        Returns:
+            bool: False if there is no evidence buffer or the service is not started
+
+        Raises:
+            RuntimeError: If the camera cannot be powered up
+        """
+        evidence = getattr(self.recogniser, "evidence", None)
+        if evidence is None:
+            return False
+        evidence.trigger(reason)
+        if not self._lock.acquire(blocking=False):
+            return True  # a session holds the camera and is pushing frames
+        try:
+            if self.state == self.STOPPED:
+                return False
+            self.arm()
+            until = time.monotonic() + evidence.post_seconds
+            while time.monotonic() < until:
+                ret, frame = self.recogniser.video_capture.read()
+                if ret and frame is not None:
+                    evidence.push(frame)
+                else:
+                    time.sleep(0.05)
+            return True
+        finally:
+            self.idle()
+            self._lock.release()
+
+    def stop(self):
+        """Stop the monitor and release all resources."""
+        self._stop_event.set()
+        if self._monitor_thread is not None:
+            self._monitor_thread.join(timeout=self.MONITOR_INTERVAL * 2)
+            self._monitor_thread = None
+        with self._lock:
+            if self.recogniser is not None:
+                self.recogniser.release_resources()
+                self.recogniser = None
+            self.camera_powered = False
+            self.state = self.STOPPED
+        print("Recognition service stopped")
+
+    # ========== PRIVATE METHODS ==========
+
+    def _warm_first_frame(self):
+        """Read and analyse one frame, so the first request does not pay for dlib's first-call setup."""
+        capture = self.recogniser.video_capture
+        if capture is None:
+            return
+        ret, frame = capture.read()
+        if ret and frame is not None:
+            self.recogniser.analyse_frame(frame)
+
+    def _monitor_loop(self):
+        """Apply the idle power-down policy and periodic health checks."""
+        while not self._stop_event.wait(self.MONITOR_INTERVAL):
+            # Never wait on a running recognition session
+            if not self._lock.acquire(blocking=False):
+                continue
+            try:
+                if self.state != self.IDLE or not self.camera_powered:
+                    continue
+                now = time.monotonic()
+                if self.idle_power_down_time and now - self.last_used >= self.idle_power_down_time:
+                    self.power_down()
+                elif self.health_check_interval and now - self.last_health_check >= self.health_check_interval:
+                    self.health_check()
+            finally:
+                self._lock.release()
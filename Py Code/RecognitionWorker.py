@@ -0,0 +1,621 @@
+"""
+File: RecognitionWorker.py
+
+Description:
+Face recognition in a supervised child process.
+The camera stays in the main process; the gallery, dlib and the whole analysis run in a worker
+process. The GUI and the serial link therefore never compete with numpy and dlib for the GIL,
+and a crash inside OpenCV or dlib only kills the worker. The alarm path keeps running, and
+the next frame goes to a freshly started worker.
+
+Frame transport:
+    Frames are captured straight into a ring of slots in shared memory (VideoCapture.read
+    fills the slot in place) and only (slot, sequence, timestamp) goes over a Pipe. The
+    worker analyses the slot in place, always skipping to the newest frame it has been sent,
+    and returns each slot with a small decision message (names, boxes, stage timings).
+    A slot is only written again once the worker has returned it.
+
+Supervision:
+    A worker that exits, breaks the pipe or stays on one frame longer than HANG_TIMEOUT is
+    killed and restarted. Restarts are logged, counted in metrics (worker.restarts), and
+    capped at MAX_RESTARTS per RESTART_WINDOW before recognition reports an error. During a
+    session the replacement loads in the background and the loop polls for its "ready".
+
+Decisions:
+    Results are voted on in this process by a DecisionEngine, so the deadline holds even while
+    the worker is restarting. Each session only counts results for frames it sent itself;
+    late results from the previous session are drained and ignored.
+
+Usage:
+    service = RecognitionService(out_of_process=True)
+    or directly:
+    recogniser = ProcessRecogniser(camera_index=0, headless=True)
+    message = recogniser.run_realtime_recognition(release_on_exit=False)
+"""
+import multiprocessing
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from DecisionEngine import DecisionEngine
+from Metrics import metrics
+
+
+@dataclass
+class WorkerResult:
+    """A decision returned by the worker for one frame."""
+    sequence: int
+    locations: List[Tuple[int, int, int, int]]
+    names: List[str]
+    distances: List[float]
+    authorised: bool
+    timings: Dict[str, float] = field(default_factory=dict)
+    latency: float = 0.0  # capture to decision, seconds
+    reused: bool = False  # tracked result of a static frame; carries no new evidence
+    fresh: List[bool] = field(default_factory=list)  # per face: encoded in this frame (see FrameResult)
+
+
+class SharedFrameRing:
+    """
+    Fixed ring of equally shaped uint8 frames in one shared memory block.
+
+    The creating process owns (and unlinks) the block; other processes attach by name.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], slots: int, name: str = None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.owner = name is None
+        size = int(np.prod(self.shape)) * slots
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Spawned children share the parent's resource tracker, so attaching here does not
+            # schedule a second unlink
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def close(self):
+        """Drop the mapping (and remove the block if this process created it)."""
+        self.frames = None
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _worker_main(conn, ring_name: str, shape: Tuple[int, ...], slots: int, recogniser_kwargs: dict,
+                 show_window: bool):
+    """Child process: load the recogniser, then analyse frames from the ring until told to stop."""
+    ring = SharedFrameRing(shape, slots, name=ring_name)
+    try:
+        from FacialRecognition import FaceRecogniser
+        recogniser = FaceRecogniser(camera_index=None, headless=not show_window, **recogniser_kwargs)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        ring.close()
+        return
+    conn.send(("ready", len(recogniser.gallery)))
+
+    pending = None
+    try:
+        while True:
+            message = pending or conn.recv()
+            pending = None
+            kind = message[0]
+            if kind == "stop":
+                break
+            if kind == "reset":
+                recogniser.motion_gate.reset()
+                recogniser.face_tracker.clear()
+                continue
+
+            # Latest wins: hand back every older frame that is already waiting
+            while conn.poll():
+                newer = conn.recv()
+                if newer[0] != "frame":
+                    pending = newer
+                    break
+                conn.send(("release", message[1]))
+                message = newer
+
+            _, slot, sequence, captured_at = message
+            frame = ring.frames[slot]
+            result = recogniser.analyse_frame(frame)
+            quit_requested = False
+            if show_window:
+                cv2.imshow('Face Recognition', recogniser.process_frame(frame.copy(), result))
+                quit_requested = cv2.waitKey(1) & 0xFF == ord('q')
+            del frame
+            conn.send(("result", slot, sequence, captured_at, result.locations, result.names,
+                       [float(distance) for distance in result.distances], result.authorised, result.timings,
+                       result.reused, result.fresh))
+            if quit_requested:
+                conn.send(("quit",))
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass  # parent went away
+    finally:
+        recogniser.release_resources()
+        ring.close()
+
+
+class ProcessRecogniser:
+    """
+    FaceRecogniser-compatible front end that keeps the camera here and recognition in a child process.
+
+    Public Interface (the subset RecognitionService uses):
+    - run_realtime_recognition(release_on_exit, show_window): Returns the decision outcome, or None
+    - run_pipelined_recognition(...): Same as run_realtime_recognition (capture and analysis
+      already overlap across the two processes)
+    - analyse_frame(frame): One frame through the worker
+    - open_camera() / close_camera() / camera_healthy(): Camera control
+    - release_resources(): Stops the worker and releases the camera and shared memory
+    - process_frame(frame, result): Draws a WorkerResult (used for the preview stream)
+    """
+
+    SLOTS = 4
+    STARTUP_TIMEOUT = 120.0
+    HANG_TIMEOUT = 10.0
+    MAX_RESTARTS = 5
+    RESTART_WINDOW = 60.0
+    MONITOR_INTERVAL = 1.0
+    CAMERA_WARMUP_TIME = 2.0
+    MAX_RETRIES = 3
+
+    def __init__(self, camera_index: int = 0, headless: bool = False, preview=None, decision_deadline: float = None,
+                 frame_budget: int = None, evidence=None, **recogniser_kwargs):
+        """
+        Open the camera and start the worker; the camera warms up while the worker loads the gallery.
+
+        Args:
+            camera_index: Index of the camera to use
+            headless: Never open a window (otherwise the worker shows the annotated frames)
+            preview: Optional started PreviewStream; fed from this process
+            decision_deadline: Seconds a recognition session may run (default: DecisionEngine.DEADLINE)
+            frame_budget: Frames a recognition session may analyse (default: DecisionEngine.FRAME_BUDGET)
+            evidence: Optional started EvidenceBuffer; fed from this process and triggered by
+                      unauthorised faces in the worker's results
+            **recogniser_kwargs: Forwarded to FaceRecogniser in the worker (must be picklable)
+
+        Raises:
+            RuntimeError: If the camera cannot be opened or the worker does not start
+        """
+        self.camera_index = camera_index
+        self.headless = headless
+        self.preview = preview
+        if preview is not None and preview.annotate is None:
+            preview.annotate = self.process_frame
+        self.evidence = evidence
+        self.recogniser_kwargs = recogniser_kwargs
+        self.decision_engine = DecisionEngine(deadline=decision_deadline, frame_budget=frame_budget)
+
+        self.video_capture = None
+        self.ring: Optional[SharedFrameRing] = None
+        self.process = None
+        self.conn = None
+        self.restarts = 0
+        self.gallery_size = 0
+        self._show_window = not headless
+        self._context = multiprocessing.get_context("spawn")
+        self._free_slots: List[int] = []
+        self._in_flight: Dict[int, float] = {}  # slot -> time sent
+        self._sequence = 0
+        self._session_start = 0  # first sequence number of the current session
+        self._starting_since: Optional[float] = None  # set while a replacement worker loads
+        self._quit_requested = False
+        self._restart_times = deque()
+        self._lock = threading.RLock()
+        self._stop_event = threading.Event()
+
+        started = time.monotonic()
+        try:
+            self._open_capture()
+            frame = self._read_frame()
+            self._create_ring(frame.shape)
+            self._start_worker(wait=False)
+            time.sleep(max(0.0, self.CAMERA_WARMUP_TIME - (time.monotonic() - started)))
+            print("Camera ready")
+            self._wait_ready()
+        except BaseException:
+            # Never leave the camera, the worker or the shared memory behind a failed constructor
+            self.release_resources()
+            raise
+
+        self._monitor_thread = threading.Thread(target=self._monitor_loop, name="RecognitionWorker-monitor",
+                                                daemon=True)
+        self._monitor_thread.start()
+
+    # ========== PUBLIC METHODS ==========
+
+    def run_realtime_recognition(self, release_on_exit: bool = True, show_window: bool = None) -> Optional[str]:
+        """
+        Stream frames to the worker until the decision engine decides.
+
+        Args:
+            release_on_exit: Release the camera and stop the worker when the loop ends
+            show_window: Have the worker display annotated frames (default: not headless)
+
+        Returns:
+            "Authorised", "Unauthorised" or "Timeout"; None if the window was closed or
+            recognition was interrupted
+
+        Raises:
+            RuntimeError: If the worker keeps failing (MAX_RESTARTS within RESTART_WINDOW)
+        """
+        with self._lock:
+            if show_window is None:
+                show_window = not self.headless
+            if show_window != self._show_window:
+                self._show_window = show_window
+                self._restart_worker("display mode changed", count=False, wait=False)
+            if self.video_capture is None or not self.video_capture.isOpened():
+                self.open_camera()
+            print("Starting real-time recognition (worker process)." + ("" if show_window else " (headless)"))
+            self._receive(0)  # drop results that arrived after the last session ended
+            self._session_start = self._sequence + 1
+            self._quit_requested = False
+            self._send(("reset",))
+            self.decision_engine.start()
+            retry_count = 0
+            try:
+                while True:
+                    decision = self.decision_engine.check()
+                    if decision is not None:
+                        return decision.outcome
+                    self._check_worker(wait=False)
+                    if self._free_slots and self._starting_since is None:
+                        slot = self._free_slots.pop()
+                        if not self._capture_into(slot):
+                            self._free_slots.append(slot)
+                            retry_count += 1
+                            if retry_count > self.MAX_RETRIES:
+                                print("Camera error: Attempting to reconnect...")
+                                self.open_camera()
+                                retry_count = 0
+                            else:
+                                print(f"Warning: Frame read failed (attempt {retry_count}/{self.MAX_RETRIES})")
+                                time.sleep(0.5)
+                            continue
+                        retry_count = 0
+                        self._send_frame(slot)
+                    decision = self._collect(timeout=0 if self._free_slots and self._starting_since is None
+                                             else 0.05)
+                    if decision == "quit":
+                        return None
+                    if decision is not None:
+                        return decision
+            except KeyboardInterrupt:
+                print("\nStopping recognition...")
+            finally:
+                if release_on_exit:
+                    self.release_resources()
+                elif self._worker_alive():
+                    self._receive(0)
+
+    def run_pipelined_recognition(self, release_on_exit: bool = True, show_window: bool = None) -> Optional[str]:
+        """Capture and analysis already run concurrently in two processes; same as run_realtime_recognition."""
+        return self.run_realtime_recognition(release_on_exit, show_window)
+
+    def analyse_frame(self, frame: np.ndarray) -> Optional[WorkerResult]:
+        """
+        Analyse one frame in the worker and wait for its result.
+
+        Returns:
+            WorkerResult, or None if the worker failed on it or still holds every slot
+        """
+        with self._lock:
+            self._check_worker()
+            self._wait_started()
+            if frame.shape != self.ring.shape:
+                self._create_ring(frame.shape)
+                self._restart_worker("frame size changed", count=False)
+            deadline = time.monotonic() + self.HANG_TIMEOUT
+            while not self._free_slots:
+                if time.monotonic() >= deadline or not self._worker_alive():
+                    return None
+                self._receive(0.05)
+            slot = self._free_slots.pop()
+            np.copyto(self.ring.frames[slot], frame)
+            sequence = self._send_frame(slot)
+            deadline = time.monotonic() + self.HANG_TIMEOUT
+            while time.monotonic() < deadline:
+                for result in self._receive(0.05):
+                    if result.sequence == sequence:
+                        return result
+                if not self._worker_alive():
+                    break
+            return None
+
+    def open_camera(self):
+        """
+        Open (or re-open) the camera; the worker keeps running.
+
+        Raises:
+            RuntimeError: If camera cannot be opened
+        """
+        with self._lock:
+            self.close_camera()
+            self._open_capture()
+            time.sleep(self.CAMERA_WARMUP_TIME)
+            print("Camera ready")
+
+    def close_camera(self):
+        """Release the camera; the worker keeps its gallery loaded."""
+        if self.video_capture is not None:
+            self.video_capture.release()
+            self.video_capture = None
+
+    def camera_healthy(self) -> bool:
+        """
+        Check that the camera is open and still delivers frames.
+
+        Returns:
+            bool: True if a frame could be grabbed
+        """
+        if self.video_capture is None or not self.video_capture.isOpened():
+            return False
+        return bool(self.video_capture.grab())
+
+    def release_resources(self):
+        """Stop the worker and the monitor, release the camera and remove the shared memory."""
+        self._stop_event.set()
+        with self._lock:
+            self._stop_worker()
+            self.close_camera()
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+        print("Resources released")
+
+    def process_frame(self, frame: np.ndarray, result: WorkerResult) -> np.ndarray:
+        """Draw face boxes and names from a worker result onto a frame."""
+        for (top, right, bottom, left), name in zip(result.locations, result.names):
+            box_colour = (0, 0, 255) if name == "Unauthorised" else (0, 255, 0)
+            cv2.rectangle(frame, (left, top), (right, bottom), box_colour, 2)
+            cv2.rectangle(frame, (left, bottom - 35), (right, bottom), box_colour, cv2.FILLED)
+            cv2.putText(frame, name, (left + 6, bottom - 6), cv2.FONT_HERSHEY_DUPLEX, 0.8, (255, 255, 255), 1)
+        return frame
+
+    # ========== PRIVATE METHODS ==========
+
+    def _open_capture(self, width: int = 1280, height: int = 720):
+        print("Initialising camera...")
+        self.video_capture = cv2.VideoCapture(self.camera_index)
+        if not self.video_capture.isOpened():
+            raise RuntimeError("Camera could not be opened. Check if it's connected or in use.")
+        self.video_capture.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.video_capture.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        print(f"Camera resolution set to: {int(self.video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))}x"
+              f"{int(self.video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))}")
+
+    def _read_frame(self) -> np.ndarray:
+        for _ in range(self.MAX_RETRIES + 1):
+            ret, frame = self.video_capture.read()
+            if ret and frame is not None:
+                return frame
+            time.sleep(0.5)
+        raise RuntimeError("Camera delivers no frames")
+
+    def _create_ring(self, shape: Tuple[int, ...]):
+        if self.ring is not None:
+            self.ring.close()
+        self.ring = SharedFrameRing(shape, self.SLOTS)
+        self._free_slots = list(range(self.SLOTS))
+        self._in_flight.clear()
+
+    def _capture_into(self, slot: int) -> bool:
+        """Read the next camera frame directly into a ring slot."""
+        target = self.ring.frames[slot]
+        ret, frame = self.video_capture.read(target)
+        if not ret or frame is None:
+            return False
+        if frame.shape != self.ring.shape:
+            # Camera came back at another resolution: new ring, new worker
+            self._create_ring(frame.shape)
+            self._restart_worker("frame size changed", count=False)
+            return False
+        if frame is not target and not np.shares_memory(frame, target):
+            np.copyto(target, frame)  # backend ignored the output buffer
+        if self.evidence is not None:
+            self.evidence.push(target)
+        return True
+
+    def _send_frame(self, slot: int) -> int:
+        self._sequence += 1
+        now = time.monotonic()
+        self._in_flight[slot] = now
+        self._send(("frame", slot, self._sequence, now))
+        return self._sequence
+
+    def _send(self, message: tuple):
+        try:
+            self.conn.send(message)
+        except (BrokenPipeError, EOFError, OSError):
+            pass  # _check_worker restarts it on the next pass
+
+    def _collect(self, timeout: float) -> Optional[str]:
+        """Handle worker messages; returns the decision outcome, "quit" (q pressed in the window) or None."""
+        for result in self._receive(timeout):
+            if result.sequence < self._session_start:
+                continue  # sent by an earlier session
+            decision = self.decision_engine.add(result)
+            if decision is not None:
+                return decision.outcome
+        if self._quit_requested:
+            self._quit_requested = False
+            return "quit"
+        return None
+
+    def _receive(self, timeout: float) -> List[WorkerResult]:
+        """Read every waiting message, returning slots to the free list and recording results."""
+        results = []
+        try:
+            ready = self.conn.poll(timeout)
+            while ready:
+                message = self.conn.recv()
+                kind = message[0]
+                if kind in ("release", "result"):
+                    slot = message[1]
+                    self._in_flight.pop(slot, None)
+                    if kind == "result":
+                        results.append(self._record_result(message))
+                    self._free_slots.append(slot)
+                elif kind == "ready":
+                    self._mark_ready(message[1])
+                elif kind == "quit":
+                    self._quit_requested = True
+                elif kind == "error":
+                    print(f"Recognition worker error: {message[1]}")
+                ready = self.conn.poll()
+        except (EOFError, OSError):
+            pass  # worker died; _check_worker handles it
+        return results
+
+    def _record_result(self, message: tuple) -> WorkerResult:
+        _, slot, sequence, captured_at, locations, names, distances, authorised, timings, reused, fresh = message
+        result = WorkerResult(sequence, locations, names, distances, authorised, timings,
+                              time.monotonic() - captured_at, reused, fresh)
+        for stage, seconds in timings.items():
+            metrics.observe(f"recognition.{stage}", seconds)
+        metrics.observe("worker.latency", result.latency)
+        metrics.inc("recognition.frames")
+        if self.preview is not None:
+            # The slot is rewritten once freed, so the preview gets its own copy
+            self.preview.submit(self.ring.frames[slot].copy(), result)
+        if self.evidence is not None and "Unauthorised" in names:
+            self.evidence.trigger("unauthorised")
+        return result
+
+    def _worker_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def _check_worker(self, wait: bool = True):
+        """
+        Restart a dead, hung or never-ready worker.
+
+        Args:
+            wait: Block until a replacement is ready; otherwise it loads in the background
+                  and _receive picks up its "ready"
+        """
+        if not self._worker_alive():
+            self._restart_worker(f"exited with code {self.process.exitcode if self.process else None}", wait=wait)
+            return
+        now = time.monotonic()
+        if self._starting_since is not None:
+            if now - self._starting_since > self.STARTUP_TIMEOUT:
+                self._restart_worker(f"not ready after {self.STARTUP_TIMEOUT:.0f}s", wait=wait)
+            return
+        if self._in_flight and now - min(self._in_flight.values()) > self.HANG_TIMEOUT:
+            self._restart_worker(f"no result for {self.HANG_TIMEOUT:.0f}s", wait=wait)
+
+    def _restart_worker(self, reason: str, count: bool = True, wait: bool = True):
+        if count:
+            now = time.monotonic()
+            while self._restart_times and now - self._restart_times[0] > self.RESTART_WINDOW:
+                self._restart_times.popleft()
+            if len(self._restart_times) >= self.MAX_RESTARTS:
+                raise RuntimeError(f"Recognition worker failed {self.MAX_RESTARTS} times "
+                                   f"in {self.RESTART_WINDOW:.0f}s; last: {reason}")
+            self._restart_times.append(now)
+            self.restarts += 1
+            metrics.inc("worker.restarts")
+            print(f"Recognition worker {reason}; restarting")
+        self._stop_worker(graceful=not count)
+        self._free_slots = list(range(self.SLOTS))
+        self._in_flight.clear()
+        self._start_worker(wait)
+
+    def _start_worker(self, wait: bool = True):
+        parent_conn, child_conn = self._context.Pipe()
+        # The worker is daemonic (so it never outlives this process), and daemonic processes
+        # may not start children: encode new images in-process instead of in a pool
+        recogniser_kwargs = dict(self.recogniser_kwargs, enrollment_workers=1)
+        self.process = self._context.Process(
+            target=_worker_main, name="RecognitionWorker", daemon=True,
+            args=(child_conn, self.ring.name, self.ring.shape, self.SLOTS, recogniser_kwargs, self._show_window))
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self._starting_since = time.monotonic()
+        if wait:
+            self._wait_ready()
+
+    def _wait_started(self):
+        """
+        Wait for a replacement worker that was started in the background.
+
+        Raises:
+            RuntimeError: If it exits or does not report ready within STARTUP_TIMEOUT
+        """
+        while self._starting_since is not None:
+            if not self._worker_alive():
+                self._restart_worker(f"exited with code {self.process.exitcode if self.process else None}")
+            elif time.monotonic() - self._starting_since > self.STARTUP_TIMEOUT:
+                self._stop_worker(graceful=False)
+                raise RuntimeError("Recognition worker did not start in time")
+            else:
+                self._receive(0.05)
+
+    def _mark_ready(self, gallery_size: int):
+        self._starting_since = None
+        self.gallery_size = gallery_size
+        print(f"Recognition worker ready (pid {self.process.pid}, {gallery_size} gallery entries)")
+
+    def _wait_ready(self):
+        """
+        Raises:
+            RuntimeError: If the worker fails to load or does not report ready in time
+        """
+        if not self.conn.poll(self.STARTUP_TIMEOUT):
+            self._stop_worker(graceful=False)
+            raise RuntimeError("Recognition worker did not start in time")
+        try:
+            kind, detail = self.conn.recv()
+        except (EOFError, OSError):
+            self.process.join(timeout=1.0)
+            kind, detail = "error", f"exited with code {self.process.exitcode}"
+        if kind != "ready":
+            self._stop_worker()
+            raise RuntimeError(f"Recognition worker failed to start: {detail}")
+        self._mark_ready(detail)
+
+    def _stop_worker(self, graceful: bool = True):
+        if self.process is None:
+            return
+        if graceful:
+            self._send(("stop",))
+            self.process.join(timeout=2.0)
+        # A hung or crashed worker is killed outright: waiting on it would stall the session loop
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+        self.process = None
+        self._starting_since = None
+
+    def _monitor_loop(self):
+        """
+        While idle, drain late results and restart a crashed or unready worker, so the next
+        request does not pay for it.
+        """
+        while not self._stop_event.wait(self.MONITOR_INTERVAL):
+            if not self._lock.acquire(blocking=False):
+                continue  # a session is running and checks the worker itself
+            try:
+                if self.process is None:
+                    continue  # released
+                self._receive(0)
+                self._check_worker()
+            except RuntimeError as e:
+                print(f"Error: {e}")
+            finally:
+                self._lock.release()
@@ -0,0 +1,492 @@
+"""
+File: Supervisor.py
+
+Description:
+One host process serving several door controllers.
+Every controller gets its own SerialLink and door state, all on one asyncio event loop, and a
+single status window shows one panel per door. Recognition requests from all doors go to a
+shared RecognitionPool: one RecognitionService per camera, all sharing one gallery and
+detection logger, and a fixed number of worker threads that serve the doors round-robin.
+With --worker-process every camera's recogniser runs in its own process; the first one
+publishes the gallery as a memory-mapped GalleryStore and the others map the same file.
+Adding a door costs one camera, one serial link and one panel rather than a whole process,
+a second copy of the gallery, and a second copy of OpenCV and dlib.
+
+Key Features:
+- Per-door request queue; a door asking again while it is already queued or being served is
+  answered once, like Main.backend does for a single door.
+- Fair scheduling: workers take the next waiting door after the one served last, skipping
+  doors whose camera is busy, so a busy door cannot starve the others.
+- Per-door metrics (serial.<door>.write_queue_depth) plus shared supervisor.* metrics.
+- Optional evidence clips per camera (EvidenceBuffer.py), triggered by unauthorised faces and
+  by a door's "AlarmActive"; the memory limit is shared out across the cameras.
+
+Usage:
+    python Supervisor.py --door front=COM4@0 --door back=COM5@1
+    python Supervisor.py --door a=socket://127.0.0.1:7000@0 --door b=socket://127.0.0.1:7001@0
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from AsyncSerial import SerialLink, DEFAULT_BAUDRATE
+from Metrics import metrics, MetricsServer, StatsFileWriter
+from RecognitionService import RecognitionService
+
+
+@dataclass
+class DoorConfig:
+    """A door controller: its serial port and the camera that watches its entrance."""
+    name: str
+    port: str
+    camera_index: int = 0
+    baudrate: int = DEFAULT_BAUDRATE
+
+    @classmethod
+    def parse(cls, text: str) -> "DoorConfig":
+        """
+        Parse "NAME=PORT[@CAMERA]" (e.g. "front=COM4@0").
+
+        Raises:
+            ValueError: If the text is malformed
+        """
+        name, sep, rest = text.partition("=")
+        if not sep or not name or not rest:
+            raise ValueError(f"Expected NAME=PORT[@CAMERA], got {text!r}")
+        port, sep, camera = rest.rpartition("@")
+        if not sep:
+            return cls(name, rest)
+        return cls(name, port, int(camera))
+
+
+@dataclass
+class DoorState:
+    """What the supervisor knows about one door."""
+    name: str
+    state_code: Optional[str] = None
+    alarm_active: bool = False
+    requests: int = 0
+    decisions: Dict[str, int] = field(default_factory=dict)
+    last_message_at: Optional[float] = None
+
+
+@dataclass
+class _Request:
+    door: str
+    camera_index: int
+    callback: Callable[[Optional[str], Optional[Exception]], None]
+    enqueued_at: float
+
+
+class RecognitionPool:
+    """
+    Recognition services for several cameras sharing one gallery, served by a fixed set of workers.
+
+    Public Interface:
+    - start_in_background(): Builds the services (the first one loads the gallery)
+    - submit(door, camera_index, callback): Queues a request; callback(message, error) runs on a worker
+    - record_evidence(camera_index, reason): Saves an evidence clip from that camera (blocking)
+    - stop(): Stops the workers and releases the cameras
+    - stats(): Queue and service counters
+    """
+
+    def __init__(self, camera_indices: Sequence[int], workers: int = None, evidence_dir: str = None,
+                 evidence_memory_mb: float = None, **service_kwargs):
+        """
+        Initialise the pool without touching any camera.
+
+        Args:
+            camera_indices: Cameras to serve; the first one also loads the gallery
+            workers: Concurrent recognitions (default: one per camera, at most the CPU count)
+            evidence_dir: Save evidence clips under evidence_dir/camera<index> (None: no clips)
+            evidence_memory_mb: Frame memory for all cameras' evidence rings together
+                                (default: EvidenceBuffer.MEMORY_LIMIT_MB)
+            **service_kwargs: Forwarded to every RecognitionService (and on to FaceRecogniser)
+        """
+        self.camera_indices = list(dict.fromkeys(camera_indices))
+        self.workers = workers or max(1, min(len(self.camera_indices), os.cpu_count() or 1))
+        self.service_kwargs = service_kwargs
+        self.services: Dict[int, RecognitionService] = {}
+        self.evidence = {}
+        if evidence_dir:
+            from EvidenceBuffer import EvidenceBuffer
+            share = (evidence_memory_mb or EvidenceBuffer.MEMORY_LIMIT_MB) / len(self.camera_indices)
+            self.evidence = {camera_index: EvidenceBuffer(os.path.join(evidence_dir, f"camera{camera_index}"),
+                                                          memory_limit_mb=share)
+                             for camera_index in self.camera_indices}
+
+        self._doors: List[str] = []  # round-robin order, in order of first request
+        self._pending: Dict[str, _Request] = {}
+        self._active: Dict[str, _Request] = {}
+        self._busy_cameras = set()
+        self._last_served = -1
+        self._condition = threading.Condition()
+        self._ready = threading.Event()
+        self._stopping = False
+        self._threads: List[threading.Thread] = []
+        self.served = 0
+        metrics.gauge_callback("supervisor.pending_requests", lambda: len(self._pending))
+
+    # ========== PUBLIC METHODS ==========
+
+    def start_in_background(self) -> threading.Thread:
+        """Start the workers, then build and start every camera's service on a background thread."""
+        self._stopping = False
+        for evidence in self.evidence.values():
+            evidence.start()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"RecognitionPool-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._start_services, name="RecognitionPool-start", daemon=True)
+        thread.start()
+        return thread
+
+    def submit(self, door: str, camera_index: int,
+               callback: Callable[[Optional[str], Optional[Exception]], None]) -> bool:
+        """
+        Queue a recognition request for a door.
+
+        Args:
+            door: Door name
+            camera_index: Camera watching that door
+            callback: Called with (message, None) or (None, error) on a worker thread
+
+        Returns:
+            bool: False if the door already has a request queued or being served (this one is
+                  dropped, so the controller gets exactly one reply)
+        """
+        with self._condition:
+            if door in self._active or door in self._pending:
+                return False
+            if door not in self._doors:
+                self._doors.append(door)
+            self._pending[door] = _Request(door, camera_index, callback, time.monotonic())
+            metrics.inc("supervisor.requests")
+            self._condition.notify()
+        return True
+
+    def stop(self):
+        """Stop the workers and the services; queued requests are answered with None."""
+        with self._condition:
+            self._stopping = True
+            abandoned = list(self._pending.values())
+            self._pending.clear()
+            self._condition.notify_all()
+        for request in abandoned:
+            self._finish(request, None, None)
+        for service in self.services.values():
+            service.stop()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._threads = []
+        for evidence in self.evidence.values():
+            evidence.stop()
+
+    def record_evidence(self, camera_index: int, reason: str) -> bool:
+        """
+        Save an evidence clip from a camera; blocks for up to the clip's post-event window.
+
+        Returns:
+            bool: False if evidence is disabled or the camera's service is not running
+        """
+        service = self.services.get(camera_index)
+        if service is None:
+            return False
+        return service.record_evidence(reason)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"served": self.served, "pending": sorted(self._pending), "active": sorted(self._active),
+                    "services": {camera: service.state for camera, service in self.services.items()}}
+
+    # ========== PRIVATE METHODS ==========
+
+    def _start_services(self):
+        """Start the first camera's service (which loads the gallery), then the others sharing it."""
+        try:
+            for camera_index in self.camera_indices:
+                kwargs = dict(self.service_kwargs, camera_index=camera_index)
+                if camera_index in self.evidence:
+                    kwargs["evidence"] = self.evidence[camera_index]
+                if self.service_kwargs.get("out_of_process"):
+                    # Worker processes cannot share a gallery object: the first one publishes the
+                    # store and the others map it (and, with watch_gallery, follow its versions)
+                    kwargs["use_gallery_store"] = True
+                if self.services:
+                    primary = self.services[self.camera_indices[0]].recogniser
+                    if primary is None:
+                        break
+                    if self.service_kwargs.get("out_of_process"):
+                        kwargs["gallery_from_store"] = True
+                    else:
+                        kwargs.pop("watch_gallery", None)  # the primary's watcher updates the shared gallery
+                        kwargs["share_with"] = primary
+                service = RecognitionService(**kwargs)
+                self.services[camera_index] = service
+                try:
+                    service.start()
+                except Exception as e:
+                    service.startup_error = e
+                    print(f"Error: Recognition for camera {camera_index} failed to start: {e}")
+        finally:
+            self._ready.set()
+
+    def _next_request(self) -> Optional[_Request]:
+        """Pop the next waiting door after the one served last whose camera is free (call with the lock held)."""
+        count = len(self._doors)
+        for offset in range(1, count + 1):
+            position = (self._last_served + offset) % count
+            request = self._pending.get(self._doors[position])
+            if request is not None and request.camera_index not in self._busy_cameras:
+                self._last_served = position
+                del self._pending[request.door]
+                return request
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                request = self._next_request()
+                while request is None and not self._stopping:
+                    self._condition.wait()
+                    request = self._next_request()
+                if self._stopping:
+                    break
+                self._active[request.door] = request
+                self._busy_cameras.add(request.camera_index)
+            metrics.observe("supervisor.queue_wait", time.monotonic() - request.enqueued_at)
+
+            message, error = None, None
+            try:
+                self._ready.wait()
+                service = self.services.get(request.camera_index)
+                if service is None:
+                    raise RuntimeError(f"No recognition service for camera {request.camera_index}")
+                message = service.recognise()
+            except Exception as e:
+                error = e
+
+            with self._condition:
+                del self._active[request.door]
+                self._busy_cameras.discard(request.camera_index)
+                self.served += 1
+                self._condition.notify_all()
+            self._finish(request, message, error)
+        if request is not None:
+            self._finish(request, None, None)
+
+    @staticmethod
+    def _finish(request: _Request, message: Optional[str], error: Optional[Exception]):
+        try:
+            request.callback(message, error)
+        except Exception as e:
+            print(f"Error delivering recognition result for {request.door}: {e}")
+
+
+class Supervisor:
+    """
+    Serves several door controllers from one event loop.
+
+    Public Interface:
+    - run(): Connects every door's link and serves until close()
+    - close(): Closes every link
+    - stats(): Per-door state and pool counters
+
+    Usage:
+        supervisor = Supervisor(doors, pool, panels)
+        asyncio.run(supervisor.run())
+    """
+
+    def __init__(self, doors: Sequence[DoorConfig], pool: RecognitionPool, panels=None):
+        """
+        Args:
+            doors: Door configurations (names must be unique)
+            pool: Started RecognitionPool covering every door's camera
+            panels: Optional GUI.DoorPanels with one panel per door name
+        """
+        names = [door.name for door in doors]
+        if len(set(names)) != len(names):
+            raise ValueError("Door names must be unique")
+        self.doors = {door.name: door for door in doors}
+        self.pool = pool
+        self.panels = panels
+        self.states = {door.name: DoorState(door.name) for door in doors}
+        self.links = {door.name: SerialLink(door.port, door.baudrate, name=door.name) for door in doors}
+
+    # ========== PUBLIC METHODS ==========
+
+    async def run(self):
+        """Serve every door until close()."""
+        loop = asyncio.get_running_loop()
+        # Each link keeps a blocking read in the default executor; size it so links never queue behind each other
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=2 * len(self.links) + 4,
+                                                     thread_name_prefix="SerialIO"))
+        for name in self.doors:
+            self._register_handlers(name)
+        for link in self.links.values():
+            await link.send("SystemStart")
+        await asyncio.gather(*(link.run() for link in self.links.values()))
+
+    def close(self):
+        for link in self.links.values():
+            link.close()
+
+    def stats(self) -> dict:
+        return {"doors": {name: vars(state) for name, state in self.states.items()}, "pool": self.pool.stats()}
+
+    # ========== PRIVATE METHODS ==========
+
+    def _register_handlers(self, name: str):
+        from Main import is_StateCode
+
+        door = self.doors[name]
+        state = self.states[name]
+        link = self.links[name]
+        loop = asyncio.get_running_loop()
+
+        def seen():
+            state.last_message_at = time.monotonic()
+
+        async def on_facial_recognition(Recieved):
+            seen()
+            future = loop.create_future()
+
+            def deliver(message, error):
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result((message, error)))
+
+            if not self.pool.submit(name, door.camera_index, deliver):
+                print(f"[{name}] Recognition already in progress")
+                return
+            state.requests += 1
+            self._set_status(name, "recognising")
+            message, error = await future
+            if error is not None:
+                print(f"[{name}] Error: {error}")
+                message = "Error"
+            self._set_status(name, None)
+            if message is None:
+                message = "Timeout"  # interrupted; the controller still waits for an answer
+            state.decisions[message] = state.decisions.get(message, 0) + 1
+            await link.send(message)
+
+        def on_alarm(Recieved):
+            seen()
+            state.alarm_active = True
+            self._set_status(name, "ALARM", "red")
+            if self.panels is not None:
+                self.panels.schedule(self.panels.show_alarm_popup, name, abort)
+            if self.pool.evidence:
+                loop.run_in_executor(None, record_alarm_evidence)
+
+        def record_alarm_evidence():
+            try:
+                self.pool.record_evidence(door.camera_index, f"alarm-{name}")
+            except Exception as e:
+                print(f"[{name}] Error recording alarm evidence: {e}")
+
+        def abort(message):
+            state.alarm_active = False
+            self._set_status(name, None)
+            link.send_threadsafe(message)
+
+        def on_state_code(Recieved):
+            seen()
+            state.state_code = Recieved
+            if self.panels is not None:
+                self.panels.post_state(name, Recieved)
+
+        def on_other(Recieved):
+            seen()
+            print(f"[{name}] {Recieved}")
+
+        link.on("FacialRecognition", on_facial_recognition)
+        link.on("AlarmActive", on_alarm)
+        link.on_match(is_StateCode, on_state_code)
+        link.on_default(on_other)
+
+    def _set_status(self, name: str, text: Optional[str], bg: str = None):
+        if self.panels is not None:
+            self.panels.set_status(name, text, bg)
+
+
+def main(argv: List[str] = None) -> int:
+    import tkinter as tk
+    from GUI import DoorPanels
+
+    parser = argparse.ArgumentParser(description="Serve several door controllers from one process.")
+    parser.add_argument("--door", action="append", required=True, type=DoorConfig.parse,
+                        metavar="NAME=PORT[@CAMERA]", help="a door controller (repeat for each door)")
+    parser.add_argument("--workers", type=int, help="concurrent recognitions (default: one per camera)")
+    parser.add_argument("--columns", type=int, help="panels per row")
+    parser.add_argument("--metrics-port", type=int, help="serve metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--stats-file", help="append a metrics snapshot to this file every 10 s")
+    parser.add_argument("--show-video", action="store_true", help="open a camera window during recognition")
+    parser.add_argument("--watch-gallery", action="store_true",
+                        help="apply changes to images/authorised without restarting")
+    parser.add_argument("--decision-deadline", type=float,
+                        help="seconds before recognition answers Unauthorised/Timeout (default: 10)")
+    parser.add_argument("--worker-process", action="store_true",
+                        help="run each camera's recognition in its own supervised process")
+    parser.add_argument("--gallery-store", action="store_true",
+                        help="match from a memory-mapped gallery store (always on with --worker-process)")
+    parser.add_argument("--gallery-float16", action="store_true",
+                        help="store gallery encodings as float16 (half the size, slower exact matching)")
+    parser.add_argument("--evidence-dir", help="save JPEG clips around unauthorised faces and alarms here")
+    parser.add_argument("--evidence-memory", type=float,
+                        help="MB of recent frames kept for evidence clips, across all cameras (default: 64)")
+    args = parser.parse_args(argv)
+
+    exporters = []
+    if args.metrics_port is not None:
+        exporters.append(MetricsServer(metrics, port=args.metrics_port))
+    if args.stats_file:
+        exporters.append(StatsFileWriter(metrics, args.stats_file))
+    for exporter in exporters:
+        exporter.start()
+
+    pool = RecognitionPool([door.camera_index for door in args.door], workers=args.workers,
+                           headless=not args.show_video, watch_gallery=args.watch_gallery,
+                           decision_deadline=args.decision_deadline, evidence_dir=args.evidence_dir,
+                           evidence_memory_mb=args.evidence_memory, out_of_process=args.worker_process,
+                           use_gallery_store=args.gallery_store,
+                           gallery_store_dtype="float16" if args.gallery_float16 else "float32")
+    pool.start_in_background()
+
+    root = tk.Tk()
+    panels = DoorPanels(root, [door.name for door in args.door], args.columns)
+    supervisor = Supervisor(args.door, pool, panels)
+
+    def backend_loop():
+        result = {"auth": None}
+        event = threading.Event()
+
+        def set_auth_result(success):
+            result["auth"] = success
+            event.set()
+
+        panels.ask_password_popup("placeholder", set_auth_result)
+        event.wait()
+        if not result["auth"]:
+            root.quit()
+            return
+        asyncio.run(supervisor.run())
+
+    thread = threading.Thread(target=backend_loop, daemon=True)
+    thread.start()
+    root.mainloop()
+    supervisor.close()  # handed to the backend loop, which closes each port once its read returns
+    thread.join(timeout=2.0)
+    pool.stop()
+    for exporter in exporters:
+        exporter.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+File: test_DecisionEngine.py
+
+Description:
+Regression tests for DecisionEngine voting on results from FaceRecogniser.analyse_frame.
+Detection and encoding are replaced with stand-ins, so no camera or real faces are needed.
+"""
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("face_recognition")
+
+import FacialRecognition
+from DecisionEngine import AUTHORISED, DecisionEngine
+from FaceGallery import FaceGallery
+
+
+class StandIns:
+    """face_recognition detection and encoding stand-ins: one centred face, a fixed encoding."""
+
+    def __init__(self):
+        self.encoding = np.zeros(FaceGallery.ENCODING_SIZE)
+        self.encoded = []
+
+    def face_locations(self, image, number_of_times_to_upsample=1, model="hog"):
+        height, width = image.shape[:2]
+        return [(height // 4, 3 * width // 4, 3 * height // 4, width // 4)]
+
+    def face_encodings(self, image, known_face_locations=None, num_jitters=1, model="small"):
+        locations = self.face_locations(image) if known_face_locations is None else known_face_locations
+        if locations:
+            self.encoded.append(len(locations))
+        return [self.encoding.copy() for _ in locations]
+
+
+@pytest.fixture
+def stand_ins(monkeypatch):
+    stand_ins = StandIns()
+    monkeypatch.setattr(FacialRecognition.face_recognition, "face_locations", stand_ins.face_locations)
+    monkeypatch.setattr(FacialRecognition.face_recognition, "face_encodings", stand_ins.face_encodings)
+    return stand_ins
+
+
+@pytest.fixture
+def recogniser(tmp_path, stand_ins):
+    """Camera-less FaceRecogniser whose gallery holds one encoding for alice."""
+    authorised_dir = tmp_path / "authorised"
+    authorised_dir.mkdir()
+    cv2.imwrite(str(authorised_dir / "alice.jpg"), np.full((120, 120, 3), 128, dtype=np.uint8))
+    recogniser = FacialRecognition.FaceRecogniser(authorised_dir=str(authorised_dir), camera_index=None,
+                                                  log_file=str(tmp_path / "detections.csv"), headless=True,
+                                                  use_encoding_cache=False, enrollment_workers=1,
+                                                  adaptive_detection=False)
+    yield recogniser
+    recogniser.release_resources()
+
+
+def test_tracked_face_votes_once_while_moving(recogniser, stand_ins):
+    """A weak match carried by the tracker across moving frames must not authorise on its own."""
+    # Distance 0.55 from alice: a match, but well short of a strong one
+    stand_ins.encoding = np.full(FaceGallery.ENCODING_SIZE, 0.55 / np.sqrt(FaceGallery.ENCODING_SIZE))
+    stand_ins.encoded.clear()
+
+    engine = DecisionEngine(deadline=60.0)
+    engine.start()
+    results = []
+    for step in range(4):
+        # A bright block that moves every frame, so the motion gate never reports a static scene
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        frame[60:180, 40 + 60 * step:100 + 60 * step] = 255
+        result = recogniser.analyse_frame(frame)
+        results.append(result)
+        assert engine.add(result) is None
+
+    assert stand_ins.encoded == [1]
+    assert [result.names for result in results] == [["alice"]] * 4
+    assert [result.fresh for result in results] == [[True], [False], [False], [False]]
+    assert engine.decision is None
+
+
+def test_fresh_matches_still_authorise():
+    """Three independently encoded matches authorise as before."""
+    engine = DecisionEngine(deadline=60.0)
+    engine.start()
+    result = FacialRecognition.FrameResult(locations=[(0, 10, 10, 0)], names=["alice"], distances=[0.55],
+                                           fresh=[True])
+    decisions = [engine.add(result) for _ in range(3)]
+    assert decisions[:2] == [None, None]
+    assert decisions[2].outcome == AUTHORISED